@@ -102,7 +102,11 @@ def create_parser():
         'build', **sub_parse_common,
         help="Build command for domain definition")
     geom_bld.add_argument('-o', '--output', required=True)
-    geom_bld.add_argument('-f', '--output-format', default="shapefile")
+    geom_bld.add_argument(
+        '-f', '--output-format', default="shapefile",
+        choices=['shapefile', 'feather', 'parquet', 'jigsaw', 'vtk'],
+        help='Output file format, parquet is GeoParquet spatially'
+             ' row-grouped for reading by region')
     geom_bld.add_argument('--output-crs', default="EPSG:4326")
     geom_bld.add_argument('--mesh', help='Mesh to extract hull from')
     geom_bld.add_argument(
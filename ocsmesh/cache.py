@@ -0,0 +1,713 @@
+"""This module defines the persistent cache of collector results.
+
+The results of expensive collector calculations (e.g. the final
+size function of `HfunCollector` or the domain polygon of
+`GeomCollector`) are stored on disk, keyed by a fingerprint of all
+the inputs and the refinement specifications that produced them,
+so that running the same calculation again returns immediately.
+
+This module also defines the in-memory registry of contours
+extracted from rasters, which is shared by the contour based
+features, the size function and the geometry calculations of each
+process, so that each contour is extracted only once.
+
+Notes
+-----
+Fingerprints are based on the *content* of inputs, e.g. raster
+values, mesh arrays and shapes, and not on object identities, so
+they are stable across processes and program runs.
+"""
+
+import os
+import enum
+import json
+import pickle
+import hashlib
+import logging
+import pathlib
+import tempfile
+import threading
+import types
+from collections import OrderedDict
+from numbers import Integral, Real
+from typing import Any, Callable, Dict, Hashable, Optional, Union, Tuple
+
+import numpy as np
+import rasterio
+import shapely
+from pyproj import CRS
+from rasterio import windows
+from rasterio.errors import RasterioError
+from shapely.geometry import LineString, MultiLineString, Polygon, MultiPolygon
+from shapely.geometry.base import BaseGeometry
+
+from ocsmesh.raster import Raster, tmpdir
+from ocsmesh.mesh.base import BaseMesh
+
+
+_logger = logging.getLogger(__name__)
+
+# Input raster content digests, keyed by file path and modification info
+_raster_digests: Dict[Tuple[str, int, int], str] = {}
+# Directory of the digests of input rasters persisted across processes
+_raster_digest_dir = pathlib.Path(tmpdir) / 'raster_digests'
+
+
+class ResultCache:
+    """Bounded LRU cache of collector results on disk.
+
+    Results are pickled into `cache_dir`, one file per key. The
+    least recently used entries are removed whenever the total size
+    of the entries exceeds `max_bytes`.
+
+    Attributes
+    ----------
+    max_bytes
+    cache_dir
+    stats
+
+    Methods
+    -------
+    get(key)
+        Get the result stored for `key` or `None`.
+    put(key, value)
+        Store a result for `key`.
+    clear()
+        Remove all the cache entries and reset statistics.
+
+    Notes
+    -----
+    Keys are usually calculated by `fingerprint`. Entries created by
+    other processes or earlier runs are found and reused.
+    """
+
+    def __init__(
+            self,
+            cache_dir: Union[str, os.PathLike, None] = None,
+            max_bytes: int = 10 * 1024 ** 3,
+            ) -> None:
+        """Initialize the cache
+
+        Parameters
+        ----------
+        cache_dir : str or PathLike or None, default=None
+            Directory to store the cached results. If `None`, a
+            directory in the temporary directory of `ocsmesh`
+            is used.
+        max_bytes : int, default=10 GiB
+            Maximum total size of the cached files on disk.
+        """
+
+        self.max_bytes = max_bytes
+        if cache_dir is None:
+            cache_dir = pathlib.Path(tmpdir) / 'result_cache'
+        self._cache_dir = pathlib.Path(cache_dir)
+        self._entries = None
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: str) -> Any:
+        """Get the result stored for `key`.
+
+        Parameters
+        ----------
+        key : str
+            Cache key of the result.
+
+        Returns
+        -------
+        Any
+            The stored result or `None` if `key` is not cached.
+        """
+
+        path = self._get_path(key)
+        with self._lock:
+            entries = self._get_entries()
+            if not path.is_file():
+                entries.pop(key, None)
+                self._misses += 1
+                return None
+
+            try:
+                with open(path, 'rb') as fp:
+                    value = pickle.load(fp)
+            except (OSError, EOFError, pickle.UnpicklingError) as err:
+                _logger.warning(f'Removing unreadable cache entry: {err}')
+                self._remove(key)
+                self._misses += 1
+                return None
+
+            # Might be created by another process
+            entries[key] = path.stat().st_size
+            entries.move_to_end(key)
+            self._hits += 1
+
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a result for `key`.
+
+        Parameters
+        ----------
+        key : str
+            Cache key of the result.
+        value : Any
+            Picklable result to store.
+
+        Returns
+        -------
+        None
+        """
+
+        path = self._get_path(key)
+        with self._lock:
+            self._get_entries()
+
+        # pylint: disable=R1732
+        tmpfile = tempfile.NamedTemporaryFile(
+            dir=self._cache_dir, suffix='.tmp', delete=False)
+        with tmpfile:
+            pickle.dump(value, tmpfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfile.name, path)
+
+        with self._lock:
+            self._get_entries()[key] = path.stat().st_size
+            self._evict(keep=key)
+
+    def clear(self) -> None:
+        """Remove all the cache entries and reset statistics.
+
+        Parameters
+        ----------
+
+        Returns
+        -------
+        None
+        """
+
+        with self._lock:
+            for key in list(self._get_entries()):
+                self._remove(key)
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    def _get_path(self, key: str) -> pathlib.Path:
+        return self._cache_dir / f'{key}.pkl'
+
+    def _get_entries(self) -> 'OrderedDict[str, int]':
+        if self._entries is None:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            files = sorted(
+                self._cache_dir.glob('*.pkl'),
+                key=lambda path: path.stat().st_mtime)
+            self._entries = OrderedDict(
+                (path.stem, path.stat().st_size) for path in files)
+        return self._entries
+
+    def _evict(self, keep: str) -> None:
+        entries = self._get_entries()
+        while sum(entries.values()) > self.max_bytes and len(entries) > 1:
+            key = next(iter(entries))
+            if key == keep:
+                entries.move_to_end(key)
+                continue
+            self._remove(key)
+            self._evictions += 1
+
+    def _remove(self, key: str) -> None:
+        self._get_entries().pop(key, None)
+        try:
+            self._get_path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    @property
+    def cache_dir(self) -> pathlib.Path:
+        """Read-only attribute for the directory of cached files"""
+
+        return self._cache_dir
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Read-only attribute for the cache hit and miss statistics"""
+
+        with self._lock:
+            entries = self._get_entries()
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'entries': len(entries),
+                'nbytes': sum(entries.values()),
+                'max_bytes': self.max_bytes,
+            }
+
+
+class ContourRegistry:
+    """Per-process registry of contours extracted from rasters.
+
+    Contour lines, filled contours and narrow channels calculated
+    from raster data are kept in memory, keyed by the content of the
+    raster, the requested level or range and the plan of the windows
+    used for the extraction. Any raster object whose data is the
+    same, e.g. the rasters of a geometry and a size function created
+    from the same DEM, gets the already extracted contour.
+
+    Attributes
+    ----------
+    max_bytes
+    stats
+
+    Methods
+    -------
+    get_contour(raster, level, window=None)
+        Get contour lines of `raster` for the specified level.
+    get_multipolygon(raster, zmin=None, zmax=None, window=None,
+                     overlap=None, band=1)
+        Get filled contour of `raster` between the specified limits.
+    get_channels(raster, level=0, width=1000, tolerance=None)
+        Get narrow regions of `raster` domain below `level`.
+    clear()
+        Remove all the registered contours and reset statistics.
+
+    Notes
+    -----
+    The registry lives in the memory of each process. Child
+    processes created by forking inherit the contours extracted
+    by the parent before forking, so the memory of each worker
+    can hold up to `max_bytes` of contours as well.
+
+    The size of each contour is estimated from the number of its
+    coordinates, so the actual memory used by the registry is
+    larger than the sum of the sizes due to per-object overhead.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 ** 2) -> None:
+        """Initialize the registry
+
+        Parameters
+        ----------
+        max_bytes : int, default=256 MiB
+            Maximum estimated total size of the contours to keep.
+            The least recently used contours are removed first.
+        """
+
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._nbytes: Dict[Hashable, int] = {}
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+
+    def get_contour(
+            self,
+            raster: Raster,
+            level: float,
+            window: Optional[windows.Window] = None
+            ) -> Union[LineString, MultiLineString]:
+        """Get contour lines of `raster` for the specified level.
+
+        Parameters
+        ----------
+        raster : Raster
+            Raster to extract the contour lines from.
+        level : float
+            The level for which contour lines must be calculated.
+        window : windows.Window or None, default=None
+            The raster window for which contour lines must be
+            calculated.
+
+        Returns
+        -------
+        LineString or MultiLineString
+            The contour lines calculated for the specified level.
+
+        See Also
+        --------
+        Raster.get_contour :
+            Calculate contour lines for specified data level.
+        """
+
+        return self._get(
+            raster,
+            ('contour', float(level), self._window_plan(raster, window)),
+            lambda: raster.get_contour(level, window=window))
+
+    def get_multipolygon(
+            self,
+            raster: Raster,
+            zmin: Optional[float] = None,
+            zmax: Optional[float] = None,
+            window: Optional[windows.Window] = None,
+            overlap: Optional[int] = None,
+            band: int = 1,
+            ) -> MultiPolygon:
+        """Get filled contour of `raster` between the specified limits.
+
+        Parameters
+        ----------
+        raster : Raster
+            Raster to extract the filled contour from.
+        zmin : float or None, default=None
+            Lower bound of raster data for filled contour calculation.
+        zmax : float or None, default=None
+            Upper bound of raster data for filled contour calculation.
+        window : windows.Window or None, default=None
+            Window over whose data the multipolygon is calculated.
+        overlap : int or None, default=None
+            Overlap used for generating windows if `window` is not
+            provided.
+        band : int, default=1
+            Raster band over whose data multipolygon is calculated.
+
+        Returns
+        -------
+        MultiPolygon
+            The calculated multipolygon from raster data.
+
+        See Also
+        --------
+        Raster.get_multipolygon :
+            Calculate and return a multipolygon based on the raster
+            data.
+        """
+
+        z_range = tuple(None if z is None else float(z) for z in (zmin, zmax))
+        return self._get(
+            raster,
+            ('filled', z_range, band,
+             self._window_plan(raster, window, overlap)),
+            lambda: raster.get_multipolygon(
+                zmin=zmin, zmax=zmax, window=window, overlap=overlap,
+                band=band))
+
+    def get_channels(
+            self,
+            raster: Raster,
+            level: float = 0,
+            width: float = 1000,
+            tolerance: Optional[float] = None
+            ) -> Union[Polygon, MultiPolygon, None]:
+        """Get narrow regions of `raster` domain below `level`.
+
+        The domain multipolygon the channels are calculated from is
+        also taken from (and stored in) the registry.
+
+        Parameters
+        ----------
+        raster : Raster
+            Raster to extract the channels from.
+        level : float, default=0
+            Reference level to calculate domain polygon for narrow
+            region calculation.
+        width : float, default=1000
+            Cut-off used for designating narrow regions.
+        tolerance : float or None, default=None
+            Tolerance used for simplifying domain polygon.
+
+        Returns
+        -------
+        Polygon or MultiPolygon or None
+            The calculated narrow regions based on raster data.
+
+        See Also
+        --------
+        Raster.get_channels :
+            Calculate narrow width polygons based on specified input.
+        """
+
+        return self._get(
+            raster,
+            ('channels', float(level), float(width),
+             None if tolerance is None else float(tolerance),
+             raster.crs.to_wkt(), self._window_plan(raster, None)),
+            # pylint: disable=W0212
+            lambda: raster._get_channels_from_multipolygon(
+                self.get_multipolygon(raster, zmax=level),
+                width, tolerance))
+
+    def clear(self) -> None:
+        """Remove all the registered contours and reset statistics.
+
+        Parameters
+        ----------
+
+        Returns
+        -------
+        None
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._nbytes.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def _get(
+            self,
+            raster: Raster,
+            spec: Tuple,
+            calculate: Callable[[], Any]
+            ) -> Any:
+        try:
+            key = (
+                _get_raster_digest(raster.tmpfile),
+                _get_clip_digest(raster)) + spec
+        except (OSError, RasterioError) as err:
+            _logger.debug(f'Contour registry is bypassed: {err}')
+            return calculate()
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                _logger.debug(f'Reusing registered contour {spec[:2]}.')
+                return self._entries[key]
+            self._misses += 1
+
+        # Calculate outside the lock so that other threads can
+        # use the registry in the meantime
+        value = calculate()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._nbytes[key] = self._get_nbytes(value)
+            # The latest contour is kept even if larger than the limit
+            while (sum(self._nbytes.values()) > self.max_bytes
+                    and len(self._entries) > 1):
+                old_key, _ = self._entries.popitem(last=False)
+                del self._nbytes[old_key]
+
+        return value
+
+    @staticmethod
+    def _get_nbytes(value: Any) -> int:
+        if isinstance(value, BaseGeometry):
+            # Two 8-byte floats per coordinate
+            return int(shapely.get_num_coordinates(value)) * 16
+        return 0
+
+    @staticmethod
+    def _window_plan(
+            raster: Raster,
+            window: Optional[windows.Window],
+            overlap: Optional[int] = None
+            ) -> Tuple:
+        if window is not None:
+            return ('window', tuple(window.flatten()))
+        return ('chunks', raster.chunk_size,
+                raster.overlap if overlap is None else overlap)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Read-only attribute for the registry hit and miss statistics"""
+
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'entries': len(self._entries),
+                'nbytes': sum(self._nbytes.values()),
+                'max_bytes': self.max_bytes,
+            }
+
+
+contour_registry = ContourRegistry()
+
+
+def fingerprint(*objs: Any) -> str:
+    """Calculate a content based cache key for the input objects
+
+    Parameters
+    ----------
+    *objs : Any
+        Objects to fingerprint, e.g. rasters, meshes, shapes, feature
+        definitions, numbers, etc.
+
+    Returns
+    -------
+    str
+        Hexadecimal digest of the canonical representation of `objs`.
+
+    Raises
+    ------
+    TypeError
+        If the content of any of the objects cannot be fingerprinted.
+    """
+
+    canonical = json.dumps(_canonical(list(objs), set()), sort_keys=True)
+    return hashlib.md5(canonical.encode('utf-8')).hexdigest()
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+def _get_raster_digest(path: Union[str, os.PathLike]) -> str:
+    """Internal: digest of the content of raster file `path`
+
+    The digests of input rasters are memoized, and stored on disk,
+    keyed by the resolved path, size and modification time of the
+    file, so that each file is read in full only once across
+    processes. Working files in the temporary directory of `ocsmesh`
+    are read every time, since they are rewritten in place at the
+    same size, possibly within the resolution of the modification
+    time.
+    """
+
+    path = pathlib.Path(path).resolve()
+    if path.is_relative_to(pathlib.Path(tmpdir).resolve()):
+        return _read_raster_digest(path)
+
+    stat = path.stat()
+    memo_key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _raster_digests:
+        return _raster_digests[memo_key]
+
+    digest_path = _raster_digest_dir / _digest(
+        repr(memo_key).encode('utf-8'))
+    try:
+        _raster_digests[memo_key] = digest_path.read_text().strip()
+        return _raster_digests[memo_key]
+    except OSError:
+        pass
+
+    _raster_digests[memo_key] = _read_raster_digest(path)
+    try:
+        _raster_digest_dir.mkdir(parents=True, exist_ok=True)
+        # pylint: disable=R1732
+        tmpfile = tempfile.NamedTemporaryFile(
+            'w', dir=_raster_digest_dir, suffix='.tmp', delete=False)
+        with tmpfile:
+            tmpfile.write(_raster_digests[memo_key])
+        os.replace(tmpfile.name, digest_path)
+    except OSError as err:
+        _logger.warning(f'Raster digest of {path} not stored: {err}')
+
+    return _raster_digests[memo_key]
+
+
+def _read_raster_digest(path: pathlib.Path) -> str:
+    """Internal: read raster file `path` in full and digest its content"""
+
+    md5 = hashlib.md5()
+    with rasterio.open(path) as src:
+        md5.update(repr((
+            tuple(src.transform), src.shape, src.count, src.dtypes,
+            src.nodatavals, src.crs.to_wkt() if src.crs else None
+        )).encode('utf-8'))
+        for band in range(1, src.count + 1):
+            for _, window in src.block_windows(band):
+                md5.update(src.read(band, window=window).tobytes())
+    return md5.hexdigest()
+
+
+def _get_clip_digest(raster: Raster) -> Optional[str]:
+    """Internal: digest of the lazy clip of `raster` if any"""
+
+    clip_plan = raster._clip_plan
+    if clip_plan is None:
+        return None
+    return _digest(
+        repr(clip_plan.mask_values).encode('utf-8') + clip_plan.shape.wkb)
+
+
+def _canonical(obj: Any, seen: set) -> Any:
+    """Internal: JSON serializable and stable representation of `obj`"""
+
+    if obj is None or isinstance(obj, (bool, str)):
+        return obj
+    if isinstance(obj, enum.Enum):
+        return ['enum', type(obj).__qualname__, obj.name]
+    if isinstance(obj, np.generic):
+        return _canonical(obj.item(), seen)
+    if isinstance(obj, Integral):
+        return int(obj)
+    if isinstance(obj, Real):
+        value = float(obj)
+        return value if np.isfinite(value) else repr(value)
+    if isinstance(obj, bytes):
+        return ['bytes', _digest(obj)]
+    if isinstance(obj, np.ndarray):
+        return ['ndarray', str(obj.dtype), obj.shape,
+                _digest(np.ascontiguousarray(obj).tobytes())]
+    if isinstance(obj, BaseGeometry):
+        return ['geometry', _digest(obj.wkb)]
+    if isinstance(obj, CRS):
+        return ['crs', obj.to_wkt()]
+    if isinstance(obj, pathlib.PurePath):
+        path = pathlib.Path(obj)
+        if path.is_file():
+            stat = path.stat()
+            return ['path', str(path.resolve()), stat.st_size,
+                    stat.st_mtime_ns]
+        return ['path', str(path)]
+
+    if id(obj) in seen:
+        raise TypeError(
+            f"Cannot fingerprint recursive object of type {type(obj)}!")
+    seen = seen | {id(obj)}
+
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(item, seen) for item in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted(
+            (_canonical(item, seen) for item in obj),
+            key=lambda item: json.dumps(item, sort_keys=True))
+    if isinstance(obj, dict):
+        return ['dict', [
+            [_canonical(key, seen), _canonical(value, seen)]
+            for key, value in obj.items()]]
+    if isinstance(obj, Raster):
+        # Includes raster based size functions, whose values are
+        # stored the same way
+        if getattr(obj, '_refinement_queue', None):
+            raise TypeError(
+                "Cannot fingerprint size function with uncommitted"
+                " refinements!")
+        if getattr(obj, '_initial_values_file', None) == obj.tmpfile:
+            # Size function values are not set yet, so the values
+            # are identified by the input raster member
+            values = ['initial', float(np.finfo(np.float32).max)]
+        else:
+            values = _get_raster_digest(obj.tmpfile)
+        members = {
+            'values': values,
+            'chunk_size': obj.chunk_size,
+            'overlap': obj.overlap,
+        }
+        clip_digest = _get_clip_digest(obj)
+        if clip_digest is not None:
+            members['clip'] = clip_digest
+        for name in ['raster', 'hmin', 'hmax', 'constraints']:
+            if hasattr(obj, name) and getattr(obj, name) is not obj:
+                members[name] = _canonical(getattr(obj, name), seen)
+        return ['raster', type(obj).__qualname__, members]
+    if isinstance(obj, BaseMesh):
+        return ['mesh', type(obj).__qualname__, _canonical(obj.msh_t, seen)]
+    if isinstance(obj, types.CodeType):
+        return ['code', _digest(obj.co_code),
+                _canonical(obj.co_consts, seen),
+                _canonical(obj.co_names, seen)]
+    if isinstance(obj, types.FunctionType):
+        return ['function', obj.__module__, obj.__qualname__,
+                _canonical(obj.__code__, seen),
+                _canonical(obj.__defaults__, seen),
+                _canonical(
+                    [cell.cell_contents for cell in obj.__closure__ or []],
+                    seen)]
+    if callable(obj) and hasattr(obj, '__qualname__'):
+        # Builtins, ufuncs, classes, etc.
+        return ['callable', getattr(obj, '__module__', None),
+                obj.__qualname__]
+    if hasattr(obj, '__dict__'):
+        return ['object', type(obj).__module__, type(obj).__qualname__,
+                _canonical(
+                    {key: value for key, value in sorted(vars(obj).items())},
+                    seen)]
+
+    raise TypeError(f"Cannot fingerprint object of type {type(obj)}!")
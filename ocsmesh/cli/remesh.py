@@ -12,6 +12,7 @@ from shapely.geometry import Polygon, MultiPolygon
 
 from ocsmesh import Raster, Geom, Hfun, Mesh
 from ocsmesh import utils
+from ocsmesh.cache import ResultCache
 
 
 logging.basicConfig(
@@ -85,6 +86,10 @@ class RemeshByDEM:
         this_parser.add_argument('-f', '--output-format', default='2dm')
         this_parser.add_argument('-k', '--keep-intermediate', action='store_true')
         this_parser.add_argument('--nprocs', type=int, default=-1)
+        this_parser.add_argument(
+            '--cache-dir', type=Path,
+            help="Directory to persistently cache the calculated geometry"
+                 " and size function for reuse in later runs")
 
         this_parser.add_argument('dem', nargs='+', type=Path)
 
@@ -136,6 +141,9 @@ class RemeshByDEM:
         out_format = args.output_format
         write_intermediate = args.keep_intermediate
         nprocs = args.nprocs
+        cache = None
+        if args.cache_dir is not None:
+            cache = ResultCache(args.cache_dir)
 
         # Process inputs
         contour_defns = []
@@ -205,7 +213,8 @@ class RemeshByDEM:
                     geom_inputs,
                     base_mesh=geom_base_mesh,
                     zmax=zmax,
-                    nprocs=nprocs)
+                    nprocs=nprocs,
+                    cache=cache)
 
 
             # NOTE: Instead of passing base mesh to be used as boundary,
@@ -218,7 +227,8 @@ class RemeshByDEM:
                 [hfun_base_mesh, *hfun_rast_list],
                 hmin=hmin,
                 hmax=np.max(hfun_base_mesh.msh_t().value),
-                nprocs=nprocs)
+                nprocs=nprocs,
+                cache=cache)
 
             for level, expansion_rate, target_size in contour_defns:
                 if expansion_rate is None:
@@ -408,62 +408,35 @@ class SubsetAndCombine:
 
         # 5. Combine seam into the rest replacing the index for shared nodes
         #    with the ones from tree
-        mesh_types = {
-            'tria3': 'TRIA3_t',
-            'quad4': 'QUAD4_t',
-            'hexa8': 'HEXA8_t'
-        }
-
-        coord = []
-        elems = {k: [] for k in mesh_types}
-        value = []
-        offset = 0
-
-        for k in mesh_types:
-            elems[k].append(getattr(jig_old, k)['index'] + offset)
-        coord.append(jig_old.vert2['coord'])
-        value.append(jig_old.value)
-        offset += coord[-1].shape[0]
+        mesh_types = ['tria3', 'quad4', 'hexa8']
+
+        offset = len(jig_old.vert2)
 
         # Drop shared vertices and update element cnn based on map and dropped offset
         mesh_orig_idx = np.arange(len(jig_mesh.vert2))
         mesh_shrd_idx = np.unique(list(map_idx_shared.keys()))
         mesh_renum_idx = np.setdiff1d(mesh_orig_idx, mesh_shrd_idx)
-        map_to_combined_idx = {
-            index: i + offset for i, index in enumerate(mesh_renum_idx)}
-        map_to_combined_idx.update(map_idx_shared)
-
-        for k in mesh_types:
-            cnn = getattr(jig_mesh, k)['index']
-            # If it's empty executing list comprehension results in a
-            # (0,) shape instead of (0, 4)
-            if cnn.shape[0] == 0:
-                elems[k].append(cnn)
-                continue
-
-            elems[k].append(np.array([[map_to_combined_idx[x]
-                                      for x in  elm] for elm in cnn]))
-
-        coord.append(jig_mesh.vert2['coord'][mesh_renum_idx, :])
-        value.append(jig_mesh.value[mesh_renum_idx])
+        map_to_combined_idx = np.empty(
+            len(jig_mesh.vert2), dtype=jigsaw_msh_t.INDEX_t)
+        map_to_combined_idx[mesh_renum_idx] = (
+            np.arange(len(mesh_renum_idx)) + offset)
+        if map_idx_shared:
+            map_to_combined_idx[list(map_idx_shared.keys())] = list(
+                map_idx_shared.values())
+
+        elems = {
+            k: [getattr(jig_old, k)['index'],
+                map_to_combined_idx[getattr(jig_mesh, k)['index']]]
+            for k in mesh_types}
 
         # Putting it all together
-        composite_mesh = jigsaw_msh_t()
-        composite_mesh.mshID = 'euclidean-mesh'
-        composite_mesh.ndims = 2
-
-        composite_mesh.vert2 = np.array(
-                [(crd, 0) for crd in np.vstack(coord)],
-                dtype=jigsaw_msh_t.VERT2_t)
-        composite_mesh.value = np.array(
-                np.vstack(value),
-                dtype=jigsaw_msh_t.REALS_t)
-        for k, v in mesh_types.items():
-            setattr(composite_mesh, k, np.array(
-                [(cnn, 0) for cnn in np.vstack(elems[k])],
-                dtype=getattr(jigsaw_msh_t, v)))
-
-        composite_mesh.crs = crs
+        composite_mesh = utils.assemble_msh_t(
+            [jig_old.vert2['coord'],
+             jig_mesh.vert2['coord'][mesh_renum_idx, :]],
+            elems,
+            [jig_old.value, jig_mesh.value[mesh_renum_idx]],
+            local_index=False,
+            crs=crs)
 
         return composite_mesh, mesh_shrd_idx
 
@@ -1,3 +1,6 @@
+from ocsmesh.cache import contour_registry
+
+
 class Channel:
 
     def __init__(self, level=0, width=1000, tolerance=50, sources=None):
@@ -55,12 +58,12 @@ class Channel:
 
         src_class = type(source).__name__
         if src_class == "Raster":
-            channels = source.get_channels(
-                    self._level, self._width, self._tolerance)
+            channels = contour_registry.get_channels(
+                    source, self._level, self._width, self._tolerance)
             crs = source.crs
         elif src_class in ("RasterGeom", "HfunRaster"):
-            channels = source.raster.get_channels(
-                    self._level, self._width, self._tolerance)
+            channels = contour_registry.get_channels(
+                    source.raster, self._level, self._width, self._tolerance)
             crs = source.raster.crs
         else:
             raise TypeError("")
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from ocsmesh.cache import contour_registry
+
 class ContourBase(ABC):
 
     def __init__(self, sources=None):
@@ -56,10 +58,11 @@ class Contour(ContourBase):
     def _get_contour_from_source(self, source):
         src_class = type(source).__name__
         if src_class == "Raster":
-            contour = source.get_contour(self._level)
+            contour = contour_registry.get_contour(source, self._level)
             crs = source.crs
         elif src_class in ("RasterGeom", "HfunRaster"):
-            contour = source.raster.get_contour(self._level)
+            contour = contour_registry.get_contour(
+                source.raster, self._level)
             crs = source.raster.crs
         else:
             raise TypeError("")
@@ -102,10 +105,11 @@ class FilledContour(ContourBase):
 
         src_class = type(source).__name__
         if src_class == "Raster":
-            contour = source.get_multipolygon(**z_info)
+            contour = contour_registry.get_multipolygon(source, **z_info)
             crs = source.crs
         elif src_class in ("RasterGeom", "HfunRaster"):
-            contour = source.raster.get_multipolygon(**z_info)
+            contour = contour_registry.get_multipolygon(
+                source.raster, **z_info)
             crs = source.raster.crs
         else:
             raise TypeError("")
@@ -1,18 +1,29 @@
 """This module defines the base class for all geometry (domain) types
 """
 
+import logging
+import weakref
 from abc import ABC, abstractmethod
-from typing import Any, Union
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Union
 
+import numpy as np
+import shapely
 from jigsawpy import jigsaw_msh_t
 from pyproj import CRS, Transformer
-from shapely import ops
 from shapely.geometry import MultiPolygon
 
 from ocsmesh.crs import CRS as CRSDescriptor
 from ocsmesh import utils
 
 
+_logger = logging.getLogger(__name__)
+
+# Memoized multipolygons of each geometry object. Kept out of the
+# object so that it doesn't affect pickling and fingerprinting
+_multipolygon_memos: 'weakref.WeakKeyDictionary[BaseGeom, OrderedDict]' = (
+    weakref.WeakKeyDictionary())
+
 class BaseGeom(ABC):
     """Abstract base class used to construct OCSMesh "geom" objects.
 
@@ -29,19 +40,26 @@ class BaseGeom(ABC):
 
     Methods
     -------
-    msh_t(**kwargs)
+    msh_t(hfun=None, simplify_fraction=0.25, nprocs=1, **kwargs)
         Returns the `jigsawpy` vertex-edge representation of the geometry
     get_multipolygon(**kwargs)
         Returns `shapely` object representation of the geometry
+    clear_cache()
+        Remove the memoized multipolygons of the geometry
 
     Notes
     -----
     A "geom" object represents the domain of meshing (i.e.
     simulation). This domain can be represented either as a `shapely`
     `MultiPolygon` object, or as a `jigsawpy` `jigsaw_msh_t` object.
+
+    Geometry types whose polygon calculation is expensive memoize
+    up to `max_cached` of the latest calculated multipolygons, keyed
+    by the content of their source and the arguments.
     """
 
     _crs = CRSDescriptor()
+    max_cached = 8
 
     def __init__(self, crs: Union[CRS, str, int]) -> None:
         self._crs = crs
@@ -56,7 +74,46 @@ class BaseGeom(ABC):
 
         return self.get_multipolygon()
 
-    def msh_t(self, **kwargs: Any) -> jigsaw_msh_t:
+    def clear_cache(self) -> None:
+        """Remove the memoized multipolygons of the geometry
+
+        Returns
+        -------
+        None
+        """
+
+        _multipolygon_memos.pop(self, None)
+
+    def _get_memoized(
+            self,
+            key: Optional[Hashable],
+            calculate: Callable[[], MultiPolygon]
+            ) -> MultiPolygon:
+        """Get memoized multipolygon for `key` or calculate it"""
+
+        if key is None or self.max_cached < 1:
+            return calculate()
+
+        memo = _multipolygon_memos.setdefault(self, OrderedDict())
+        if key in memo:
+            memo.move_to_end(key)
+            _logger.debug('Using memoized geometry multipolygon')
+            return memo[key]
+
+        value = calculate()
+        memo[key] = value
+        while len(memo) > self.max_cached:
+            memo.popitem(last=False)
+
+        return value
+
+    def msh_t(
+            self,
+            hfun: Optional[Any] = None,
+            simplify_fraction: float = 0.25,
+            nprocs: int = 1,
+            **kwargs: Any
+            ) -> jigsaw_msh_t:
         """Returns the `jigsawpy` representation of the geometry.
 
         This method calculates the vertex-edge representation of
@@ -66,6 +123,15 @@ class BaseGeom(ABC):
 
         Parameters
         ----------
+        hfun : BaseHfun or jigsaw_msh_t or None, default=None
+            Size function used for simplifying the boundaries before
+            creating the representation. If `None` the boundaries are
+            not simplified.
+        simplify_fraction : float, default=0.25
+            Fraction of the local size used as the simplification
+            tolerance, see `utils.simplify_by_size`.
+        nprocs : int, default=1
+            Number of threads to use for simplification.
         **kwargs : dict, optional
             Keyword arguments passed to `get_multipolygon` method
 
@@ -81,11 +147,21 @@ class BaseGeom(ABC):
         distances (i.e. not degrees) since mesh size is specified
         in length units and the domain and size function are the
         passed to the mesh engine for cartesian meshing.
+
+        Domain polygons extracted from DEMs have a vertex on each
+        cell edge, which can be much denser than the mesh size. If
+        `hfun` is given, the boundaries are simplified in the
+        projected CRS with a tolerance of `simplify_fraction` of the
+        local mesh size, and the reduction of the vertex count is
+        logged.
         """
 
         return multipolygon_to_jigsaw_msh_t(
             self.get_multipolygon(**kwargs),
-            self.crs
+            self.crs,
+            hfun=hfun,
+            simplify_fraction=simplify_fraction,
+            nprocs=nprocs
         )
 
     @abstractmethod
@@ -111,7 +187,10 @@ class BaseGeom(ABC):
 
 def multipolygon_to_jigsaw_msh_t(
         multipolygon: MultiPolygon,
-        crs: CRS
+        crs: CRS,
+        hfun: Optional[Any] = None,
+        simplify_fraction: float = 0.25,
+        nprocs: int = 1
     ) -> jigsaw_msh_t:
     """Calculate vertex-edge representation of multipolygon
 
@@ -126,6 +205,13 @@ def multipolygon_to_jigsaw_msh_t(
         be calculated
     crs : CRS
         CRS of the input polygon
+    hfun : BaseHfun or jigsaw_msh_t or None, default=None
+        Size function for simplifying the projected multipolygon
+        boundaries. If `None` the boundaries are not simplified.
+    simplify_fraction : float, default=0.25
+        Fraction of the local size used as simplification tolerance.
+    nprocs : int, default=1
+        Number of threads to use for simplification.
 
     Returns
     -------
@@ -141,10 +227,27 @@ def multipolygon_to_jigsaw_msh_t(
             multipolygon.bounds, crs)
     if utm_crs is not None:
         transformer = Transformer.from_crs(crs, utm_crs, always_xy=True)
-        multipolygon = ops.transform(transformer.transform, multipolygon)
+        # All the coordinates are transformed at once
+        multipolygon = shapely.transform(
+            multipolygon,
+            lambda xy: np.column_stack(
+                transformer.transform(xy[:, 0], xy[:, 1])))
+
+    out_crs = crs if utm_crs is None else utm_crs
+    if hfun is not None:
+        if not isinstance(hfun, jigsaw_msh_t):
+            hfun = hfun.msh_t()
+        multipolygon, stats = utils.simplify_by_size(
+            multipolygon, hfun, simplify_fraction, out_crs, nprocs)
+        n_before = stats['vertices_before']
+        n_after = stats['vertices_after']
+        _logger.info(
+            f"Simplified domain boundaries from {n_before} to"
+            f" {n_after} vertices"
+            f" ({100 * (1 - n_after / max(n_before, 1)):.1f}% reduction,"
+            f" {stats['polygons_fallback']} polygons simplified"
+            " as a whole)")
 
     msht = utils.shape_to_msh_t(multipolygon)
-    msht.crs = crs
-    if utm_crs is not None:
-        msht.crs = utm_crs
+    msht.crs = out_crs
     return msht
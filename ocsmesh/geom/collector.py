@@ -19,13 +19,14 @@ from pathlib import Path
 from multiprocessing import cpu_count
 from typing import Union, Tuple, Optional, Iterable, List, Any
 
-import pandas as pd
 import geopandas as gpd
+from jigsawpy import jigsaw_msh_t
 from pyproj import CRS, Transformer
 from shapely.geometry import MultiPolygon, Polygon
 from shapely import ops
-from shapely.validation import explain_validity
 
+from ocsmesh import utils
+from ocsmesh.cache import ResultCache, fingerprint
 from ocsmesh.mesh import Mesh
 from ocsmesh.mesh.base import BaseMesh
 from ocsmesh.raster import Raster
@@ -34,7 +35,7 @@ from ocsmesh.geom.raster import RasterGeom
 from ocsmesh.geom.mesh import MeshGeom
 from ocsmesh.features.contour import FilledContour, Contour
 from ocsmesh.features.patch import Patch
-from ocsmesh.ops import combine_geometry
+from ocsmesh.ops import combine_geometry, combine_patches
 
 CanCreateSingleGeom = Union[Raster, BaseMesh, Polygon, MultiPolygon]
 CanCreateMultipleGeom = Iterable[Union[CanCreateSingleGeom, str]]
@@ -76,7 +77,7 @@ class GeomCollector(BaseGeom):
 
     Methods
     -------
-    msh_t(**kwargs)
+    msh_t(hfun=None, simplify_fraction=0.25, nprocs=None, **kwargs)
         Returns the `jigsawpy` vertex-edge representation of the geometry
     get_multipolygon(**kwargs)
         Returns `shapely` object representation of the geometry
@@ -96,7 +97,8 @@ class GeomCollector(BaseGeom):
             overlap: Optional[int] = None,
             verbosity: int = 0,
             base_shape: Optional[Union[Polygon, MultiPolygon]] = None,
-            base_shape_crs: Union[str, CRS] = 'EPSG:4326'
+            base_shape_crs: Union[str, CRS] = 'EPSG:4326',
+            cache: Optional[ResultCache] = None
             ) -> None:
         """Initialize geometry collector object
 
@@ -137,6 +139,9 @@ class GeomCollector(BaseGeom):
             code.
         base_shape_crs: str or CRS, default='EPSG:4326'
             CRS of the input `base_shape`.
+        cache: ResultCache or None, default=None
+            Persistent cache for the final and non-raster input
+            polygons. If `None` the results are not cached.
         """
 
         # TODO: Like hfun collector and ops, later move the geom
@@ -164,6 +169,7 @@ class GeomCollector(BaseGeom):
         self._chunk_size = chunk_size
         self._overlap = overlap
         self._geom_list = []
+        self._cache = cache
 
         self._base_shape = base_shape
         self._base_shape_crs = CRS.from_user_input(base_shape_crs)
@@ -225,7 +231,7 @@ class GeomCollector(BaseGeom):
                             clip_shape = ops.transform(
                                     transformer.transform, clip_shape)
                         try:
-                            in_item.clip(clip_shape)
+                            raster.clip(clip_shape)
                         except ValueError as err:
                             # This raster does not intersect shape
                             _logger.debug(err)
@@ -276,8 +282,13 @@ class GeomCollector(BaseGeom):
         shapes are merged.
 
         Calculation for each DEM and feature is stored on disk as
-        feather files.  In the last steps are all these feather files
-        are combined using the out of core calculation by `GeoPandas`.
+        feather files.  In the last step all these feather files
+        are read one by one and their polygons are combined by union
+        over spatial partitions in parallel.
+
+        If a persistent `cache` is provided, the result is looked up
+        using a fingerprint of the inputs and all the specified
+        patches before calculation.
         """
 
         # For now we don't need to do any calculations here, the
@@ -285,7 +296,22 @@ class GeomCollector(BaseGeom):
         # in ops needs to move here (like hfun collector)
 
         # Since raster geoms are stateless, the polygons should be
-        # calculated everytime
+        # calculated everytime, unless they're persistently cached
+        cache_key = self._get_cache_key(
+            'result',
+            self._geom_list,
+            self._elev_info,
+            self._base_shape,
+            self._base_shape_crs,
+            self._base_mesh,
+            self._contour_patch_info_coll,
+            self._chunk_size,
+            self._overlap)
+        if cache_key is not None:
+            mp = self._cache.get(cache_key)
+            if mp is not None:
+                _logger.info('Using cached collector multipolygon')
+                return mp
 
         epsg4326 = CRS.from_user_input("EPSG:4326")
         mp = None
@@ -316,13 +342,12 @@ class GeomCollector(BaseGeom):
             feather_files.extend(self._extract_features(
                 temp_path, base_multipoly))
 
-            gdf = gpd.GeoDataFrame(columns=['geometry'], crs=epsg4326)
-            for f in feather_files:
-                gdf = pd.concat(
-                    [gdf, gpd.read_feather(f).to_crs(gdf.crs)]
-                )
-
-            mp = gdf.unary_union
+            # Feather files are read one by one and their polygons
+            # are unioned in spatial partitions
+            mp = utils.partitioned_unary_union(
+                (gpd.read_feather(f).to_crs(epsg4326).geometry
+                 for f in feather_files),
+                nprocs=self._nprocs)
             if isinstance(mp, Polygon):
                 mp = MultiPolygon([mp])
 
@@ -331,8 +356,54 @@ class GeomCollector(BaseGeom):
                     "Union of all shapes resulted in invalid geometry"
                     + " type")
 
+        if cache_key is not None:
+            self._cache.put(cache_key, mp)
+
         return mp
 
+    def msh_t(
+            self,
+            hfun: Optional[Any] = None,
+            simplify_fraction: float = 0.25,
+            nprocs: Optional[int] = None,
+            **kwargs: Any
+            ) -> jigsaw_msh_t:
+        """Returns the `jigsawpy` representation of the geometry
+
+        Parameters
+        ----------
+        hfun : BaseHfun or jigsaw_msh_t or None, default=None
+            Size function used for simplifying the boundaries of the
+            merged polygons. If `None` the boundaries are not
+            simplified.
+        simplify_fraction : float, default=0.25
+            Fraction of the local size used as the simplification
+            tolerance.
+        nprocs : int or None, default=None
+            Number of threads to use for simplification. If `None`
+            the number of processors of the collector is used.
+        **kwargs : dict, optional
+            Keyword arguments passed to `get_multipolygon` method
+
+        Returns
+        -------
+        jigsaw_msh_t
+            Calculated vertex-edge representation of the geometry
+
+        See Also
+        --------
+        BaseGeom.msh_t :
+        """
+
+        if nprocs is None:
+            nprocs = self._nprocs
+
+        return super().msh_t(
+            hfun=hfun,
+            simplify_fraction=simplify_fraction,
+            nprocs=nprocs,
+            **kwargs)
+
     def add_patch(
             self,
             shape: Optional[Union[MultiPolygon, Polygon]] = None,
@@ -526,6 +597,30 @@ class GeomCollector(BaseGeom):
             i for i in self._geom_list if not isinstance(i, raster_types)]
         return non_rasters
 
+    def _get_cache_key(self, *objs: Any) -> Optional[str]:
+        """Get the persistent cache key of the input objects
+
+        Parameters
+        ----------
+        *objs : Any
+            Objects whose content identifies a cached result.
+
+        Returns
+        -------
+        str or None
+            The cache key or `None` if no cache is used or the
+            objects cannot be fingerprinted.
+        """
+
+        if self._cache is None:
+            return None
+
+        try:
+            return fingerprint(*objs)
+        except TypeError as err:
+            _logger.warning(f'Collector results are not cached: {err}')
+            return None
+
     def _get_valid_multipolygon(
             self,
             polygon: Union[Polygon, MultiPolygon]
@@ -533,7 +628,8 @@ class GeomCollector(BaseGeom):
         """Get a valid multipolygon from the input `polygon`
 
         Validates and if applicable creates a multipolygon from the
-        input argument `polygon`
+        input argument `polygon`. Only the invalid member polygons
+        are repaired, in parallel, see `utils.repair_multipolygon`.
 
         Parameters
         ----------
@@ -547,18 +643,10 @@ class GeomCollector(BaseGeom):
             A validated `shapely` `MultiPolygon` entity
         """
 
-        # TODO: Performance bottleneck for valid checks
-        if not polygon.is_valid:
-            polygon = ops.unary_union(polygon)
-
-            if not polygon.is_valid:
-                polygon = polygon.buffer(0)
-
-            if not polygon.is_valid:
-                raise ValueError(explain_validity(polygon))
-
-        if isinstance(polygon, Polygon):
-            polygon = MultiPolygon([polygon])
+        polygon, n_fixed = utils.repair_multipolygon(
+            polygon, nprocs=self._nprocs)
+        if n_fixed:
+            _logger.info(f'Repaired {n_fixed} invalid polygons')
 
         return polygon
 
@@ -630,8 +718,15 @@ class GeomCollector(BaseGeom):
             geom_path = out_path / f'nonraster_{os.getpid()}_{e}.feather'
 
             crs = geom.crs
-            multipoly = self._get_valid_multipolygon(
-                    geom.get_multipolygon())
+            cache_key = self._get_cache_key('nonraster', geom)
+            multipoly = None
+            if cache_key is not None:
+                multipoly = self._cache.get(cache_key)
+            if multipoly is None:
+                multipoly = self._get_valid_multipolygon(
+                        geom.get_multipolygon())
+                if cache_key is not None:
+                    self._cache.put(cache_key, multipoly)
             gdf_non_raster = gpd.GeoDataFrame(
                     {'geometry': multipoly.geoms}, crs=crs)
             if crs != CRS.from_user_input("EPSG:4326"):
@@ -705,7 +800,7 @@ class GeomCollector(BaseGeom):
         zmin = self._elev_info['zmin']
         zmax = self._elev_info['zmax']
 
-        feather_files = []
+        patches = []
         for e, (ctr_defn, ptch_defn) in enumerate(self._contour_patch_info_coll):
 
             patch_zmin, patch_zmax = ctr_defn.level
@@ -722,7 +817,6 @@ class GeomCollector(BaseGeom):
 
             # Pass patch shape instead of base mesh
             # See explanation in add_patch
-            _logger.info("Extracting patch contours")
             combine_poly = base_multipoly
             if ptch_defn:
                 patch_mp, crs = ptch_defn.get_multipolygon()
@@ -731,15 +825,24 @@ class GeomCollector(BaseGeom):
                 if crs != CRS.from_user_input("EPSG:4326"):
                     gdf_patch = gdf_patch.to_crs("EPSG:4326")
                 combine_poly = MultiPolygon(list(gdf_patch.geometry))
-            geom_path = out_path / f'patch_{os.getpid()}_{e}.feather'
-            combine_geometry(
-                patch_raster_files, geom_path, "feather",
-                None, combine_poly, True,
-                patch_zmin, patch_zmax,
-                self._chunk_size, self._overlap,
-                self._nprocs)
-
-            if geom_path.is_file():
-                feather_files.append(geom_path)
+            patches.append({
+                'dem_files': patch_raster_files,
+                'out_file': out_path / f'patch_{os.getpid()}_{e}.feather',
+                'multipolygon': combine_poly,
+                'zmin': patch_zmin,
+                'zmax': patch_zmax,
+            })
+
+        # All the patches are extracted together so that each raster
+        # is read once for all the patch levels
+        _logger.info("Extracting patch contours")
+        combine_patches(
+            patches, "feather",
+            self._chunk_size, self._overlap,
+            self._nprocs)
+
+        feather_files = [
+            patch['out_file'] for patch in patches
+            if patch['out_file'].is_file()]
 
         return feather_files
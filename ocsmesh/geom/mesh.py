@@ -2,6 +2,7 @@
 """
 
 import os
+import logging
 from typing import Union
 
 # from jigsawpy import jigsaw_msh_t  # type: ignore[import]
@@ -13,6 +14,10 @@ from shapely.geometry import MultiPolygon
 from ocsmesh.geom.base import BaseGeom
 from ocsmesh.mesh.mesh import Mesh
 from ocsmesh.mesh.base import BaseMesh
+from ocsmesh.cache import fingerprint
+
+
+_logger = logging.getLogger(__name__)
 
 
 class MeshDescriptor:
@@ -53,6 +58,8 @@ class MeshGeom(BaseGeom):
         Returns `shapely` object representation of the geometry
     msh_t(**kwargs)
         Returns the `jigsawpy` vertex-edge representation of the geometry
+    clear_cache()
+        Remove the memoized multipolygons of the geometry
 
     Notes
     -----
@@ -93,11 +100,22 @@ class MeshGeom(BaseGeom):
         -------
         MultiPolygon
             Calculated polygon from mesh based on the element boundaries
+
+        Notes
+        -----
+        The result is memoized by the fingerprint of the mesh arrays,
+        so that it's recalculated only if the mesh is modified.
         """
 
         # TODO: What if there's no tria, e.g. Mesh object is
         # created from geom.msh_t() return value
-        return self.mesh.hull.multipolygon()
+        try:
+            key = fingerprint(self.mesh)
+        except TypeError as err:
+            _logger.debug(f'Multipolygon memoization is bypassed: {err}')
+            key = None
+
+        return self._get_memoized(key, self.mesh.hull.multipolygon)
 
     @property
     def mesh(self):
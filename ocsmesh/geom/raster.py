@@ -2,17 +2,22 @@
 """
 
 import os
+import logging
 from typing import Union, Optional
 
 import matplotlib.pyplot as plt
 from matplotlib.axes import Axes
 from shapely.geometry import MultiPolygon
 from pyproj import CRS
+from rasterio.errors import RasterioError
 
 from ocsmesh.geom.base import BaseGeom
 from ocsmesh.raster import Raster
+from ocsmesh.cache import contour_registry, fingerprint
 
 
+_logger = logging.getLogger(__name__)
+
 class SourceRaster:
     """Descriptor class used for referencing the source `Raster` object."""
 
@@ -50,6 +55,8 @@ class RasterGeom(BaseGeom):
         Returns the `jigsawpy` vertex-edge representation of the geometry
     get_multipolygon(zmin=None, zmax=None)
         Returns `shapely` object representation of the geometry
+    clear_cache()
+        Remove the memoized multipolygons of the geometry
 
     Notes
     -----
@@ -107,15 +114,37 @@ class RasterGeom(BaseGeom):
         MultiPolygon
             Calculated polygon from raster data based on the minimum
             and maximum elevations of interest.
+
+        Notes
+        -----
+        The result is memoized by the fingerprint of the raster
+        content and chunking and the elevation limits, so that it's
+        recalculated only if the raster is modified, e.g. clipped.
         """
 
         zmin = self._zmin if zmin is None else zmin
         zmax = self._zmax if zmax is None else zmax
 
+        try:
+            key = fingerprint(self.raster, zmin, zmax)
+        except (OSError, RasterioError) as err:
+            _logger.debug(f'Multipolygon memoization is bypassed: {err}')
+            key = None
+
+        return self._get_memoized(
+            key, lambda: self._calculate_multipolygon(zmin, zmax))
+
+    def _calculate_multipolygon(
+            self,
+            zmin: Optional[float],
+            zmax: Optional[float]
+            ) -> MultiPolygon:
+
         if zmin is None and zmax is None:
             return MultiPolygon([self.raster.get_bbox()])
 
-        return self.raster.get_multipolygon(zmin=zmin, zmax=zmax)
+        return contour_registry.get_multipolygon(
+            self.raster, zmin=zmin, zmax=zmax)
 
 
     @property
@@ -1,11 +1,13 @@
 """This module defines `shapely` object based geometry
 """
 
-from typing import Union, Any
+from pathlib import Path
+from typing import Union, Any, Optional, Tuple
 
 from pyproj import CRS
 from shapely.geometry import Polygon, MultiPolygon
 
+from ocsmesh import utils
 from ocsmesh.geom.base import BaseGeom
 
 
@@ -112,6 +114,45 @@ class MultiPolygonGeom(ShapelyGeom):
 
         return self._multipolygon
 
+    @staticmethod
+    def open(
+            path: Union[str, Path],
+            bbox: Optional[Tuple[float, float, float, float]] = None,
+            crs: Union[CRS, str, None] = None
+            ) -> 'MultiPolygonGeom':
+        """Read geometry from a GeoParquet file on disk
+
+        Parameters
+        ----------
+        path : path-like
+            Path to the GeoParquet file, e.g. written by `geom build`
+            with parquet output format.
+        bbox : tuple of float or None, default=None
+            The (xmin, ymin, xmax, ymax) region to read in the CRS of
+            the file. If `None` all the polygons are read.
+        crs : CRS or str or None, default=None
+            CRS of the geometry in the path. Overwrites any info read
+            from file, no transformation is done.
+
+        Returns
+        -------
+        MultiPolygonGeom
+            Geometry of the polygons whose bounds intersect `bbox`.
+
+        Notes
+        -----
+        Only the row groups of the file that may have polygons in
+        `bbox` are read, see `utils.read_polygons_parquet`.
+        """
+
+        gdf = utils.read_polygons_parquet(path, bbox=bbox)
+        if crs is None:
+            crs = gdf.crs
+        polygons = [
+            poly for geom in gdf.geometry
+            for poly in getattr(geom, 'geoms', [geom])]
+        return MultiPolygonGeom(MultiPolygon(polygons), crs)
+
     @property
     def multipolygon(self):
         """Read-only attribute referencing the underlying `MultiPolygon`"""
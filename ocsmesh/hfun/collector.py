@@ -18,10 +18,13 @@ import warnings
 import tempfile
 from pathlib import Path
 from time import time
-from multiprocessing import Pool, cpu_count
+from contextlib import nullcontext
+from multiprocessing import (
+    Pool, cpu_count, get_context, get_all_start_methods)
 from copy import copy, deepcopy
 from typing import (
-    Union, Sequence, List, Tuple, Iterable, Any, Optional, Callable)
+    Union, Sequence, List, Tuple, Iterable, Any, Optional, Callable, Dict,
+    Set, ContextManager)
 try:
     from typing import Literal
 except ImportError:
@@ -31,6 +34,7 @@ import numpy as np
 import numpy.typing as npt
 import geopandas as gpd
 from pyproj import CRS, Transformer
+from pyproj.exceptions import ProjError
 from shapely.geometry import (
     MultiLineString,
     LineString,
@@ -40,23 +44,28 @@ from shapely.geometry import (
     box
 )
 from shapely import ops
+from shapely.strtree import STRtree
 from jigsawpy import jigsaw_msh_t
-from rasterio.transform import from_origin
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.transform import array_bounds, from_origin
 from rasterio.warp import reproject, Resampling
 import rasterio
 
 from ocsmesh import utils
+from ocsmesh.cache import ResultCache, fingerprint
+from ocsmesh.profiling import StageProfiler, get_usage, get_usage_since
 from ocsmesh.hfun.base import BaseHfun
 from ocsmesh.hfun.raster import HfunRaster
 from ocsmesh.hfun.mesh import HfunMesh
 from ocsmesh.mesh.mesh import Mesh, EuclideanMesh2D
 from ocsmesh.mesh.base import BaseMesh
-from ocsmesh.raster import Raster, get_iter_windows
+from ocsmesh.raster import Raster
 from ocsmesh.features.contour import Contour
 from ocsmesh.features.patch import Patch
 from ocsmesh.features.linefeature import LineFeature
 from ocsmesh.features.channel import Channel
 from ocsmesh.features.constraint import (
+    Constraint,
     TopoConstConstraint,
     TopoFuncConstraint,
     CourantNumConstraint,
@@ -77,6 +86,132 @@ RASTER_CONSTR = (
 
 _logger = logging.getLogger(__name__)
 
+# Size functions of the collector that is evaluating them in a pool,
+# and the constraints to apply on them, set in forked workers only
+# (see `_init_hfun_worker`)
+_worker_hfun_list: SizeFuncList = []
+_worker_apply_list: List[Tuple[int, List[Constraint], bool]] = []
+
+
+def _init_hfun_worker(
+        hfun_list: SizeFuncList,
+        apply_list: Optional[
+            List[Tuple[int, List[Constraint], bool]]] = None
+        ) -> None:
+    """Internal: store the size functions in a forked pool worker
+
+    Size function objects cannot be pickled, so they are handed to
+    the workers of a *fork* pool on creation and then referred to
+    by their index in the list.
+    """
+
+    global _worker_hfun_list  # pylint: disable=W0603
+    global _worker_apply_list  # pylint: disable=W0603
+    _worker_hfun_list = hfun_list
+    _worker_apply_list = [] if apply_list is None else apply_list
+
+
+def _msh_t_worker(
+        index: int
+        ) -> Tuple[Set[Tuple[int, ...]], dict, Dict[str, dict]]:
+    """Internal: calculate the window meshes of size function at `index`
+
+    The queued refinements are committed first. Only the windows
+    updated by the commit and the meshes of the windows modified
+    since they were last calculated are returned, the latter as the
+    paths they are stored at on disk, so that the parent process can
+    update its state and combine all the windows. The resource usage
+    of the commit and meshing stages in the worker is returned as
+    well.
+    """
+
+    # pylint: disable=W0212
+    hfun = _worker_hfun_list[index]
+    usage = {}
+    start = get_usage()
+    # Pool workers cannot create their own pool
+    updated = hfun.commit(nprocs=1)
+    usage['commit'] = get_usage_since(start)
+    start = get_usage()
+    stale_windows = hfun._get_stale_windows()
+    hfun._get_window_meshes(stale_windows)
+    usage['msh_t'] = get_usage_since(start)
+    return updated, {
+        win.flatten(): hfun._window_msh_t[win.flatten()]
+        for win in stale_windows}, usage
+
+
+def _apply_constraints_worker(apply_index: int) -> Set[Tuple[int, ...]]:
+    """Internal: apply constraints at `apply_index` in a forked worker
+
+    The constraints are handed to the workers on creation of the pool
+    since they might not be picklable. The windows updated in the
+    shared size function file are returned to be replayed in the
+    parent process.
+    """
+
+    index, constraint_list, refined_only = _worker_apply_list[apply_index]
+    # Pool workers cannot create their own pool
+    return _worker_hfun_list[index].apply_constraints(
+        constraint_list, refined_only=refined_only, nprocs=1)
+
+
+def _create_tile_worker(
+        tile_info: Tuple[
+            str, dict, List[Tuple[str, Optional[MultiPolygon]]]],
+        num_threads: int = 1
+        ) -> None:
+    """Internal: create a tile raster of the 'fast' method
+
+    The inputs are reprojected in order, so that the last one has the
+    highest priority where they overlap. For places where DEM is not
+    provided it's assumed deep ocean for contouring purposes. The
+    GeoTIFF driver fills the tile with nodata if it's never written.
+    Inputs that are clipped lazily only contribute their values
+    inside the clip shape.
+    """
+
+    out_path, rast_profile, src_infos = tile_info
+    with rasterio.open(
+            out_path, 'w', **rast_profile, nodata=-99999) as dst:
+        if src_infos:
+            values = np.full(
+                (rast_profile['height'], rast_profile['width']),
+                -99999, dtype=np.float32)
+            for path, clip_shape in src_infos:
+                with rasterio.open(path) as src:
+                    source = rasterio.band(src, 1)
+                    src_kwargs = {}
+                    if clip_shape is not None:
+                        window = geometry_window(src, clip_shape.geoms)
+                        source = src.read(1, window=window).astype(
+                            np.float32)
+                        transform = src.window_transform(window)
+                        source[src.read_masks(1, window=window) == 0] = np.nan
+                        source[geometry_mask(
+                            clip_shape.geoms, out_shape=source.shape,
+                            transform=transform)] = np.nan
+                        src_kwargs = {
+                            'src_transform': transform,
+                            'src_crs': src.crs,
+                            'src_nodata': np.nan,
+                        }
+                    reproject(
+                        source=source,
+                        destination=values,
+                        dst_transform=rast_profile['transform'],
+                        dst_crs=rast_profile['crs'],
+                        resampling=Resampling.nearest,
+                        init_dest_nodata=False, # To avoid overwrite
+                        num_threads=num_threads,
+                        **src_kwargs)
+            dst.write(values, 1)
+
+    # -99999 is deep ocean, not missing data
+    with rasterio.open(out_path, 'r+') as dst:
+        dst.nodata = None
+
+
 class _RefinementContourInfoCollector:
     """Collection for contour refinement specification
 
@@ -149,7 +284,8 @@ class _RefinementContourCollector:
     def calculate(
             self,
             source_list: Iterable[HfunRaster],
-            out_path: Union[Path, str]
+            out_path: Union[Path, str],
+            contours_info: Optional[Iterable[Tuple[Contour, dict]]] = None
             ) -> None:
         """Extract specified contours and store on disk in `out_path`.
 
@@ -160,18 +296,24 @@ class _RefinementContourCollector:
             must be calculated.
         out_path : path-like
             Path for storing calculated contours and their crs data.
+        contours_info : iterable of tuple or None, default=None
+            Contour specifications to extract. If `None` all the
+            specifications in the collection are used.
 
         Returns
         -------
         None
         """
 
+        if contours_info is None:
+            contours_info = self._contours_info
+
         out_dir = Path(out_path)
         out_dir.mkdir(exist_ok=True, parents=True)
         file_counter = 0
         pid = os.getpid()
         self._container.clear()
-        for contour_defn, size_info in self._contours_info:
+        for contour_defn, size_info in contours_info:
             if not contour_defn.has_source:
                 # Copy so that in case of a 2nd run the no-source
                 # contour still gets all current sources
@@ -438,7 +580,8 @@ class _ChannelRefineCollector:
     def calculate(
             self,
             source_list,
-            out_path
+            out_path,
+            channels_info=None
             ) -> None:
         """Extract specified channels and store on disk in `out_path`.
 
@@ -449,18 +592,24 @@ class _ChannelRefineCollector:
             must be calculated.
         out_path : path-like
             Path for storing calculated channels and their crs data.
+        channels_info : iterable of tuple or None, default=None
+            Channel specifications to extract. If `None` all the
+            specifications in the collection are used.
 
         Returns
         -------
         None
         """
 
+        if channels_info is None:
+            channels_info = self._channels_info
+
         out_dir = Path(out_path)
         out_dir.mkdir(exist_ok=True, parents=True)
         file_counter = 0
         pid = os.getpid()
         self._container.clear()
-        for channel_defn, size_info in self._channels_info:
+        for channel_defn, size_info in channels_info:
             if not channel_defn.has_source:
                 # Copy so that in case of a 2nd run the no-source
                 # channel still gets all current sources
@@ -543,7 +692,58 @@ class _ConstraintInfoCollector:
             yield defn
 
 
-    def apply(self, hfun_list, per_hfun=True):
+    def apply(self, hfun_list, per_hfun=True, full_idx=None):
+        """Apply the constraints to the size functions
+
+        Parameters
+        ----------
+        hfun_list : SizeFuncList
+            Size functions to apply the constraints on.
+        per_hfun : bool, default=True
+            Whether to apply the constraints only on the size
+            functions with the specified source indices.
+        full_idx : container of int or None, default=None
+            Indices of the size functions to apply the constraints on
+            in full. On the rest of the raster size functions the
+            constraints are only applied on the windows affected by
+            queued refinements. If `None` all are applied in full.
+
+        Returns
+        -------
+        None
+        """
+
+        for in_idx, constraint_list, refined_only in self.get_apply_list(
+                hfun_list, per_hfun, full_idx):
+            hfun = hfun_list[in_idx]
+            if refined_only:
+                hfun.apply_constraints(constraint_list, refined_only=True)
+            else:
+                hfun.apply_constraints(constraint_list)
+
+    def get_apply_list(self, hfun_list, per_hfun=True, full_idx=None):
+        """Get the constraints to apply to each size function
+
+        Parameters
+        ----------
+        hfun_list : SizeFuncList
+            Size functions to apply the constraints on.
+        per_hfun : bool, default=True
+            Whether to apply the constraints only on the size
+            functions with the specified source indices.
+        full_idx : container of int or None, default=None
+            Indices of the size functions to apply the constraints on
+            in full. If `None` all are applied in full.
+
+        Returns
+        -------
+        list of tuple
+            Index of the size function, list of constraints to apply
+            and whether to apply them only on the refined windows, for
+            all the size functions with any constraint to apply.
+        """
+
+        apply_list = []
         for in_idx, hfun in enumerate(hfun_list):
             is_raster = isinstance(hfun, HfunRaster)
             constraint_list = []
@@ -556,8 +756,211 @@ class _ConstraintInfoCollector:
 
                 constraint_list.append(constraint_defn)
 
-            if constraint_list:
-                hfun.apply_constraints(constraint_list)
+            if not constraint_list:
+                continue
+
+            refined_only = (
+                is_raster and full_idx is not None and in_idx not in full_idx)
+            apply_list.append((in_idx, constraint_list, refined_only))
+
+        return apply_list
+
+
+class _InputIndex:
+    """Spatial index of collector inputs for dispatching refinements
+
+    Indexes the footprint of the input size functions in
+    ``EPSG:4326`` so that each refinement shape is only applied to
+    the inputs whose size can be affected by it, i.e. the inputs
+    within the distance at which the expanded refinement size
+    reaches the input `hmax`. The shape is also clipped to this
+    neighborhood of each input footprint before being applied.
+
+    Applying any refinement to a raster input also applies its
+    global `hmin` and `hmax` to the whole raster, so that step is
+    still done for raster inputs all refinements are pruned for.
+    """
+
+    # Conservative (minimum) length of a degree of latitude in meters
+    _LAT_DEG_LENGTH = 110574.
+    # Length of a degree of longitude on equator in meters
+    _LON_DEG_LENGTH = 111320.
+    # Relative margin for projection distortion of distances
+    _MARGIN = 1.1
+
+    def __init__(self, hfun_list: SizeFuncList) -> None:
+        self._hfun_list = list(hfun_list)
+        epsg4326 = CRS.from_epsg(4326)
+        self._footprints = []
+        for hfun in self._hfun_list:
+            if isinstance(hfun, HfunMesh):
+                bounds = hfun.mesh.get_bbox().bounds
+            else:
+                # Full extent of the pixels, not just their centers
+                left, bottom, right, top = hfun.src.bounds
+                bounds = (
+                    min(left, right), min(bottom, top),
+                    max(left, right), max(bottom, top))
+            if not hfun.crs.equals(epsg4326):
+                bounds = Transformer.from_crs(
+                    hfun.crs, epsg4326, always_xy=True
+                ).transform_bounds(*bounds, densify_pts=21)
+            self._footprints.append(bounds)
+        self._tree = STRtree([box(*bounds) for bounds in self._footprints])
+        self._refined = set()
+        self.n_pairs = 0
+        self.n_pruned = 0
+
+    def dispatch(
+            self,
+            shape: Union[MultiLineString, LineString, MultiPolygon, Polygon],
+            crs: CRS,
+            expansion_rate: Optional[float],
+            target_size: Optional[float],
+            ) -> List[Tuple[Union[HfunRaster, HfunMesh], Any]]:
+        """Find the inputs that refinement `shape` can affect
+
+        Parameters
+        ----------
+        shape : LineString or MultiLineString or Polygon or MultiPolygon
+            Shape of the refinement.
+        crs : CRS
+            CRS of the input `shape`.
+        expansion_rate : float or None
+            Expansion rate of the refinement, `None` if refinement
+            doesn't expand outside the shape.
+        target_size : float or None
+            Target size of the refinement, `None` for input `hmin`.
+
+        Returns
+        -------
+        list of tuple
+            Affected inputs and the `shape` clipped to the input
+            neighborhood, still in `crs`.
+        """
+
+        epsg4326 = CRS.from_epsg(4326)
+        to_4326 = None
+        shape_bounds = shape.bounds
+        if not crs.equals(epsg4326):
+            to_4326 = Transformer.from_crs(crs, epsg4326, always_xy=True)
+            shape_bounds = to_4326.transform_bounds(
+                *shape_bounds, densify_pts=21)
+
+        distances = [
+            self._get_influence_distance(hfun, expansion_rate, target_size)
+            for hfun in self._hfun_list]
+        candidates = self._tree.query(box(*self._expand_bounds(
+            shape_bounds, max(distances, default=0))))
+
+        targets = []
+        for idx in sorted(candidates):
+            hfun = self._hfun_list[idx]
+            bounds = self._expand_bounds(
+                self._footprints[idx], distances[idx])
+            if not box(*bounds).intersects(box(*shape_bounds)):
+                continue
+            clipped = self._clip(shape, bounds, to_4326)
+            if clipped is None:
+                continue
+            targets.append((hfun, clipped))
+            self._refined.add(idx)
+
+        self.n_pairs += len(self._hfun_list)
+        self.n_pruned += len(self._hfun_list) - len(targets)
+        return targets
+
+    def finalize(self, label: str) -> None:
+        """Finish dispatching and log pruned (refinement, input) pairs
+
+        Parameters
+        ----------
+        label : str
+            Refinement type label used for logging.
+
+        Returns
+        -------
+        None
+        """
+
+        _logger.info(
+            f'Pruned {self.n_pruned} of {self.n_pairs}'
+            f' ({label}, input) pairs that don\'t interact.')
+
+        if self.n_pairs == 0:
+            return
+        for idx, hfun in enumerate(self._hfun_list):
+            if idx not in self._refined and isinstance(hfun, HfunRaster):
+                hfun.apply_added_constraints()
+
+    @staticmethod
+    def _get_influence_distance(
+            hfun: Union[HfunRaster, HfunMesh],
+            expansion_rate: Optional[float],
+            target_size: Optional[float]
+            ) -> float:
+        if expansion_rate is None:
+            return 0.
+        target_size = hfun.hmin if target_size is None else target_size
+        if hfun.hmax is None or target_size is None or target_size <= 0:
+            return np.inf
+        return max(
+            (hfun.hmax - target_size) / (expansion_rate * target_size), 0.)
+
+    def _expand_bounds(
+            self,
+            bounds: Tuple[float, float, float, float],
+            distance: float
+            ) -> Tuple[float, float, float, float]:
+        if not np.isfinite(distance):
+            return (-180., -90., 180., 90.)
+        distance = distance * self._MARGIN
+        xmin, ymin, xmax, ymax = bounds
+        dlat = distance / self._LAT_DEG_LENGTH
+        ymin = max(ymin - dlat, -90.)
+        ymax = min(ymax + dlat, 90.)
+        coslat = np.cos(np.radians(max(abs(ymin), abs(ymax))))
+        if coslat * self._LON_DEG_LENGTH <= distance / 180.:
+            return (-180., ymin, 180., ymax)
+        dlon = distance / (self._LON_DEG_LENGTH * coslat)
+        return (xmin - dlon, ymin, xmax + dlon, ymax)
+
+    @staticmethod
+    def _clip(shape, bounds, to_4326: Optional[Transformer]):
+        if bounds == (-180., -90., 180., 90.):
+            return shape
+        if to_4326 is not None:
+            try:
+                bounds = to_4326.transform_bounds(
+                    *bounds, densify_pts=21, direction='INVERSE')
+            except ProjError:
+                return shape
+            if not np.all(np.isfinite(bounds)):
+                return shape
+
+        clip_box = box(*bounds)
+        if clip_box.contains(box(*shape.bounds)):
+            return shape
+        clipped = shape.intersection(clip_box)
+
+        if isinstance(shape, (Polygon, MultiPolygon)):
+            parts = [
+                geom for geom in getattr(clipped, 'geoms', [clipped])
+                if isinstance(geom, (Polygon, MultiPolygon))]
+            polys = [
+                poly for geom in parts
+                for poly in getattr(geom, 'geoms', [geom])
+                if not poly.is_empty]
+            return MultiPolygon(polys) if polys else None
+
+        parts = [
+            geom for geom in getattr(clipped, 'geoms', [clipped])
+            if isinstance(geom, (LineString, MultiLineString))]
+        lines = [
+            line for geom in parts
+            for line in getattr(geom, 'geoms', [geom])
+            if not line.is_empty]
+        return MultiLineString(lines) if lines else None
 
 
 class HfunCollector(BaseHfun):
@@ -636,8 +1039,10 @@ class HfunCollector(BaseHfun):
     and can be very expensive when many rasters-features are involved.
     The **fast** approach is less exact and can use more memory, but
     it is much faster. The approach it takes is to still extract
-    the raster features individually but then apply it to a lower
-    resolution large raster that covers all the input rasters.
+    the raster features individually but then apply it to
+    multi-resolution tiles that cover all the input rasters. Each
+    tile uses the finest resolution of the input rasters that overlap
+    it, capped by `hmin`; the tiles are refined and meshed in parallel.
     """
 
     def __init__(
@@ -651,7 +1056,9 @@ class HfunCollector(BaseHfun):
             method: Literal['exact', 'fast'] = 'exact',
             base_as_hfun: bool = True,
             base_shape: Optional[Union[Polygon, MultiPolygon]] = None,
-            base_shape_crs: Union[str, CRS] = 'EPSG:4326'
+            base_shape_crs: Union[str, CRS] = 'EPSG:4326',
+            cache: Optional[ResultCache] = None,
+            profiler: Optional[StageProfiler] = None
             ) -> None:
         """Initialize a collector size function object
 
@@ -667,6 +1074,12 @@ class HfunCollector(BaseHfun):
         base_as_hfun : bool, default=True
         base_shape: Polygon or MultiPolygon or None, default=None
         base_shape_crs: str or CRS, default='EPSG:4326'
+        cache: ResultCache or None, default=None
+            Persistent cache for the per-input and final size
+            functions. If `None` the results are not cached.
+        profiler: StageProfiler or None, default=None
+            Recorder of the time and memory usage of the stages of
+            `msh_t` calculation. If `None` nothing is recorded.
         """
 
         # NOTE: Input Hfuns and their Rasters can get modified
@@ -676,10 +1089,20 @@ class HfunCollector(BaseHfun):
         nprocs = cpu_count() if nprocs == -1 else nprocs
 
         self._applied = False
+        self._applied_info = None
+        self._pending_info = None
+        self._big_hfun_list = []
+        self._big_box_list = []
+        self._big_hfun_inputs = None
+        self._big_hfun_dir = None
         self._size_info = {'hmin': hmin, 'hmax': hmax}
         self._nprocs = nprocs
         self._hfun_list = []
         self._method = method
+        self._cache = cache
+        self._cache_keys = None
+        self._input_fingerprints = None
+        self._profiler = profiler
 
         self._base_shape = base_shape
         self._base_shape_crs = CRS.from_user_input(base_shape_crs)
@@ -731,7 +1154,7 @@ class HfunCollector(BaseHfun):
                         clip_shape = ops.transform(
                                 transformer.transform, clip_shape)
                     try:
-                        in_item.clip(clip_shape)
+                        in_item.clip(clip_shape, lazy=True)
                     except ValueError as err:
                         # This raster does not intersect shape
                         _logger.debug(err)
@@ -739,13 +1162,15 @@ class HfunCollector(BaseHfun):
 
                 elif self._base_mesh:
                     try:
-                        in_item.clip(self._base_mesh.mesh.get_bbox(crs=in_item.crs))
+                        in_item.clip(
+                            self._base_mesh.mesh.get_bbox(crs=in_item.crs),
+                            lazy=True)
                     except ValueError as err:
                         # This raster does not intersect shape
                         _logger.debug(err)
                         continue
 
-                hfun = HfunRaster(in_item, **self._size_info)
+                hfun = HfunRaster(in_item, **self._size_info, deferred=True)
 
             elif isinstance(in_item, EuclideanMesh2D):
                 hfun = HfunMesh(in_item)
@@ -762,7 +1187,7 @@ class HfunCollector(BaseHfun):
                             clip_shape = ops.transform(
                                     transformer.transform, clip_shape)
                         try:
-                            in_item.clip(clip_shape)
+                            raster.clip(clip_shape, lazy=True)
                         except ValueError as err:
                             # This raster does not intersect shape
                             _logger.debug(err)
@@ -770,13 +1195,15 @@ class HfunCollector(BaseHfun):
 
                     elif self._base_mesh:
                         try:
-                            raster.clip(self._base_mesh.mesh.get_bbox(crs=raster.crs))
+                            raster.clip(
+                                self._base_mesh.mesh.get_bbox(crs=raster.crs),
+                                lazy=True)
                         except ValueError as err:
                             # This raster does not intersect shape
                             _logger.debug(err)
                             continue
 
-                    hfun = HfunRaster(raster, **self._size_info)
+                    hfun = HfunRaster(raster, **self._size_info, deferred=True)
 
                 elif in_item.endswith(
                         ('.14', '.grd', '.gr3', '.msh', '.2dm')):
@@ -812,31 +1239,72 @@ class HfunCollector(BaseHfun):
         -----
         The actual application of refinements and constrains for this
         collector size function happens after calling this method.
-        This calculation is cached in case of 'exact' algorithm and
-        not cached for 'fast' algorithm.
+        The calculation is incremental: when called again, only the
+        refinements and constraints added since the last call are
+        applied, and only the raster windows whose sizes change as a
+        result are meshed again. The rest of the size function is
+        reused from the previous call. If an already applied
+        specification is modified, everything is applied again.
+
+        If a persistent `cache` is provided, the final size function
+        and, for the 'exact' algorithm, the size function of each
+        input are looked up using a fingerprint of the inputs and all
+        the specified refinements and constraints before calculation.
+
+        If a `profiler` is provided, the time and memory usage of
+        each stage of the calculation, e.g. each type of refinement,
+        the commit, meshing and clipping of each input and the
+        assembly of the composite, is recorded in it.
         """
 
-        composite_hfun = jigsaw_msh_t()
-
-        if self._method == 'exact':
-            self._apply_features()
-
-            with tempfile.TemporaryDirectory() as temp_dir:
-                hfun_path_list = self._write_hfun_to_disk(temp_dir)
-                composite_hfun = self._get_hfun_composite(hfun_path_list)
-
+        with self._stage('msh_t', method=self._method):
+            with self._stage('cache_keys'):
+                cache_keys = self._get_cache_keys()
+            if cache_keys is not None:
+                composite_hfun = self._cache.get(cache_keys['result'])
+                if composite_hfun is not None:
+                    _logger.info('Using cached collector size function')
+                    return composite_hfun
+
+            composite_hfun = jigsaw_msh_t()
+
+            if self._method == 'exact':
+                cached_msh_t = {}
+                if cache_keys is not None:
+                    for hfun in self._get_exact_inputs():
+                        hfun_msh_t = self._cache.get(cache_keys[id(hfun)])
+                        if hfun_msh_t is not None:
+                            cached_msh_t[id(hfun)] = hfun_msh_t
+
+                if len(cached_msh_t) < len(self._get_exact_inputs()):
+                    with self._stage('apply_features'):
+                        self._apply_features()
+
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    with self._stage('write_hfun'):
+                        hfun_path_list = self._write_hfun_to_disk(
+                            temp_dir, cached_msh_t, cache_keys)
+                    with self._stage('composite'):
+                        composite_hfun = self._get_hfun_composite(
+                            hfun_path_list)
+
+
+            elif self._method == 'fast':
+
+                with self._stage('apply_features'):
+                    tile_hfun_list = self._apply_features_fast()
+                with self._stage('composite'):
+                    composite_hfun = self._get_hfun_composite_fast(
+                        tile_hfun_list, self._big_box_list)
 
-        elif self._method == 'fast':
-
-            with tempfile.TemporaryDirectory() as temp_dir:
-                rast = self._create_big_raster(temp_dir)
-                hfun = self._apply_features_fast(rast)
-                composite_hfun = self._get_hfun_composite_fast(hfun)
+            else:
+                raise ValueError(
+                    f"Invalid method specified: {self._method}")
 
-        else:
-            raise ValueError(f"Invalid method specified: {self._method}")
+            if cache_keys is not None:
+                self._cache.put(cache_keys['result'], composite_hfun)
 
-        return composite_hfun
+            return composite_hfun
 
 
     def add_topo_bound_constraint(
@@ -1054,6 +1522,9 @@ class HfunCollector(BaseHfun):
         -------
         None
         """
+
+        self._applied = False
+
         self._constraint_info_coll.add(
             source_index,
             RegionConstraint(
@@ -1464,17 +1935,162 @@ class HfunCollector(BaseHfun):
         """
 
         if not self._applied:
-            self._apply_contours()
-            self._apply_flow_limiters()
-            self._apply_const_val()
-            self._apply_linefeatures()
-            self._apply_patch()
-            self._apply_channels()
-            self._apply_constraints()
+            self._pending_info = self._get_pending_info()
+            if self._pending_info is None and self._applied_info is not None:
+                # Inputs are refined by modified specifications too
+                self._input_fingerprints = None
+            try:
+                for name, apply in (
+                        ('contour', self._apply_contours),
+                        ('flow_limiter', self._apply_flow_limiters),
+                        ('const_val', self._apply_const_val),
+                        ('line', self._apply_linefeatures),
+                        ('patch', self._apply_patch),
+                        ('channel', self._apply_channels),
+                        ('constraint', self._apply_constraints)):
+                    with self._stage(name):
+                        apply()
+            finally:
+                self._pending_info = None
+            self._applied_info = self._get_spec_snapshot()
 
         self._applied = True
 
 
+    def _get_spec_collections(self) -> Dict[str, Iterable]:
+        """Internal: get all refinement and constraint collections
+
+        Returns
+        -------
+        dict
+            Collections of specifications keyed by their label.
+        """
+
+        return {
+            'contour': self._contour_info_coll,
+            'flow_limiter': self._flow_lim_coll,
+            'const_val': self._const_val_contour_coll,
+            'line': self._refine_line_info_coll,
+            'patch': self._refine_patch_info_coll,
+            'channel': self._ch_info_coll,
+            'constraint': self._constraint_info_coll,
+        }
+
+
+    def _get_spec_snapshot(self) -> Dict[str, list]:
+        """Internal: get the current specifications of all collections
+
+        Returns
+        -------
+        dict
+            List of specifications keyed by the collection label.
+        """
+
+        return {
+            name: list(info_coll)
+            for name, info_coll in self._get_spec_collections().items()}
+
+
+    def _get_pending_info(
+            self,
+            quiet: bool = False
+            ) -> Optional[Dict[str, list]]:
+        """Internal: get the specifications added since last application
+
+        Refinements are applied as the minimum of the current and
+        refinement sizes, and constraints are re-applied on all
+        refined regions, so applying only the newly added
+        specifications gives the same result as applying all of them.
+
+        Parameters
+        ----------
+        quiet : bool, default=False
+            Whether to skip logging what needs to be applied.
+
+        Returns
+        -------
+        dict or None
+            List of new specifications keyed by the collection label,
+            or `None` if all the specifications need to be applied,
+            e.g. when nothing is applied yet or any of the applied
+            specifications are modified since.
+        """
+
+        if self._applied_info is None:
+            return None
+
+        pending = {}
+        for name, specs in self._get_spec_snapshot().items():
+            applied = self._applied_info[name]
+            if len(specs) < len(applied) or not all(
+                    all(i is j for i, j in zip(old, new))
+                    for old, new in zip(applied, specs)):
+                if not quiet:
+                    _logger.info(
+                        f'Applied {name} specifications are modified,'
+                        f' applying all specifications.')
+                return None
+            pending[name] = specs[len(applied):]
+
+        if not quiet:
+            _logger.info(
+                f'Applying {sum(len(i) for i in pending.values())} new'
+                f' refinement and constraint specifications.')
+        return pending
+
+
+    def _iter_specs(self, name: str) -> Iterable:
+        """Internal: get the specifications of a collection to apply
+
+        Parameters
+        ----------
+        name : str
+            Label of the collection, see `_get_spec_collections`.
+
+        Returns
+        -------
+        iterable
+            Specifications that are not applied yet, or all of them
+            if everything needs to be applied.
+        """
+
+        if self._pending_info is None:
+            return list(self._get_spec_collections()[name])
+        return self._pending_info[name]
+
+
+    def _get_full_constraint_idx(
+            self,
+            per_hfun: bool = True
+            ) -> Optional[Set[int]]:
+        """Internal: get the inputs to apply all the constraints on
+
+        Parameters
+        ----------
+        per_hfun : bool, default=True
+            Whether the constraints are applied based on their
+            source indices.
+
+        Returns
+        -------
+        set of int or None
+            Indices of inputs affected by new constraints or `None` if
+            constraints need to be applied on all inputs in full. The
+            other inputs only need the constraints on their refined
+            regions.
+        """
+
+        if self._pending_info is None:
+            return None
+
+        full_idx = set()
+        for src_idx, _ in self._pending_info['constraint']:
+            if src_idx is None or not per_hfun:
+                return None
+            full_idx.update(src_idx)
+        return full_idx
+
+
     def _apply_constraints(self) -> None:
         """Internal: apply specified constraints.
 
@@ -1496,7 +2112,8 @@ class HfunCollector(BaseHfun):
             raise NotImplementedError(
                 "This function does not suuport fast hfun method")
 
-        self._constraint_info_coll.apply(self._hfun_list)
+        self._constraint_info_coll.apply(
+            self._hfun_list, full_idx=self._get_full_constraint_idx())
 
 
     def _apply_contours(self, apply_to: Optional[SizeFuncList] = None) -> None:
@@ -1527,36 +2144,42 @@ class HfunCollector(BaseHfun):
                 mesh_hfun_list.insert(0, self._base_mesh)
             apply_to = [*mesh_hfun_list, *raster_hfun_list]
 
+        input_index = _InputIndex(apply_to)
         with tempfile.TemporaryDirectory() as temp_path:
             with Pool(processes=self._nprocs) as p:
                 # Contours are ONLY extracted from raster sources
-                self._contour_coll.calculate(raster_hfun_list, temp_path)
+                self._contour_coll.calculate(
+                    raster_hfun_list, temp_path, self._iter_specs('contour'))
                 counter = 0
-                for hfun in apply_to:
-                    for gdf in self._contour_coll:
-                        for row in gdf.itertuples():
-                            _logger.debug(row)
-                            shape = row.geometry
-                            if isinstance(shape, GeometryCollection):
-                                continue
-                            # NOTE: CRS check is done AFTER
-                            # GeometryCollection check because
-                            # gdf.to_crs results in an error in case
-                            # of empty GeometryCollection
+                for gdf in self._contour_coll:
+                    for row in gdf.itertuples():
+                        _logger.debug(row)
+                        shape = row.geometry
+                        if isinstance(shape, GeometryCollection):
+                            continue
+                        # NOTE: CRS check is done AFTER
+                        # GeometryCollection check because
+                        # gdf.to_crs results in an error in case
+                        # of empty GeometryCollection
+                        targets = input_index.dispatch(
+                            shape, gdf.crs,
+                            row.expansion_rate, row.target_size)
+                        for hfun, hfun_shape in targets:
                             if not gdf.crs.equals(hfun.crs):
                                 _logger.info("Reprojecting feature...")
                                 transformer = Transformer.from_crs(
                                     gdf.crs, hfun.crs, always_xy=True)
-                                shape = ops.transform(
-                                        transformer.transform, shape)
+                                hfun_shape = ops.transform(
+                                        transformer.transform, hfun_shape)
                             counter = counter + 1
                             hfun.add_feature(**{
-                                'feature': shape,
+                                'feature': hfun_shape,
                                 'expansion_rate': row.expansion_rate,
                                 'target_size': row.target_size,
                                 'pool': p
                             })
             p.join()
+        input_index.finalize('contour')
             # hfun objects cause issue with pickling
             # -> cannot be passed to pool
 #            with Pool(processes=self._nprocs) as p:
@@ -1588,34 +2211,39 @@ class HfunCollector(BaseHfun):
                 mesh_hfun_list.insert(0, self._base_mesh)
             apply_to = [*mesh_hfun_list, *raster_hfun_list]
 
+        input_index = _InputIndex(apply_to)
         with tempfile.TemporaryDirectory() as temp_path:
             # Channels are ONLY extracted from raster sources
-            self._channels_coll.calculate(raster_hfun_list, temp_path)
+            self._channels_coll.calculate(
+                raster_hfun_list, temp_path, self._iter_specs('channel'))
             counter = 0
-            for hfun in apply_to:
-                for gdf in self._channels_coll:
-                    for row in gdf.itertuples():
-                        _logger.debug(row)
-                        shape = row.geometry
-                        if isinstance(shape, GeometryCollection):
-                            continue
-                        # NOTE: CRS check is done AFTER
-                        # GeometryCollection check because
-                        # gdf.to_crs results in an error in case
-                        # of empty GeometryCollection
+            for gdf in self._channels_coll:
+                for row in gdf.itertuples():
+                    _logger.debug(row)
+                    shape = row.geometry
+                    if isinstance(shape, GeometryCollection):
+                        continue
+                    # NOTE: CRS check is done AFTER
+                    # GeometryCollection check because
+                    # gdf.to_crs results in an error in case
+                    # of empty GeometryCollection
+                    targets = input_index.dispatch(
+                        shape, gdf.crs, row.expansion_rate, row.target_size)
+                    for hfun, hfun_shape in targets:
                         if not gdf.crs.equals(hfun.crs):
                             _logger.info("Reprojecting feature...")
                             transformer = Transformer.from_crs(
                                 gdf.crs, hfun.crs, always_xy=True)
-                            shape = ops.transform(
-                                    transformer.transform, shape)
+                            hfun_shape = ops.transform(
+                                    transformer.transform, hfun_shape)
                         counter = counter + 1
                         hfun.add_patch(**{
-                            'multipolygon': shape,
+                            'multipolygon': hfun_shape,
                             'expansion_rate': row.expansion_rate,
                             'target_size': row.target_size,
                             'nprocs': self._nprocs
                         })
+        input_index.finalize('channel')
 
 
     def _apply_flow_limiters(self) -> None:
@@ -1644,7 +2272,8 @@ class HfunCollector(BaseHfun):
             i for i in self._hfun_list if isinstance(i, HfunRaster)]
 
         for in_idx, hfun in enumerate(raster_hfun_list):
-            for src_idx, hmin, hmax, zmax, zmin in self._flow_lim_coll:
+            for src_idx, hmin, hmax, zmax, zmin in self._iter_specs(
+                    'flow_limiter'):
                 if src_idx is not None and in_idx not in src_idx:
                     continue
                 if hmin is None:
@@ -1676,7 +2305,8 @@ class HfunCollector(BaseHfun):
             i for i in self._hfun_list if isinstance(i, HfunRaster)]
 
         for in_idx, hfun in enumerate(raster_hfun_list):
-            for (src_idx, ctr0, ctr1), const_val in self._const_val_contour_coll:
+            for (src_idx, ctr0, ctr1), const_val in self._iter_specs(
+                    'const_val'):
                 if src_idx is not None and in_idx not in src_idx:
                     continue
                 level0 = None
@@ -1712,17 +2342,23 @@ class HfunCollector(BaseHfun):
             apply_to = [*mesh_hfun_list, *raster_hfun_list]
 
         # TODO: Parallelize
-        for hfun in apply_to:
-            for patch_defn, size_info in self._refine_patch_info_coll:
-                shape, crs = patch_defn.get_multipolygon()
+        input_index = _InputIndex(apply_to)
+        for patch_defn, size_info in self._iter_specs('patch'):
+            shape, crs = patch_defn.get_multipolygon()
+            targets = input_index.dispatch(
+                shape, CRS.from_user_input(crs),
+                size_info.get('expansion_rate'),
+                size_info.get('target_size'))
+            for hfun, hfun_shape in targets:
                 if hfun.crs != crs:
                     transformer = Transformer.from_crs(
                         crs, hfun.crs, always_xy=True)
-                    shape = ops.transform(
-                            transformer.transform, shape)
+                    hfun_shape = ops.transform(
+                            transformer.transform, hfun_shape)
 
                 hfun.add_patch(
-                        shape, nprocs=self._nprocs, **size_info)
+                        hfun_shape, nprocs=self._nprocs, **size_info)
+        input_index.finalize('patch')
 
 
     def _apply_linefeatures(self, apply_to: Optional[SizeFuncList] = None) -> None:
@@ -1749,26 +2385,34 @@ class HfunCollector(BaseHfun):
             apply_to = [*mesh_hfun_list, *raster_hfun_list]
 
         # TODO: Parallelize
+        input_index = _InputIndex(apply_to)
         with Pool(processes=self._nprocs) as p:
-            for hfun in apply_to:
-                for lineftr_defn, size_info in self._refine_line_info_coll:
-                    shape, crs = lineftr_defn.get_multiline()
+            for lineftr_defn, size_info in self._iter_specs('line'):
+                shape, crs = lineftr_defn.get_multiline()
+                targets = input_index.dispatch(
+                    shape, CRS.from_user_input(crs),
+                    size_info.get('expansion_rate'),
+                    size_info.get('target_size'))
+                for hfun, hfun_shape in targets:
                     if hfun.crs != crs:
                         transformer = Transformer.from_crs(
                             crs, hfun.crs, always_xy=True)
-                        shape = ops.transform(
-                                transformer.transform, shape)
+                        hfun_shape = ops.transform(
+                                transformer.transform, hfun_shape)
 
                     hfun.add_feature(
-                        feature=shape,
+                        feature=hfun_shape,
                         pool=p,
                         **size_info
                     )
+        input_index.finalize('line feature')
 
 
     def _write_hfun_to_disk(
             self,
-            out_path: Union[str, Path]
+            out_path: Union[str, Path],
+            cached_msh_t: Optional[dict] = None,
+            cache_keys: Optional[dict] = None
             ) -> List[Union[str, Path]]:
         """Internal: write individual size function output mesh to file
 
@@ -1781,12 +2425,16 @@ class HfunCollector(BaseHfun):
         out_path : path-like
             The path of the (temporary) directory to which mesh size
             functions must be written.
+        cached_msh_t : dict or None, default=None
+            Already calculated size functions keyed by input `id`.
+        cache_keys : dict or None, default=None
+            Cache keys of inputs, for storing calculated size functions.
 
         Returns
         -------
         list of path-like
-            List of individual file path for mesh size function of
-            each input.
+            List of individual directory path for the binary mesh
+            size function of each input, see `utils.msh_t_to_npy`.
         """
 
         out_dir = Path(out_path)
@@ -1795,35 +2443,34 @@ class HfunCollector(BaseHfun):
         pid = os.getpid()
         bbox_list = []
 
-        hfun_list = self._hfun_list[::-1]
-        if self._base_mesh and self._base_as_hfun:
-            hfun_list = [*self._hfun_list[::-1], self._base_mesh]
-
         # Last user input item has the highest priority (its trias
-        # are not dropped) so process in reverse order
-        for hfun in hfun_list:
-            # TODO: Calling msh_t() on HfunMesh more than once causes
-            # issue right now due to change in crs of internal Mesh
-
-            # To avoid removing verts and trias from mesh hfuns
-            hfun_mesh = deepcopy(hfun.msh_t())
-            # If no CRS info, we assume EPSG:4326
-            if hasattr(hfun_mesh, "crs"):
-                dst_crs = CRS.from_user_input("EPSG:4326")
-                if hfun_mesh.crs != dst_crs:
-                    utils.reproject(hfun_mesh, dst_crs)
-
-            # Get all previous bbox and clip to resolve overlaps
-            # removing all tria that have NODE in bbox because it's
-            # faster and so we can resolve all overlaps
-            _logger.info("Removing bounds from hfun mesh...")
-            for ibox in bbox_list:
-                hfun_mesh = utils.clip_mesh_by_shape(
-                    hfun_mesh,
-                    ibox,
-                    use_box_only=True,
-                    fit_inside=True,
-                    inverse=True)
+        # are not dropped) so process in reverse order. The size
+        # functions are evaluated independently but clipped in order.
+        hfun_list = self._get_exact_inputs()[::-1]
+        stage_info = [
+            {'input': i} for i in range(len(hfun_list))][::-1]
+        for hfun_mesh, info in zip(
+                self._iter_hfun_msh_t(
+                    hfun_list, cached_msh_t, cache_keys, stage_info),
+                stage_info):
+            with self._stage('clip', **info):
+                # If no CRS info, we assume EPSG:4326
+                if hasattr(hfun_mesh, "crs"):
+                    dst_crs = CRS.from_user_input("EPSG:4326")
+                    if hfun_mesh.crs != dst_crs:
+                        utils.reproject(hfun_mesh, dst_crs)
+
+                # Get all previous bbox and clip to resolve overlaps
+                # removing all tria that have NODE in bbox because it's
+                # faster and so we can resolve all overlaps
+                _logger.info("Removing bounds from hfun mesh...")
+                for ibox in bbox_list:
+                    hfun_mesh = utils.clip_mesh_by_shape(
+                        hfun_mesh,
+                        ibox,
+                        use_box_only=True,
+                        fit_inside=True,
+                        inverse=True)
 
             if len(hfun_mesh.vert2) == 0:
                 _logger.debug("Hfun ignored due to overlap")
@@ -1841,16 +2488,251 @@ class HfunCollector(BaseHfun):
             bbox_list.append(mesh.get_bbox(crs="EPSG:4326"))
             file_counter = file_counter + 1
             _logger.info(f'write mesh {file_counter} to file...')
-            file_path = out_dir / f'hfun_{pid}_{file_counter}.2dm'
-            mesh.write(file_path, format='2dm')
+            file_path = out_dir / f'hfun_{pid}_{file_counter}'
+            utils.msh_t_to_npy(hfun_mesh, file_path)
             path_list.append(file_path)
-            _logger.info('Done writing 2dm file.')
+            _logger.info('Done writing binary hfun file.')
             del mesh
+            del hfun_mesh
             gc.collect()
         return path_list
 
 
 
+    def _iter_hfun_msh_t(
+            self,
+            hfun_list: SizeFuncList,
+            cached_msh_t: Optional[dict] = None,
+            cache_keys: Optional[dict] = None,
+            stage_info: Optional[Sequence[dict]] = None
+            ) -> Iterable[jigsaw_msh_t]:
+        """Internal: calculate the size function of each input
+
+        Raster based size functions are committed and evaluated in a
+        pool of `nprocs` forked processes, while the results are
+        yielded in the order of `hfun_list`. If forking is not
+        available all size functions are evaluated sequentially. Only
+        the raster windows modified since the last evaluation are
+        meshed.
+
+        Parameters
+        ----------
+        hfun_list : SizeFuncList
+            Size functions to evaluate.
+        cached_msh_t : dict or None, default=None
+            Already calculated size functions keyed by input `id`,
+            which are yielded instead of being evaluated.
+        cache_keys : dict or None, default=None
+            Cache keys of inputs, keyed by input `id`. If provided
+            the evaluated size functions are stored in the cache.
+        stage_info : sequence of dict or None, default=None
+            Information recorded with the profiled stages of each
+            size function. By default their index in `hfun_list` is
+            recorded as 'input'.
+
+        Yields
+        ------
+        jigsaw_msh_t
+            Size function of each input that can safely be modified
+            by the caller.
+        """
+
+        cached_msh_t = {} if cached_msh_t is None else cached_msh_t
+        if stage_info is None:
+            stage_info = [{'input': i} for i in range(len(hfun_list))]
+
+        def _cached(hfun, hfun_msh_t):
+            if cache_keys is not None:
+                self._cache.put(cache_keys[id(hfun)], hfun_msh_t)
+            return hfun_msh_t
+
+        # Windows not modified since the last call are reused
+        # pylint: disable=W0212
+        raster_idx = [
+            i for i, hfun in enumerate(hfun_list)
+            if isinstance(hfun, HfunRaster)
+            and id(hfun) not in cached_msh_t
+            and (hfun._is_pending() or hfun._get_stale_windows())]
+        nprocs = min(self._nprocs, len(raster_idx))
+        if nprocs < 2 or 'fork' not in get_all_start_methods():
+            for hfun, info in zip(hfun_list, stage_info):
+                if id(hfun) in cached_msh_t:
+                    yield cached_msh_t[id(hfun)]
+                    continue
+                if isinstance(hfun, HfunRaster):
+                    with self._stage('commit', **info):
+                        hfun.commit(nprocs=self._nprocs)
+                # TODO: Calling msh_t() on HfunMesh more than once
+                # causes issue right now due to change in crs of
+                # internal Mesh
+
+                # To avoid removing verts and trias from mesh hfuns
+                with self._stage('msh_t', **info):
+                    hfun_msh_t = deepcopy(hfun.msh_t())
+                yield _cached(hfun, hfun_msh_t)
+            return
+
+        _logger.info(
+            f'Evaluating {len(raster_idx)} raster size functions'
+            f' using {nprocs} processes...')
+        with get_context('fork').Pool(
+                processes=nprocs,
+                initializer=_init_hfun_worker,
+                initargs=(hfun_list,)) as p:
+            raster_results = p.imap(_msh_t_worker, raster_idx)
+            for i, (hfun, info) in enumerate(zip(hfun_list, stage_info)):
+                if id(hfun) in cached_msh_t:
+                    yield cached_msh_t[id(hfun)]
+                    continue
+                if i in raster_idx:
+                    updated, window_msh_t, usage = next(raster_results)
+                    if self._profiler is not None:
+                        for name, stage_usage in usage.items():
+                            self._profiler.add(
+                                name, stage_usage, **info, worker=True)
+                    # The commit is done on the shared file by workers
+                    # pylint: disable=W0212
+                    with hfun._replaying_updates(updated):
+                        hfun.commit(nprocs=1)
+                    hfun._window_msh_t.update(window_msh_t)
+                # Combines the window meshes stored by the workers
+                with self._stage('combine', **info):
+                    hfun_msh_t = deepcopy(hfun.msh_t())
+                yield _cached(hfun, hfun_msh_t)
+        p.join()
+
+
+    def _get_exact_inputs(self) -> SizeFuncList:
+        """Internal: get the size functions combined in 'exact' method
+
+        Returns
+        -------
+        SizeFuncList
+            Input size functions in the order of increasing priority.
+        """
+
+        if self._base_mesh and self._base_as_hfun:
+            return [self._base_mesh, *self._hfun_list]
+        return list(self._hfun_list)
+
+
+    def _stage(self, name: str, **info: Any) -> ContextManager[None]:
+        """Internal: get the context recording the usage of a stage
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        **info : dict
+            Additional information to record, e.g. input index.
+
+        Returns
+        -------
+        ContextManager
+            The profiler stage context, or a context that does
+            nothing if no profiler is provided.
+        """
+
+        if self._profiler is None:
+            return nullcontext()
+        return self._profiler.stage(name, **info)
+
+
+    def _get_cache_keys(self) -> Optional[dict]:
+        """Internal: calculate the keys for the persistent cache
+
+        The key of each input is a fingerprint of the input content
+        and all the refinement and constraint specifications. Since
+        contours and channels are extracted from all the raster
+        inputs, all rasters contribute to every input key if any of
+        them are specified. The final result key combines all the
+        input keys.
+
+        The input content is fingerprinted before any refinement is
+        applied to the inputs. When called again after adding
+        specifications, the results of the incremental calculation
+        are the same as those of applying all the specifications on
+        the initial inputs, so the initial fingerprints are reused.
+        If the inputs are refined by specifications that are modified
+        since, the results are not cached.
+
+        Returns
+        -------
+        dict or None
+            Cache keys of inputs keyed by input `id` and the final
+            result key as 'result'; or `None` if no cache is used,
+            the inputs cannot be fingerprinted or the results cannot
+            be reproduced from the initial inputs.
+        """
+
+        if self._cache is None:
+            return None
+
+        # Keys are calculated before the refinements are applied to
+        # the inputs, and then reused
+        if self._applied and self._cache_keys is not None:
+            return self._cache_keys
+
+        inputs = self._get_exact_inputs()
+        if self._applied_info is None:
+            for hfun in inputs:
+                if isinstance(hfun, HfunRaster):
+                    hfun.commit(nprocs=self._nprocs)
+            try:
+                self._input_fingerprints = {
+                    id(hfun): fingerprint(hfun) for hfun in inputs}
+            except TypeError as err:
+                _logger.warning(f'Collector results are not cached: {err}')
+                self._input_fingerprints = None
+                self._cache_keys = None
+                return None
+        elif (self._input_fingerprints is None
+                or self._get_pending_info(quiet=True) is None):
+            _logger.info(
+                'Collector inputs are refined by modified specifications,'
+                ' results are not cached.')
+            self._cache_keys = None
+            return None
+
+        specs = [
+            self._method,
+            self._size_info,
+            self._base_as_hfun,
+            self._base_mesh,
+            self._contour_info_coll,
+            self._const_val_contour_coll,
+            self._refine_patch_info_coll,
+            self._refine_line_info_coll,
+            self._flow_lim_coll,
+            self._ch_info_coll,
+            self._constraint_info_coll,
+        ]
+        if any(True for _ in self._contour_info_coll) or any(
+                True for _ in self._ch_info_coll):
+            specs.append([
+                self._input_fingerprints[id(hfun)] for hfun in self._hfun_list
+                if isinstance(hfun, HfunRaster)])
+
+        _logger.info('Calculating collector cache keys...')
+        start = time()
+        try:
+            specs_key = fingerprint(*specs)
+            self._cache_keys = {
+                id(hfun): fingerprint(
+                    specs_key, self._input_fingerprints[id(hfun)])
+                for hfun in inputs}
+        except TypeError as err:
+            _logger.warning(f'Collector results are not cached: {err}')
+            self._cache_keys = None
+            return None
+
+        self._cache_keys['result'] = fingerprint(
+            specs_key, [self._cache_keys[id(hfun)] for hfun in inputs])
+        _logger.info(f'Calculating cache keys took {time()-start}.')
+
+        return self._cache_keys
+
+
     def _get_hfun_composite(
             self,
             hfun_path_list: List[Union[str, Path]]
@@ -1876,83 +2758,84 @@ class HfunCollector(BaseHfun):
         """
 
         collection = []
-        _logger.info('Reading 2dm hfun files...')
+        _logger.info('Mapping binary hfun files...')
         start = time()
         for path in hfun_path_list:
-            collection.append(Mesh.open(path, crs='EPSG:4326'))
-        _logger.info(f'Reading 2dm hfun files took {time()-start}.')
+            collection.append(utils.load_npy_arrays(path, mmap_mode='r'))
+        _logger.info(f'Mapping binary hfun files took {time()-start}.')
 
         # NOTE: Overlaps are taken care of in the write stage
 
-        coord = []
-        index = []
-        value = []
-        offset = 0
-        for hfun in collection:
-            index.append(hfun.tria3['index'] + offset)
-            coord.append(hfun.coord)
-            value.append(hfun.value)
-            offset += hfun.coord.shape[0]
-
-        composite_hfun = jigsaw_msh_t()
-        composite_hfun.mshID = 'euclidean-mesh'
-        composite_hfun.ndims = 2
-
-        composite_hfun.vert2 = np.array(
-                [(coo, 0) for coo in np.vstack(coord)],
-                dtype=jigsaw_msh_t.VERT2_t)
-        composite_hfun.tria3 = np.array(
-                [(idx, 0) for idx in np.vstack(index)],
-                dtype=jigsaw_msh_t.TRIA3_t)
-        composite_hfun.value = np.array(
-                np.vstack(value),
-                dtype=jigsaw_msh_t.REALS_t)
-
-        composite_hfun.crs = CRS.from_user_input("EPSG:4326")
+        with self._stage('assemble'):
+            # Memory-mapped arrays are read directly into the composite
+            composite_hfun = utils.assemble_msh_t(
+                [hfun['coord'] for hfun in collection],
+                {'tria3': [hfun['tria3'] for hfun in collection]},
+                [hfun['value'] for hfun in collection],
+                crs=CRS.from_user_input("EPSG:4326"))
 
-        # NOTE: In the end we need to return in a CRS that
-        # uses meters as units. UTM based on the center of
-        # the bounding box of the hfun is used
-        # Up until now all calculation was in EPSG:4326
-        utils.msh_t_to_utm(composite_hfun)
+            # NOTE: In the end we need to return in a CRS that
+            # uses meters as units. UTM based on the center of
+            # the bounding box of the hfun is used
+            # Up until now all calculation was in EPSG:4326
+            utils.msh_t_to_utm(composite_hfun)
 
         return composite_hfun
 
 
-    def _create_big_raster(self, out_path: Union[str, Path]) -> Raster:
-        """Internal: create a large raster covering all input rasters.
+    def _create_big_rasters(
+            self,
+            out_path: Union[str, Path]
+            ) -> List[Tuple[Raster, Polygon]]:
+        """Internal: create tiled rasters covering all input rasters.
+
+        The extent of all input rasters is recursively split into
+        four tiles until each tile has at most as many cells as the
+        memory limit allows. The resolution of each tile is the finest
+        among the input rasters overlapping it, but not finer than
+        half of `hmin`, so high resolution inputs don't dictate the
+        resolution of the areas covered only by coarse inputs. The
+        tiles that don't overlap any input raster are dropped. Each
+        tile raster is padded by a few cells on every side so that the
+        refinements near its edges are calculated as if there's no
+        seam.
 
         Parameters
         ----------
         out_path : path-like
-            Path of the (tempoerary) directory to which the large
-            raster needs to be written
+            Path of the (tempoerary) directory to which the tile
+            rasters need to be written
 
         Returns
         -------
-        Raster
-            Lower resolution raster covering all input rasters.
+        list of tuple
+            Padded tile rasters covering all input rasters, along with
+            the unpadded box of each tile in the tile raster CRS.
         """
 
         out_dir = Path(out_path)
-        out_rast = out_dir / 'big_raster.tif'
 
         rast_hfun_list = [
             i for i in self._hfun_list if isinstance(i, HfunRaster)]
         if len(rast_hfun_list) == 0:
-            return None
+            return []
 
         all_bounds = []
         n_cell_lim = 0
+        in_clip_list = []
         for hfun_in in rast_hfun_list:
-            n_cell_lim = max(
-                hfun_in.raster.src.shape[0]
-                    * hfun_in.raster.src.shape[1],
-                n_cell_lim)
+            n_rows, n_cols = hfun_in.raster.src.shape
+            clip_plan = hfun_in.raster._clip_plan
+            in_clip_list.append(
+                None if clip_plan is None else clip_plan.shape)
+            if clip_plan is not None:
+                n_rows = clip_plan.window.height
+                n_cols = clip_plan.window.width
+            n_cell_lim = max(n_rows * n_cols, n_cell_lim)
             all_bounds.append(
                     hfun_in.get_bbox(crs='EPSG:4326').bounds)
         # 3 is just a arbitray tolerance for memory limit calculations
-        n_cell_lim = n_cell_lim * self._nprocs / 3
+        n_cell_lim = max(n_cell_lim / 3, 1)
         all_bounds = np.array(all_bounds)
 
         x0, y0 = np.min(all_bounds[:, [0, 1]], axis=0)
@@ -1973,11 +2856,12 @@ class HfunCollector(BaseHfun):
         coords.extend([[x, y0] for x in reversed(xs)])
         poly_epsg4326 = Polygon(np.array(coords))
         poly_utm = ops.transform(transformer.transform, poly_epsg4326)
-        x0, y0, x1, y1 = poly_utm.bounds
 
-        worst_res = 0
+        in_box_list = []
+        in_res_list = []
         for hfun_in in rast_hfun_list:
-            bnd1 = hfun_in.get_bbox(crs=utm_crs).bounds
+            in_box = hfun_in.get_bbox(crs=utm_crs)
+            bnd1 = in_box.bounds
             dim1 = np.max([bnd1[2] - bnd1[0], bnd1[3] - bnd1[1]])
             bnd2 = hfun_in.get_bbox(crs='EPSG:4326').bounds
             dim2 = np.max([bnd2[2] - bnd2[0], bnd2[3] - bnd2[1]])
@@ -1985,118 +2869,223 @@ class HfunCollector(BaseHfun):
             pixel_size_x = hfun_in.raster.src.transform[0] * ratio
             pixel_size_y = -hfun_in.raster.src.transform[4] * ratio
 
-            worst_res = np.max([worst_res, pixel_size_x, pixel_size_y])
+            in_box_list.append(in_box)
+            in_res_list.append(np.max([pixel_size_x, pixel_size_y]))
 
-        # TODO: What if no hmin? -> use smallest raster res!
         g_hmin = self._size_info['hmin']
-        res = np.max([g_hmin / 2, worst_res])
+        res_lim = g_hmin / 2 if g_hmin else 0
+
+        tile_list = self._get_big_raster_tiles(
+            poly_utm.bounds, in_box_list, in_res_list, res_lim, n_cell_lim)
         _logger.info(
-                f"Spatial resolution"
-                f" chosen: {res}, worst: {worst_res}")
-        shape0 = int(np.ceil(abs(x1 - x0) / res))
-        shape1 = int(np.ceil(abs(y1 - y0) / res))
-
-        approx =  int(np.sqrt(n_cell_lim))
-        window_size = None #default of OCSMesh.raster.Raster
-        mem_lim = 0 # default of rasterio
-        if approx < max(shape0, shape1):
-            window_size = np.min([shape0, shape1, approx])
-            # Memory limit in MB
-            mem_lim = n_cell_lim * np.float32(1).itemsize / 10e6
-
-
-        # NOTE: Upper-left vs lower-left origin
-        # (this only works for upper-left)
-        transform = from_origin(x0 - res / 2, y1 + res / 2, res, res)
-
-        rast_profile = {
-                'driver': 'GTiff',
-                'dtype': np.float32,
-                'width': shape0,
-                'height': shape1,
-                'crs': utm_crs,
-                'transform': transform,
-                'count': 1,
-        }
-        with rasterio.open(str(out_rast), 'w', **rast_profile) as dst:
-            # For places where raster is DEM is not provided it's
-            # assumed deep ocean for contouring purposes
-            if window_size is not None:
-                write_wins = get_iter_windows(
-                    shape0, shape1, chunk_size=window_size)
-                for win in write_wins:
-                    z = np.full((win.width, win.height), -99999, dtype=np.float32)
-                    dst.write(z, 1, window=win)
+                f"Spatial resolution of {len(tile_list)} tiles"
+                f" chosen between {min(res for _, res in tile_list)}"
+                f" and {max(res for _, res in tile_list)}")
+
+        # Reproject if needed (for now only needed if constant
+        # value levels or subtidal limiters are added)
+        reproject_idx = self._get_big_raster_inputs()
+
+        tile_info_list = []
+        unpadded_box_list = []
+        for i, ((tx0, ty0, tx1, ty1), res) in enumerate(tile_list):
+            # Tiles are padded so that the sizes near the box edges
+            # are calculated the same as in the neighboring tiles;
+            # the meshes are later cut at the unpadded boxes
+            n_pad = 2
+            # NOTE: Upper-left vs lower-left origin
+            # (this only works for upper-left)
+            transform = from_origin(
+                tx0 - n_pad * res, ty1 + n_pad * res, res, res)
+            rast_profile = {
+                    'driver': 'GTiff',
+                    'dtype': np.float32,
+                    'width': int(np.ceil((tx1 - tx0) / res)) + 2 * n_pad,
+                    'height': int(np.ceil((ty1 - ty0) / res)) + 2 * n_pad,
+                    'crs': utm_crs,
+                    'transform': transform,
+                    'count': 1,
+            }
+            tile_box = box(*array_bounds(
+                rast_profile['height'], rast_profile['width'], transform))
+            # NOTE: Last one implicitely has highest priority in
+            # case of overlap
+            tile_srcs = [
+                (str(hfun_in.raster.tmpfile), in_clip)
+                for in_idx, (hfun_in, in_box, in_clip) in enumerate(
+                    zip(rast_hfun_list, in_box_list, in_clip_list))
+                if in_idx in reproject_idx and in_box.intersects(tile_box)]
+            tile_info_list.append(
+                (str(out_dir / f'tile_{i}.tif'), rast_profile, tile_srcs))
+            unpadded_box_list.append(box(tx0, ty0, tx1, ty1))
+
+        nprocs = min(self._nprocs, len(tile_info_list))
+        if nprocs > 1:
+            _logger.info(
+                f'Creating {len(tile_info_list)} tiles'
+                f' using {nprocs} processes...')
+            with Pool(processes=nprocs) as p:
+                p.map(_create_tile_worker, tile_info_list)
+            p.join()
+        else:
+            for tile_info in tile_info_list:
+                _create_tile_worker(tile_info, num_threads=self._nprocs)
 
-            else:
-                z = np.full((shape0, shape1), -99999, dtype=np.float32)
-                dst.write(z, 1)
-                del z
-
-
-            # Reproject if needed (for now only needed if constant
-            # value levels or subtidal limiters are added)
-            for in_idx, hfun in enumerate(rast_hfun_list):
-                ignore = True
-                for (src_idx, _, _), _ in self._const_val_contour_coll:
-                    if src_idx is None or in_idx in src_idx:
-                        ignore = False
-                        break
-                for src_idx, _, _, _, _ in self._flow_lim_coll:
-                    if src_idx is None or in_idx in src_idx:
-                        ignore = False
-                        break
-                for src_idx, _ in self._constraint_info_coll:
-                    if src_idx is None or in_idx in src_idx:
-                        ignore = False
-                        break
-                if ignore:
-                    continue
+        return [
+            (Raster(out_rast), unpadded_box)
+            for (out_rast, _, _), unpadded_box in zip(
+                tile_info_list, unpadded_box_list)]
 
-                # NOTE: Last one implicitely has highest priority in
-                # case of overlap
-                reproject(
-                    source=rasterio.band(hfun.raster.src, 1),
-                    destination=rasterio.band(dst, 1),
-                    resampling=Resampling.nearest,
-                    init_dest_nodata=False, # To avoid overwrite
-                    num_threads=self._nprocs,
-                    warp_mem_limit=mem_lim)
+    @staticmethod
+    def _get_big_raster_tiles(
+            bounds: Tuple[float, float, float, float],
+            in_box_list: List[Polygon],
+            in_res_list: List[float],
+            res_lim: float,
+            n_cell_lim: float
+            ) -> List[Tuple[Tuple[float, float, float, float], float]]:
+        """Internal: split the extent into multi-resolution tiles
+
+        Parameters
+        ----------
+        bounds : tuple of float
+            Extent of the tiles to split.
+        in_box_list : list of Polygon
+            Bounding boxes of the inputs in the tiles' CRS.
+        in_res_list : list of float
+            Resolution of the inputs in the tiles' CRS.
+        res_lim : float
+            Finest resolution allowed for a tile.
+        n_cell_lim : float
+            Maximum number of cells in a tile.
+
+        Returns
+        -------
+        list of tuple
+            Bounds and resolution of each tile.
+        """
+
+        tile_list = []
+        bounds_stack = [bounds]
+        while bounds_stack:
+            tx0, ty0, tx1, ty1 = bounds_stack.pop()
+            tile_box = box(tx0, ty0, tx1, ty1)
+            overlap_res = [
+                in_res for in_box, in_res in zip(in_box_list, in_res_list)
+                if in_box.intersects(tile_box)
+                and not in_box.touches(tile_box)]
+            if len(overlap_res) == 0:
+                continue
+
+            res = max(min(overlap_res), res_lim)
+            n_cells = np.ceil((tx1 - tx0) / res) * np.ceil((ty1 - ty0) / res)
+            if n_cells <= n_cell_lim:
+                tile_list.append(((tx0, ty0, tx1, ty1), res))
+                continue
 
+            xm = (tx0 + tx1) / 2
+            ym = (ty0 + ty1) / 2
+            bounds_stack.extend([
+                (xm, ym, tx1, ty1), (tx0, ym, xm, ty1),
+                (xm, ty0, tx1, ym), (tx0, ty0, xm, ym)])
 
+        return tile_list
 
-        return Raster(out_rast, chunk_size=window_size)
+    def _get_big_raster_inputs(self) -> Set[int]:
+        """Internal: get the rasters that need to be in the tile rasters
 
-    def _apply_features_fast(self, big_raster: HfunRaster):
+        Returns
+        -------
+        set of int
+            Indices of raster inputs (among raster inputs only) whose
+            data is needed in the tile rasters, i.e. those with
+            constant value, flow limiter or constraint specifications.
+        """
+
+        rast_hfun_list = [
+            i for i in self._hfun_list if isinstance(i, HfunRaster)]
+        src_idx_list = [
+            *(src_idx for (src_idx, _, _), _ in self._const_val_contour_coll),
+            *(src_idx for src_idx, _, _, _, _ in self._flow_lim_coll),
+            *(src_idx for src_idx, _ in self._constraint_info_coll),
+        ]
+        return {
+            in_idx for in_idx in range(len(rast_hfun_list))
+            if any(src_idx is None or in_idx in src_idx
+                   for src_idx in src_idx_list)}
+
+    def _apply_features_fast(self) -> List[HfunRaster]:
         """Internal: apply all specified refinements and constraints
 
         Apply all specified refinements and constrains for the fast
-        algorithm.
+        algorithm. The tile size functions are kept between calls so
+        that only the specifications added since the last call are
+        applied, unless the tiles need to be created again.
 
         Parameters
         ----------
-        big_raster : HfunRaster
-            The lower-resolution large raster that covers all the
-            input rasters.
 
         Returns
         -------
-        None
+        list of HfunRaster
+            The multi-resolution tile size functions that cover all
+            the input rasters, if there is any raster input.
 
         See Also
         --------
         _apply_features :
         """
 
-        # NOTE: Caching applied doesn't work here since we apply
-        # everything on a temporary big raster
-        rast_hfun_list = []
-        hfun_rast = None
-        if big_raster:
-            hfun_rast = HfunRaster(big_raster, **self._size_info)
-            rast_hfun_list.append(hfun_rast)
+        big_raster_inputs = self._get_big_raster_inputs()
+        if self._big_hfun_inputs != big_raster_inputs:
+            self._big_hfun_dir = tempfile.TemporaryDirectory()
+            with self._stage('create_tiles'):
+                tile_list = self._create_big_rasters(self._big_hfun_dir.name)
+                self._big_hfun_list = [
+                    HfunRaster(tile_raster, **self._size_info, deferred=True)
+                    for tile_raster, _ in tile_list]
+                self._big_box_list = [tile_box for _, tile_box in tile_list]
+            self._big_hfun_inputs = big_raster_inputs
+            # Everything must be applied on the new tiles
+            self._applied_info = None
+            self._applied = False
+
+        tile_hfun_list = self._big_hfun_list
+        if self._applied:
+            return tile_hfun_list
+
+        self._pending_info = self._get_pending_info()
+        if self._pending_info is None and self._applied_info is not None:
+            # Tiles are refined by modified specifications too
+            self._input_fingerprints = None
+        try:
+            self._apply_features_fast_on(tile_hfun_list)
+        finally:
+            self._pending_info = None
+        self._applied_info = self._get_spec_snapshot()
+        self._applied = True
+
+        return tile_hfun_list
+
+    def _apply_features_fast_on(
+            self,
+            tile_hfun_list: List[HfunRaster]
+            ) -> None:
+        """Internal: apply the specifications for the fast algorithm
+
+        The refinements are only queued on the tiles. They are
+        committed in parallel when the tile meshes are calculated.
 
+        Parameters
+        ----------
+        tile_hfun_list : list of HfunRaster
+            The multi-resolution tile size functions that cover all
+            the input rasters.
 
+        Returns
+        -------
+        None
+        """
 
         mesh_hfun_list = [
             i for i in self._hfun_list if isinstance(i, HfunMesh)]
@@ -2104,23 +3093,28 @@ class HfunCollector(BaseHfun):
             mesh_hfun_list.insert(0, self._base_mesh)
 
         # Mesh hfun parts are still stateful
-        self._apply_contours([*mesh_hfun_list, *rast_hfun_list])
-        if hfun_rast:
-            # In fast method we only have big raster if any
-            self._apply_flow_limiters_fast(hfun_rast)
-            self._apply_const_val_fast(hfun_rast)
+        with self._stage('contour'):
+            self._apply_contours([*mesh_hfun_list, *tile_hfun_list])
+        # In fast method we only have tiles if any
+        with self._stage('flow_limiter'):
+            self._apply_flow_limiters_fast(tile_hfun_list)
+        with self._stage('const_val'):
+            self._apply_const_val_fast(tile_hfun_list)
         # Mesh hfun parts are still stateful
-        self._apply_linefeatures([*mesh_hfun_list, *rast_hfun_list])
-        self._apply_patch([*mesh_hfun_list, *rast_hfun_list])
-        self._apply_channels([*mesh_hfun_list, *rast_hfun_list])
-
-        if hfun_rast:
-            self._apply_constraints_fast(hfun_rast)
+        with self._stage('line'):
+            self._apply_linefeatures([*mesh_hfun_list, *tile_hfun_list])
+        with self._stage('patch'):
+            self._apply_patch([*mesh_hfun_list, *tile_hfun_list])
+        with self._stage('channel'):
+            self._apply_channels([*mesh_hfun_list, *tile_hfun_list])
 
+        with self._stage('constraint'):
+            self._apply_constraints_fast(tile_hfun_list)
 
-        return hfun_rast
-
-    def _apply_flow_limiters_fast(self, big_hfun: HfunRaster) -> None:
+    def _apply_flow_limiters_fast(
+            self,
+            tile_hfun_list: List[HfunRaster]
+            ) -> None:
         """Internal: apply specified sub tidal flow limiter refinements
 
         Applies specified subtidal flow limiter refinements for
@@ -2128,9 +3122,9 @@ class HfunCollector(BaseHfun):
 
         Parameters
         ----------
-        big_hfun : HfunRaster
-            The lower-resolution large raster that covers all the
-            input rasters.
+        tile_hfun_list : list of HfunRaster
+            The multi-resolution tiles that cover all the input
+            rasters.
 
         Returns
         -------
@@ -2141,7 +3135,8 @@ class HfunCollector(BaseHfun):
         _apply_flow_limiters :
         """
 
-        for src_idx, hmin, hmax, zmax, zmin in self._flow_lim_coll:
+        for src_idx, hmin, hmax, zmax, zmin in self._iter_specs(
+                'flow_limiter'):
             # TODO: Account for source index
             if hmin is None:
                 hmin = self._size_info['hmin']
@@ -2154,9 +3149,10 @@ class HfunCollector(BaseHfun):
             else:
                 zmin = max(zmin, -99990)
 
-            big_hfun.add_subtidal_flow_limiter(hmin, hmax, zmin, zmax)
+            for tile_hfun in tile_hfun_list:
+                tile_hfun.add_subtidal_flow_limiter(hmin, hmax, zmin, zmax)
 
-    def _apply_const_val_fast(self, big_hfun):
+    def _apply_const_val_fast(self, tile_hfun_list):
         """Internal: apply specified constant value refinements.
 
         Applies constant value refinements for the fast algorithm.
@@ -2170,7 +3166,8 @@ class HfunCollector(BaseHfun):
         _apply_const_val :
         """
 
-        for (src_idx, ctr0, ctr1), const_val in self._const_val_contour_coll:
+        for (src_idx, ctr0, ctr1), const_val in self._iter_specs(
+                'const_val'):
             # TODO: Account for source index
             level0 = None
             level1 =  None
@@ -2178,10 +3175,14 @@ class HfunCollector(BaseHfun):
                 level0 = ctr0.level
             if ctr1 is not None:
                 level1 = ctr1.level
-            big_hfun.add_constant_value(const_val, level0, level1)
+            for tile_hfun in tile_hfun_list:
+                tile_hfun.add_constant_value(const_val, level0, level1)
 
 
-    def _apply_constraints_fast(self, big_hfun: HfunRaster) -> None:
+    def _apply_constraints_fast(
+            self,
+            tile_hfun_list: List[HfunRaster]
+            ) -> None:
         """Internal: apply specified constraints.
 
         Apply specified constraints for the fast algorithm.
@@ -2199,20 +3200,57 @@ class HfunCollector(BaseHfun):
         """
 
         # TODO: Account for source index
-        self._constraint_info_coll.apply([big_hfun], per_hfun=False)
-
-
-    def _get_hfun_composite_fast(self, big_hfun):
+        apply_list = self._constraint_info_coll.get_apply_list(
+            tile_hfun_list, per_hfun=False,
+            full_idx=self._get_full_constraint_idx(per_hfun=False))
+
+        nprocs = min(self._nprocs, len(apply_list))
+        if nprocs < 2 or 'fork' not in get_all_start_methods():
+            for in_idx, constraint_list, refined_only in apply_list:
+                tile_hfun_list[in_idx].apply_constraints(
+                    constraint_list, refined_only=refined_only,
+                    nprocs=self._nprocs)
+            return
+
+        # Queued refinements of the tiles are committed in parallel
+        # along with the constraints
+        _logger.info(
+            f'Applying constraints on {len(apply_list)} tiles'
+            f' using {nprocs} processes...')
+        with get_context('fork').Pool(
+                processes=nprocs,
+                initializer=_init_hfun_worker,
+                initargs=(tile_hfun_list, apply_list)) as p:
+            updated_list = p.map(
+                _apply_constraints_worker, range(len(apply_list)))
+        p.join()
+
+        # pylint: disable=W0212
+        for (in_idx, constraint_list, refined_only), updated in zip(
+                apply_list, updated_list):
+            tile_hfun = tile_hfun_list[in_idx]
+            with tile_hfun._replaying_updates(updated):
+                tile_hfun.apply_constraints(
+                    constraint_list, refined_only=refined_only, nprocs=1)
+
+
+    def _get_hfun_composite_fast(self, tile_hfun_list, tile_box_list):
         """Internal: combine the size function functions for fast method
 
-        Combine the size functions of the large raster with non-raster
-        inputs. This is used for `fast` method.
+        Combine the size functions of the multi-resolution tiles with
+        non-raster inputs. This is used for `fast` method. The tiles
+        are committed and meshed in parallel. The mesh of each tile is
+        cut exactly at the edges of its unpadded box, so that the
+        meshes of neighboring tiles neither overlap nor leave gaps at
+        the seams.
 
         Parameters
         ----------
-        big_hfun : HfunRaster
-            The single large raster based size function covering all
+        tile_hfun_list : list of HfunRaster
+            The multi-resolution tile size functions covering all
             input rasters.
+        tile_box_list : list of Polygon
+            The unpadded box of each tile in the tile CRS.
 
         Retruns
         -------
@@ -2241,87 +3279,91 @@ class HfunCollector(BaseHfun):
         index = []
         coord = []
         value = []
-        offset = 0
 
-        # Calculate multipoly and clip big hfun
+        # Calculate multipoly and clip tile hfuns
         big_cut_shape = None
-        if big_hfun:
+        if tile_hfun_list:
             dem_gdf = gpd.GeoDataFrame(
                     geometry=dem_box_list, crs=epsg4326)
             big_cut_shape = dem_gdf.unary_union
-            big_msh_t = big_hfun.msh_t()
-            if hasattr(big_msh_t, "crs"):
-                if not epsg4326.equals(big_msh_t.crs):
-                    utils.reproject(big_msh_t, epsg4326)
-
-            big_msh_t = utils.clip_mesh_by_shape(
-                big_msh_t,
-                big_cut_shape,
-                use_box_only=False,
-                fit_inside=False)
-
+        stage_info = [{'tile': i} for i in range(len(tile_hfun_list))]
+        for tile_msh_t, tile_hfun, tile_box, info in zip(
+                self._iter_hfun_msh_t(
+                    tile_hfun_list, stage_info=stage_info),
+                tile_hfun_list, tile_box_list, stage_info):
+            with self._stage('clip', **info):
+                # Padding is only used for calculating the sizes,
+                # the elements crossing the box edges are cut
+                if not tile_hfun.crs.equals(tile_msh_t.crs):
+                    utils.reproject(tile_msh_t, tile_hfun.crs)
+                tile_msh_t = utils.cut_mesh_by_box(
+                    tile_msh_t, tile_box.bounds)
+
+                if hasattr(tile_msh_t, "crs"):
+                    if not epsg4326.equals(tile_msh_t.crs):
+                        utils.reproject(tile_msh_t, epsg4326)
+
+                tile_msh_t = utils.clip_mesh_by_shape(
+                    tile_msh_t,
+                    big_cut_shape,
+                    use_box_only=False,
+                    fit_inside=False)
 
-            index.append(big_msh_t.tria3['index'] + offset)
-            coord.append(big_msh_t.vert2['coord'])
-            value.append(big_msh_t.value)
-            offset = offset + coord[-1].shape[0]
+            index.append(tile_msh_t.tria3['index'])
+            coord.append(tile_msh_t.vert2['coord'])
+            value.append(tile_msh_t.value)
 
         hfun_list = nondem_hfun_list[::-1]
         if self._base_mesh and self._base_as_hfun:
             hfun_list = [*nondem_hfun_list[::-1], self._base_mesh]
 
+        # Recorded input indices are the same as in 'exact' method
+        inputs = self._get_exact_inputs()
         nondem_shape_list = []
         for hfun in hfun_list:
-            nondem_msh_t = deepcopy(hfun.msh_t())
-            if hasattr(nondem_msh_t, "crs"):
-                if not epsg4326.equals(nondem_msh_t.crs):
-                    utils.reproject(nondem_msh_t, epsg4326)
-
-            nondem_shape = utils.get_mesh_polygons(hfun.mesh.msh_t)
-            if not epsg4326.equals(hfun.crs):
-                transformer = Transformer.from_crs(
-                    hfun.crs, epsg4326, always_xy=True)
-                nondem_shape = ops.transform(
-                        transformer.transform, nondem_shape)
-
-            # In fast method all DEM hfuns have more priority than all
-            # other inputs
-            if big_cut_shape:
-                nondem_msh_t = utils.clip_mesh_by_shape(
-                    nondem_msh_t,
-                    big_cut_shape,
-                    use_box_only=False,
-                    fit_inside=True,
-                    inverse=True)
+            info = {'input': inputs.index(hfun)}
+            with self._stage('msh_t', **info):
+                nondem_msh_t = deepcopy(hfun.msh_t())
 
-            for ishp in nondem_shape_list:
-                nondem_msh_t = utils.clip_mesh_by_shape(
-                    nondem_msh_t,
-                    ishp,
-                    use_box_only=False,
-                    fit_inside=True,
-                    inverse=True)
+            with self._stage('clip', **info):
+                if hasattr(nondem_msh_t, "crs"):
+                    if not epsg4326.equals(nondem_msh_t.crs):
+                        utils.reproject(nondem_msh_t, epsg4326)
+
+                nondem_shape = utils.get_mesh_polygons(hfun.mesh.msh_t)
+                if not epsg4326.equals(hfun.crs):
+                    transformer = Transformer.from_crs(
+                        hfun.crs, epsg4326, always_xy=True)
+                    nondem_shape = ops.transform(
+                            transformer.transform, nondem_shape)
+
+                # In fast method all DEM hfuns have more priority than
+                # all other inputs
+                if big_cut_shape:
+                    nondem_msh_t = utils.clip_mesh_by_shape(
+                        nondem_msh_t,
+                        big_cut_shape,
+                        use_box_only=False,
+                        fit_inside=True,
+                        inverse=True)
+
+                for ishp in nondem_shape_list:
+                    nondem_msh_t = utils.clip_mesh_by_shape(
+                        nondem_msh_t,
+                        ishp,
+                        use_box_only=False,
+                        fit_inside=True,
+                        inverse=True)
 
             nondem_shape_list.append(nondem_shape)
 
-            index.append(nondem_msh_t.tria3['index'] + offset)
+            index.append(nondem_msh_t.tria3['index'])
             coord.append(nondem_msh_t.vert2['coord'])
             value.append(nondem_msh_t.value)
-            offset += coord[-1].shape[0]
-
-        composite_hfun = jigsaw_msh_t()
-        composite_hfun.mshID = 'euclidean-mesh'
-        composite_hfun.ndims = 2
-
-        composite_hfun.vert2 = np.array(
-                [(coord, 0) for coord in np.vstack(coord)],
-                dtype=jigsaw_msh_t.VERT2_t)
-        composite_hfun.tria3 = np.array(
-                [(index, 0) for index in np.vstack(index)],
-                dtype=jigsaw_msh_t.TRIA3_t)
-        composite_hfun.value = np.array(
-                np.vstack(value),
-                dtype=jigsaw_msh_t.REALS_t)
+
+        with self._stage('assemble'):
+            composite_hfun = utils.assemble_msh_t(
+                coord, {'tria3': index}, value)
 
         # TODO: Get user input for wether to force hmin and hmax on
         # final hfun (which includes non-raster and basemesh sizes)
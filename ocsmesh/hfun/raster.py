@@ -1,15 +1,24 @@
 """This module define class for raster based size function
 """
 
+from collections import OrderedDict
 import functools
 import gc
+import hashlib
+import itertools
 import logging
-from multiprocessing import cpu_count, Pool
+from multiprocessing import cpu_count, current_process, Pool
+from multiprocessing.pool import ThreadPool
 import operator
+import os
+import pathlib
 import tempfile
+import threading
 from time import time
-from typing import Union, List, Callable, Optional, Iterable, Tuple
-from contextlib import ExitStack
+from typing import (
+    Union, List, Callable, Optional, Iterable, Tuple, Dict, Any, Set,
+    Generator)
+from contextlib import ExitStack, contextmanager
 import warnings
 try:
     # pylint: disable=C0412
@@ -20,10 +29,14 @@ except ImportError:
 
 from jigsawpy import jigsaw_msh_t, jigsaw_jig_t
 from jigsawpy import libsaw
+from numba import njit
 import numpy as np
 import numpy.typing as npt
 from pyproj import CRS, Transformer
 import rasterio
+from rasterio import Affine
+from rasterio.features import rasterize, geometry_mask
+from scipy.ndimage import distance_transform_edt
 from scipy.spatial import cKDTree
 from shapely import ops
 from shapely.geometry import (
@@ -31,7 +44,8 @@ from shapely.geometry import (
     Polygon, MultiPolygon)
 
 from ocsmesh.hfun.base import BaseHfun
-from ocsmesh.raster import Raster, get_iter_windows
+from ocsmesh.cache import contour_registry
+from ocsmesh.raster import Raster, ClipPlan, get_iter_windows, tmpdir
 from ocsmesh.geom.shapely import PolygonGeom
 from ocsmesh.features.constraint import (
     Constraint,
@@ -70,6 +84,15 @@ class HfunInputRaster:
 
             meta = src.meta.copy()
             meta.update({'driver': 'GTiff', 'dtype': np.float32})
+            if raster._clip_plan is not None:
+                # Only the windows of lazily clipped input are used,
+                # the rest of the file is left unwritten
+                clip_window = raster._clip_plan.window
+                windows = [
+                    rasterio.windows.intersection(window, clip_window)
+                    for window in windows
+                    if rasterio.windows.intersect(window, clip_window)]
+                meta.update({'sparse_ok': True})
             dst = stack.enter_context(
                     obj.modifying_raster(use_src_meta=False, **meta))
             for window in windows:
@@ -78,13 +101,332 @@ class HfunInputRaster:
                 dst.write(values, window=window)
 
         obj.__dict__['raster'] = raster
+        # Working file is known to have initial values until updated
+        obj._initial_values_file = obj.tmpfile
         obj._chunk_size = raster.chunk_size
         obj._overlap = raster.overlap
+        if raster._clip_plan is not None:
+            # Sizes are only calculated on the windows of lazily
+            # clipped input, but the size values are not masked
+            obj._clip_plan = ClipPlan(
+                raster._clip_plan.shape, obj.src, mask_values=False)
 
     def __get__(self, obj, objtype=None) -> Raster:
         return obj.__dict__['raster']
 
 
+@njit(nogil=True)
+def _subtidal_flow_limiter_kernel(
+        topobathy, dx, dy, row_off, col_off, values, row_start, row_end,
+        hmin, hmax, lower_bound, upper_bound, glob_hmin, glob_hmax):
+    """Fused calculation of topography based sizes for a window.
+
+    Calculates :math:`|z| / (3 \\left\\| \\grad z \\right\\|)` for the
+    rows `row_start` to `row_end` of the `values` window array, which
+    starts at (`row_off`, `col_off`) of the `topobathy` array. The
+    GIL is released so that row bands can be calculated in parallel
+    threads. The gradient uses central differences
+    wherever neighbors are available in `topobathy` and one-sided
+    differences at its edges, the same as `np.gradient`. The local
+    and then global size limits are applied. Points outside the
+    elevation bounds, or where the gradient is zero or not finite,
+    are set to infinity before applying the global limits.
+    """
+
+    nrows, ncols = topobathy.shape
+    width = values.shape[1]
+    for i in range(row_start, row_end):
+        row = row_off + i
+        for j in range(width):
+            col = col_off + j
+            z = topobathy[row, col]
+
+            if nrows < 2:
+                grad_y = 0.
+            elif row == 0:
+                grad_y = (topobathy[1, col] - z) / dy
+            elif row == nrows - 1:
+                grad_y = (z - topobathy[row - 1, col]) / dy
+            else:
+                grad_y = (topobathy[row + 1, col]
+                          - topobathy[row - 1, col]) / (2 * dy)
+
+            if ncols < 2:
+                grad_x = 0.
+            elif col == 0:
+                grad_x = (topobathy[row, 1] - z) / dx
+            elif col == ncols - 1:
+                grad_x = (z - topobathy[row, col - 1]) / dx
+            else:
+                grad_x = (topobathy[row, col + 1]
+                          - topobathy[row, col - 1]) / (2 * dx)
+
+            grad = np.sqrt(grad_x * grad_x + grad_y * grad_y)
+            value = np.inf
+            if lower_bound <= z <= upper_bound and grad > 0:
+                value = np.abs(z) / (3. * grad)
+                if np.isfinite(value):
+                    value = min(max(value, hmin), hmax)
+                else:
+                    value = np.inf
+
+            values[i, j] = min(max(value, glob_hmin), glob_hmax)
+
+
+class ProjectedXYCache:
+    """Bounded LRU cache of projected raster point locations.
+
+    The projected locations of raster grid points are stored as
+    `.npy` files in `cache_dir` and returned as read-only memory maps.
+    The entries are keyed by the raster transform, raster shape,
+    window and destination CRS, so they are shared between all the
+    objects on the same grid. Since the file names are derived from
+    the key, entries created by other processes (e.g. pool workers)
+    are found and reused as well.
+
+    Attributes
+    ----------
+    max_bytes
+    cache_dir
+    stats
+
+    Methods
+    -------
+    get(raster, window, dst_crs)
+        Get the memory mapped projected locations of raster points.
+    get_path(raster, window, dst_crs)
+        Get the path of the file storing projected locations.
+    clear()
+        Remove all the cache entries and reset statistics.
+
+    Notes
+    -----
+    The least recently used entries are removed from disk whenever
+    the total size of the entries exceeds `max_bytes`. The existing
+    files in `cache_dir` are accounted for when the cache is first
+    used in a process.
+    """
+
+    def __init__(
+            self,
+            max_bytes: int = 2 * 1024 ** 3,
+            cache_dir: Union[str, os.PathLike, None] = None
+            ) -> None:
+        """Initialize the cache
+
+        Parameters
+        ----------
+        max_bytes : int, default=2 GiB
+            Maximum total size of the cached files on disk.
+        cache_dir : str or PathLike or None, default=None
+            Directory to store the cached files. If `None`, a
+            directory in the temporary directory of `ocsmesh`
+            is used.
+        """
+
+        self.max_bytes = max_bytes
+        if cache_dir is None:
+            cache_dir = pathlib.Path(tmpdir) / 'xy_cache'
+        self._cache_dir = pathlib.Path(cache_dir)
+        self._entries = None
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(
+            self,
+            raster: Raster,
+            window: rasterio.windows.Window,
+            dst_crs: Union[CRS, str]
+            ) -> npt.NDArray[float]:
+        """Get the projected locations of raster points.
+
+        Parameters
+        ----------
+        raster : Raster
+            The raster whose grid points locations are projected.
+        window : rasterio.windows.Window
+            The raster window for querying location data.
+        dst_crs : CRS or str
+            The destination CRS for the raster points locations.
+
+        Returns
+        -------
+        np.ndarray
+            Read-only memory map of the locations of raster points
+            after projecting to `dst_crs`.
+
+        Notes
+        -----
+        If the file is removed by another process using the same
+        `cache_dir` after it is looked up and before it is loaded,
+        e.g. due to eviction, the entry is calculated again.
+        """
+
+        path = self.get_path(raster, window, dst_crs)
+        try:
+            return np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            _logger.debug(f'Cached file {path} was removed, recalculate')
+            with self._lock:
+                self._get_entries().pop(path.stem, None)
+            return np.load(
+                self.get_path(raster, window, dst_crs), mmap_mode='r')
+
+    def get_path(
+            self,
+            raster: Raster,
+            window: rasterio.windows.Window,
+            dst_crs: Union[CRS, str]
+            ) -> pathlib.Path:
+        """Get the path of the file storing projected locations.
+
+        The projected locations are calculated and stored if they
+        are not already cached. The returned file can be loaded
+        with `np.load(path, mmap_mode='r')` from any process.
+
+        Parameters
+        ----------
+        raster : Raster
+            The raster whose grid points locations are projected.
+        window : rasterio.windows.Window
+            The raster window for querying location data.
+        dst_crs : CRS or str
+            The destination CRS for the raster points locations.
+
+        Returns
+        -------
+        pathlib.Path
+            Path of the cached `.npy` file.
+        """
+
+        key = self._get_key(raster, window, dst_crs)
+        path = self._cache_dir / f'{key}.npy'
+        with self._lock:
+            entries = self._get_entries()
+            if key in entries and path.is_file():
+                entries.move_to_end(key)
+                self._hits += 1
+                return path
+
+            if path.is_file():
+                # Created by another process
+                entries[key] = path.stat().st_size
+                self._hits += 1
+                self._evict(keep=key)
+                return path
+
+            self._misses += 1
+
+        _logger.info('Transform points to local CRS...')
+        transformer = Transformer.from_crs(
+            raster.src.crs, dst_crs, always_xy=True)
+        xy = raster.get_xy(window)
+        # pylint: disable=R1732
+        tmpfile = tempfile.NamedTemporaryFile(
+            dir=self._cache_dir, suffix='.tmp', delete=False)
+        tmpfile.close()
+        fp = np.lib.format.open_memmap(
+            tmpfile.name, mode='w+', dtype='float32', shape=xy.shape)
+        fp[:] = np.vstack(transformer.transform(xy[:, 0], xy[:, 1])).T
+        _logger.info('Saving values to memcache...')
+        fp.flush()
+        del fp
+        os.replace(tmpfile.name, path)
+        _logger.info('Done!')
+
+        with self._lock:
+            self._get_entries()[key] = path.stat().st_size
+            self._evict(keep=key)
+
+        return path
+
+    def clear(self) -> None:
+        """Remove all the cache entries and reset statistics.
+
+        Parameters
+        ----------
+
+        Returns
+        -------
+        None
+        """
+
+        with self._lock:
+            for key in list(self._get_entries()):
+                self._remove(key)
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    def _get_key(
+            self,
+            raster: Raster,
+            window: rasterio.windows.Window,
+            dst_crs: Union[CRS, str]
+            ) -> str:
+        key = (
+            tuple(raster.transform),
+            raster.shape,
+            (window.col_off, window.row_off, window.width, window.height),
+            CRS.from_user_input(raster.src.crs).to_wkt(),
+            CRS.from_user_input(dst_crs).to_wkt(),
+        )
+        return hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+
+    def _get_entries(self) -> 'OrderedDict[str, int]':
+        if self._entries is None:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            files = sorted(
+                self._cache_dir.glob('*.npy'),
+                key=lambda path: path.stat().st_mtime)
+            self._entries = OrderedDict(
+                (path.stem, path.stat().st_size) for path in files)
+        return self._entries
+
+    def _evict(self, keep: str) -> None:
+        entries = self._get_entries()
+        while sum(entries.values()) > self.max_bytes and len(entries) > 1:
+            key = next(iter(entries))
+            if key == keep:
+                entries.move_to_end(key)
+                continue
+            self._remove(key)
+            self._evictions += 1
+
+    def _remove(self, key: str) -> None:
+        self._get_entries().pop(key, None)
+        try:
+            (self._cache_dir / f'{key}.npy').unlink()
+        except FileNotFoundError:
+            pass
+
+    @property
+    def cache_dir(self) -> pathlib.Path:
+        """Read-only attribute for the directory of cached files"""
+
+        return self._cache_dir
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Read-only attribute for the cache hit and miss statistics"""
+
+        with self._lock:
+            entries = self._get_entries()
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'entries': len(entries),
+                'nbytes': sum(entries.values()),
+                'max_bytes': self.max_bytes,
+            }
+
+
+xy_cache = ProjectedXYCache()
+
+
 class HfunRaster(BaseHfun, Raster):
     """Raster based size function.
 
@@ -98,12 +440,16 @@ class HfunRaster(BaseHfun, Raster):
     hmin
     hmax
     verbosity
+    deferred
 
     Methods
     -------
     msh_t()
         Return mesh sizes interpolated on an size-optimized
         unstructured mesh
+    commit(nprocs=None)
+        Apply all the queued refinements and added constraints to
+        the size function in deferred mode.
     apply_added_constraints()
         Re-apply the existing constraint. Mostly used internally.
     apply_constraints(constraint_list)
@@ -140,6 +486,7 @@ class HfunRaster(BaseHfun, Raster):
     get_xy_memcache(window, dst_crs)
         Get XY grid cached onto disk. Useful for when XY needs to be
         projected to UTM so as to avoid reprojecting on every call.
+        The cache is shared by all the size functions on the same grid.
     add_subtidal_flow_limiter(...)
         Add mesh size refinement based on the value as well as
         gradient of the topography within the region between
@@ -186,15 +533,28 @@ class HfunRaster(BaseHfun, Raster):
     automatic conflict resolutions and the constrains are applied in
     the order specified, so if applicable the last one overrides all
     else.
+
+    In deferred mode, the `add_*` refinement methods don't modify
+    the size function raster. Instead they are queued and later
+    applied all together, along with the added constraints, in a
+    single pass over the raster windows when `commit` or `msh_t` is
+    called. The raster values read through `get_values` or `values`
+    don't reflect the queued refinements until they are committed.
+
+    The mesh calculated for each raster window by `msh_t` is kept
+    until the size values of that window change, so after adding a
+    refinement only the affected windows are meshed again.
     """
 
     _raster = HfunInputRaster()
+    _initial_values_file = None
 
     def __init__(self,
                  raster: Raster,
                  hmin: Optional[float] = None,
                  hmax: Optional[float] = None,
-                 verbosity: int = 0
+                 verbosity: int = 0,
+                 deferred: bool = False
                  ) -> None:
         """Initialize a raster based size function object
 
@@ -215,6 +575,10 @@ class HfunRaster(BaseHfun, Raster):
             constraint applications are not capped off.
         verbosity : int, default=0
             The verbosity of the outputs.
+        deferred : bool, default=False
+            Whether to queue the refinements and apply them only when
+            `commit` or `msh_t` is called, instead of rewriting the
+            size function raster for every refinement.
 
         Notes
         -----
@@ -223,7 +587,6 @@ class HfunRaster(BaseHfun, Raster):
         even if provided, are not applied in during initialization.
         """
 
-        self._xy_cache = {}
         # NOTE: unlike Raster, HfunRaster has no "path" set
         self._raster = raster
         # TODO: Store max and min as two separate constraints instead
@@ -232,6 +595,20 @@ class HfunRaster(BaseHfun, Raster):
         self._hmax = float(hmax) if hmax is not None else hmax
         self._verbosity = int(verbosity)
         self._constraints = []
+        self._deferred = bool(deferred)
+        self._refinement_queue = []
+        self._constraints_pending = False
+        self._applied_constraints = None
+        self._modified_windows = set()
+        self._window_ranges = {}
+        self._window_msh_t = {}
+        self._window_msh_t_file = None
+        # Created before any forking so that workers write into it
+        # pylint: disable=R1732
+        self._window_msh_t_dir = tempfile.TemporaryDirectory(dir=tmpdir)
+        self._replayed_updates = None
+        self._thread_pool = None
+        self._nthreads = 1
 
 
     def msh_t(
@@ -289,20 +666,92 @@ class HfunRaster(BaseHfun, Raster):
         raster size function (called ``hmat``) is passed to the mesh
         engine along with the bounding box of the size function as
         the meshing domain.
+
+        In deferred mode, all the queued refinements are committed
+        before calculating the mesh.
+
+        The mesh of each window is stored on disk and reused from
+        earlier calls if the size values of the window haven't changed
+        since. The stored meshes are memory-mapped to combine them.
         """
 
+        self.commit()
 
         if window is None:
             iter_windows = list(self.iter_windows())
         else:
             iter_windows = [window]
 
+        window_paths = self._get_window_meshes(
+            iter_windows, marche, verbosity)
+
+        # combine the results of all windows
+        window_arrays = [
+            utils.load_npy_arrays(path, mmap_mode='r')
+            for path in window_paths]
+        output_mesh = utils.assemble_msh_t(
+            [arrays['coord'] for arrays in window_arrays],
+            {'tria3': [arrays['tria3'] for arrays in window_arrays]},
+            [arrays['value'] for arrays in window_arrays],
+            crs=self.crs)
+        del window_arrays
+
+        # NOTE: In the end we need to return in a CRS that
+        # uses meters as units. UTM based on the center of
+        # the bounding box of the hfun is used
+        utm_crs = utils.estimate_bounds_utm(
+                self.get_bbox().bounds, self.crs)
+        if utm_crs is not None:
+            transformer = Transformer.from_crs(
+                self.crs, utm_crs, always_xy=True)
+            output_mesh.vert2['coord'] = np.vstack(
+                transformer.transform(
+                    output_mesh.vert2['coord'][:, 0],
+                    output_mesh.vert2['coord'][:, 1]
+                    )).T
+            output_mesh.crs = utm_crs
+
+        return output_mesh
+
+
+    def _get_window_meshes(
+            self,
+            iter_windows: Iterable[rasterio.windows.Window],
+            marche: bool = False,
+            verbosity : Optional[bool] = None
+            ) -> List[pathlib.Path]:
+        """Calculate or reuse the size function mesh of each window
+
+        Parameters
+        ----------
+        iter_windows : iterable of rasterio.windows.Window
+            Windows for which the meshes are calculated.
+        marche : bool, default=False
+            Whether to run `marche` algorithm on the window size
+            function before meshing.
+        verbosity : bool or None, default=None
+            The verbosity of the output.
+
+        Returns
+        -------
+        list of pathlib.Path
+            Directories of the interpolated size function on the mesh
+            of each window, in the CRS of the raster, written by
+            `utils.msh_t_to_npy`. These are kept for reuse and must
+            not be modified.
+        """
+
+        self._check_window_msh_t()
 
-        output_mesh = jigsaw_msh_t()
-        output_mesh.ndims = +2
-        output_mesh.mshID = "euclidean-mesh"
-        output_mesh.crs = self.crs
+        window_paths = []
         for win in iter_windows:
+            win_key = win.flatten()
+            if win_key in self._window_msh_t:
+                win_marche, win_path = self._window_msh_t[win_key]
+                if win_marche == marche:
+                    _logger.debug(f'Reusing mesh of window {win_key}.')
+                    window_paths.append(win_path)
+                    continue
 
             hfun = jigsaw_msh_t()
             hfun.ndims = +2
@@ -450,46 +899,133 @@ class HfunRaster(BaseHfun, Raster):
                 window_mesh.crs = utm_crs
                 utils.reproject(window_mesh, self.crs)
 
+            win_path = pathlib.Path(self._window_msh_t_dir.name) / '_'.join(
+                str(i) for i in win_key)
+            utils.msh_t_to_npy(window_mesh, win_path)
+            del window_mesh
+            gc.collect()
+            self._window_msh_t[win_key] = (marche, win_path)
+            window_paths.append(win_path)
 
-            # combine with results from previous windows
-            output_mesh.tria3 = np.append(
-                output_mesh.tria3,
-                np.array([((idx + len(output_mesh.vert2)), tag)
-                          for idx, tag in window_mesh.tria3],
-                         dtype=jigsaw_msh_t.TRIA3_t),
-                axis=0)
-            output_mesh.vert2 = np.append(
-                output_mesh.vert2,
-                np.array(list(window_mesh.vert2),
-                         dtype=jigsaw_msh_t.VERT2_t),
-                axis=0)
-            if output_mesh.value.size:
-                output_mesh.value = np.append(
-                    output_mesh.value,
-                    np.array(list(window_mesh.value),
-                             dtype=jigsaw_msh_t.REALS_t),
-                    axis=0)
-            else:
-                output_mesh.value = np.array(
-                        list(window_mesh.value),
-                        dtype=jigsaw_msh_t.REALS_t)
+        return window_paths
 
-        # NOTE: In the end we need to return in a CRS that
-        # uses meters as units. UTM based on the center of
-        # the bounding box of the hfun is used
-        utm_crs = utils.estimate_bounds_utm(
-                self.get_bbox().bounds, self.crs)
-        if utm_crs is not None:
-            transformer = Transformer.from_crs(
-                self.crs, utm_crs, always_xy=True)
-            output_mesh.vert2['coord'] = np.vstack(
-                transformer.transform(
-                    output_mesh.vert2['coord'][:, 0],
-                    output_mesh.vert2['coord'][:, 1]
-                    )).T
-            output_mesh.crs = utm_crs
 
-        return output_mesh
+    def _get_stale_windows(
+            self,
+            marche: bool = False
+            ) -> List[rasterio.windows.Window]:
+        """Windows whose mesh needs to be calculated by `msh_t`
+
+        Parameters
+        ----------
+        marche : bool, default=False
+            Whether the meshes are calculated with `marche`.
+
+        Returns
+        -------
+        list of rasterio.windows.Window
+            Windows without a mesh for their current size values.
+        """
+
+        self._check_window_msh_t()
+        return [
+            win for win in self.iter_windows()
+            if self._window_msh_t.get(win.flatten(), (None,))[0] != marche]
+
+
+    def _check_window_msh_t(self) -> None:
+        """Discard the window meshes if the size function file changed
+
+        Parameters
+        ----------
+
+        Returns
+        -------
+        None
+        """
+
+        if self._window_msh_t_file != str(self._tmpfile):
+            self._window_msh_t = {}
+            self._window_msh_t_file = str(self._tmpfile)
+
+
+    def commit(self, nprocs: Optional[int] = None) -> Set[Tuple[int, ...]]:
+        """Apply all the queued refinements and added constraints
+
+        In deferred mode, apply all the queued refinements and then
+        the added constraints to the size function in a single pass
+        over the raster windows. In each window the size is the
+        minimum of the current value and all the queued refinements.
+        This method does nothing if there's nothing queued.
+
+        Parameters
+        ----------
+        nprocs : int or None, default=None
+            Number of processors to use in parallel sections of the
+            queued refinements. If 1, no process pool is created.
+
+        Returns
+        -------
+        set of tuple
+            Flattened windows that are updated.
+        """
+
+        if not self._is_pending():
+            return set()
+
+        updated = self._apply_queued(
+            self._constraints,
+            constrain_windows=self._get_windows_to_constrain(),
+            nprocs=nprocs)
+        self._applied_constraints = list(self._constraints)
+        self._modified_windows = set()
+
+        return updated
+
+
+    def _is_pending(self) -> bool:
+        """Whether there are refinements or constraints to commit
+
+        Parameters
+        ----------
+
+        Returns
+        -------
+        bool
+            `True` if `commit` needs to update the size function.
+        """
+
+        return bool(self._refinement_queue or self._constraints_pending)
+
+
+    @contextmanager
+    def _replaying_updates(
+            self,
+            updated: Set[Tuple[int, ...]]
+            ) -> Generator[None, None, None]:
+        """Context manager for replaying an update done in another process
+
+        The size function file is shared with the (forked) process
+        that committed the queue or applied the constraints, but the
+        state of this object needs to be updated to match. Within this
+        context the same call updates the state as usual, but the
+        windows are not calculated nor written again.
+
+        Parameters
+        ----------
+        updated : set of tuple
+            Flattened windows that are updated by the other process.
+
+        Yields
+        ------
+        None
+        """
+
+        self._replayed_updates = updated
+        try:
+            yield
+        finally:
+            self._replayed_updates = None
 
 
     def apply_added_constraints(self) -> None:
@@ -497,7 +1033,10 @@ class HfunRaster(BaseHfun, Raster):
 
         This method is implemented for internal use. It's public
         because it needs to be called from outside the class through
-        a decorator.
+        a decorator. In deferred mode the constraints are only
+        applied on `commit`. If the added constraints haven't changed
+        since they were last applied, they are only re-applied on the
+        windows modified by refinements since then.
 
         Parameters
         ----------
@@ -507,59 +1046,341 @@ class HfunRaster(BaseHfun, Raster):
         None
         """
 
-        self.apply_constraints(self._constraints)
+        if self._deferred:
+            self._constraints_pending = True
+            return
+
+        constrain_windows = self._get_windows_to_constrain()
+        if constrain_windows is not None and not self._constraints:
+            # Global hmin and hmax are already applied on refinement
+            self._modified_windows = set()
+            return
+
+        self._apply_queued(
+            self._constraints, constrain_windows=constrain_windows)
+        self._applied_constraints = list(self._constraints)
+        self._modified_windows = set()
 
 
     def apply_constraints(
             self,
-            constraint_list: Iterable[Constraint]
-            ) -> None:
+            constraint_list: Iterable[Constraint],
+            refined_only: bool = False,
+            nprocs: Optional[int] = None
+            ) -> Set[Tuple[int, ...]]:
         """Applies constraints specified by the list of contraint objects.
 
         Applies constraints from the provided list `constraint_list`,
         but doesn't not store them in the internal size function
-        constraint list. This is mostly for internal use.
+        constraint list. This is mostly for internal use. In deferred
+        mode any queued refinements are applied first in the same
+        pass over the raster windows.
 
         Parameters
         ----------
         constraint_list : iterable of Constraint
             List of constraint objects to be applied to (not stored in)
             the size function.
+        refined_only : bool, default=False
+            Whether to apply the constraints only on the windows
+            affected by the queued refinements, e.g. when the same
+            constraints are already applied on the rest of the windows.
+        nprocs : int or None, default=None
+            Number of processors to use in parallel sections of the
+            queued refinements. If 1, no process pool is created.
 
         Returns
         -------
-        None
+        set of tuple
+            Flattened windows that are updated.
         """
 
         # TODO: Validate conflicting constraints
 
-        # Apply constraints
-        with self.modifying_raster() as dst:
-            iter_windows = list(self.iter_windows())
-            tot = len(iter_windows)
+        has_queued = bool(self._refinement_queue)
+        updated = self._apply_queued(
+            constraint_list,
+            constrain_windows=set() if refined_only else None,
+            nprocs=nprocs)
+        if has_queued and self._constraints:
+            # Added constraints are not yet applied on the windows
+            # modified by the queued refinements
+            self._modified_windows.update(updated)
+            self._constraints_pending = True
 
-            for i, window in enumerate(iter_windows):
-                hfun_values = self.get_values(band=1, window=window)
-                rast_values = self.raster.get_values(band=1, window=window)
+        return updated
 
 
-                # Get locations
-                utm_crs = utils.estimate_bounds_utm(
-                        self.get_window_bounds(window), self.crs)
+    def _get_windows_to_constrain(self) -> Optional[Set[Tuple[int, ...]]]:
+        """Windows that need the added constraints to be re-applied
 
-                if utm_crs is not None:
-                    xy = self.get_xy_memcache(window, utm_crs)
-                else:
-                    # Technically it means that crs is not geographic!
-                    utm_crs = self.crs
-                    xy = self.get_xy(window)
+        Parameters
+        ----------
+
+        Returns
+        -------
+        set of tuple or None
+            Flattened windows modified since the constraints were last
+            applied or `None` if constraints have changed since, so
+            they need to be applied on all windows.
+        """
+
+        if self._applied_constraints != self._constraints:
+            return None
+        return self._modified_windows
 
 
-                # Apply custom constraints
+    def _apply_queued(
+            self,
+            constraint_list: Iterable[Constraint],
+            constrain_windows: Optional[Set[Tuple[int, ...]]] = None,
+            nprocs: Optional[int] = None
+            ) -> Set[Tuple[int, ...]]:
+        """Apply queued refinements and then the constraints in one pass
+
+        Parameters
+        ----------
+        constraint_list : iterable of Constraint
+            List of constraint objects to be applied after the queued
+            refinements.
+        constrain_windows : set of tuple or None, default=None
+            Flattened windows to apply the constraints on even if no
+            refinement modifies them. If `None` all windows are
+            constrained.
+        nprocs : int or None, default=None
+            Number of processors to use in parallel sections of the
+            queued refinements. If 1, no process pool is created.
+
+        Returns
+        -------
+        set of tuple
+            Flattened windows that are updated.
+        """
+
+        refinements = self._refinement_queue
+        self._refinement_queue = []
+        self._constraints_pending = False
+
+        nprocs = -1 if nprocs is None else nprocs
+        nprocs = cpu_count() if nprocs == -1 else nprocs
+        if not refinements or nprocs == 1:
+            return self._update_windows(
+                refinements, constraint_list, None, constrain_windows,
+                nprocs=nprocs)
+
+        _logger.debug(
+            f'Committing {len(refinements)} refinements'
+            f' using nprocs={nprocs}')
+        with Pool(processes=nprocs) as pool:
+            updated = self._update_windows(
+                refinements, constraint_list, pool, constrain_windows,
+                nprocs=nprocs)
+        pool.join()
+
+        return updated
+
+
+    def _apply_refinement(
+            self,
+            get_window_values: Callable[
+                [rasterio.windows.Window, Optional[Pool]],
+                Optional[npt.NDArray[float]]],
+            pool: Optional[Pool] = None
+            ) -> None:
+        """Apply or queue (in deferred mode) a refinement
+
+        Parameters
+        ----------
+        get_window_values : callable
+            Function that takes a window and a process pool and returns
+            the refinement sizes for that window, or `None` if the
+            refinement doesn't affect the window. Points not affected
+            by the refinement must have infinite size.
+        pool : Pool or None, default=None
+            Process pool to pass to `get_window_values` if the
+            refinement is applied immediately.
+
+        Returns
+        -------
+        None
+        """
+
+        if self._deferred:
+            self._refinement_queue.append(get_window_values)
+            return
+
+        self._modified_windows.update(
+            self._update_windows([get_window_values], [], pool, set()))
+
+
+    @contextmanager
+    def _updating_raster(
+            self
+            ) -> Generator[rasterio.io.DatasetWriter, None, None]:
+        """Context manager for modifying the size function file in place
+
+        Unlike `modifying_raster`, windows that are not written keep
+        their existing values, so unaffected windows can be skipped.
+
+        Yields
+        ------
+        rasterio.io.DatasetWriter
+            Handle to the size function file opened in update mode
+        """
+
+        self._initial_values_file = None
+        try:
+            with rasterio.open(self._tmpfile, 'r+') as dst:
+                yield dst
+        finally:
+            # Reopen to avoid reading stale cached blocks
+            self.src.close()
+            self._src = rasterio.open(self._tmpfile)
+
+
+    @contextmanager
+    def _kernel_threads(
+            self,
+            nprocs: Optional[int] = None
+            ) -> Generator[None, None, None]:
+        """Context manager for the thread pool of refinement kernels
+
+        The pool is created once and shared by all the windows of an
+        update. Within pool worker processes, which are already one
+        per CPU, the kernels run in the calling thread.
+
+        Parameters
+        ----------
+        nprocs : int or None, default=None
+            Number of threads. If `None` or -1 all the CPUs are used.
+
+        Yields
+        ------
+        None
+        """
+
+        nprocs = -1 if nprocs is None else nprocs
+        nprocs = cpu_count() if nprocs == -1 else nprocs
+        if current_process().daemon:
+            nprocs = 1
+        if nprocs == 1:
+            yield
+            return
+
+        with ThreadPool(processes=nprocs) as pool:
+            self._thread_pool = pool
+            self._nthreads = nprocs
+            try:
+                yield
+            finally:
+                self._thread_pool = None
+                self._nthreads = 1
+        pool.join()
+
+
+    def _update_windows(
+            self,
+            refinements: List[Callable[
+                [rasterio.windows.Window, Optional[Pool]],
+                Optional[npt.NDArray[float]]]],
+            constraint_list: Iterable[Constraint],
+            pool: Optional[Pool] = None,
+            constrain_windows: Optional[Set[Tuple[int, ...]]] = None,
+            nprocs: Optional[int] = None
+            ) -> Set[Tuple[int, ...]]:
+        """Update the size function raster window by window
+
+        For each window the size is calculated as the minimum of
+        the current value and the values of all `refinements`, then
+        the constraints in `constraint_list` and global `hmin` and
+        `hmax` are applied. Windows that are not affected by any of
+        the refinements and are not in `constrain_windows` are
+        skipped without reading or writing. Windows whose values
+        don't change are not written either. When replaying an update
+        done in another process, only the window meshes of the
+        updated windows are discarded.
+
+        Parameters
+        ----------
+        refinements : list of callable
+            Functions returning the refinement sizes for a window or
+            `None` if the window is not affected.
+        constraint_list : iterable of Constraint
+            List of constraint objects to be applied after refinements.
+        pool : Pool or None, default=None
+            Process pool to pass to the refinement functions.
+        constrain_windows : set of tuple or None, default=None
+            Flattened windows to constrain even if not affected by
+            refinements. If `None` all windows are constrained.
+        nprocs : int or None, default=None
+            Number of threads shared by the refinement kernels of all
+            the windows. If `None` or -1 all the CPUs are used, except
+            in pool worker processes where a single thread is used.
+
+        Returns
+        -------
+        set of tuple
+            Flattened windows that are updated.
+        """
+
+        if self._replayed_updates is not None:
+            updated = set(self._replayed_updates)
+            self._replayed_updates = None
+            for win_key in updated:
+                self._window_msh_t.pop(win_key, None)
+            # Reopen to avoid reading stale cached blocks
+            self.src.close()
+            self._src = rasterio.open(self._tmpfile)
+            return updated
+
+        constraint_list = list(constraint_list)
+        updated = set()
+        with self._updating_raster() as dst, self._kernel_threads(nprocs):
+            iter_windows = list(self.iter_windows())
+            tot = len(iter_windows)
+
+            for i, window in enumerate(iter_windows):
+                win_key = window.flatten()
+                refinement_values = [
+                    values for values in (
+                        get_window_values(window, pool)
+                        for get_window_values in refinements)
+                    if values is not None]
+                if not refinement_values and not (
+                        constrain_windows is None
+                        or win_key in constrain_windows):
+                    _logger.debug(f'Skipping window {i+1}/{tot}.')
+                    continue
+
                 _logger.debug(f'Processing window {i+1}/{tot}.')
-                for constraint in constraint_list:
-                    hfun_values = constraint.apply(
-                            rast_values, hfun_values, locations=xy, crs=utm_crs)
+                old_values = dst.read(1, window=window)
+                hfun_values = old_values.copy()
+                for values in refinement_values:
+                    hfun_values = np.minimum(hfun_values, values).astype(
+                        self.dtype(1))
+                del refinement_values
+
+                if constraint_list:
+                    rast_values = self.raster.get_values(
+                        band=1, window=window)
+
+                    # Get locations
+                    utm_crs = utils.estimate_bounds_utm(
+                            self.get_window_bounds(window), self.crs)
+
+                    if utm_crs is not None:
+                        xy = self.get_xy_memcache(window, utm_crs)
+                    else:
+                        # Technically it means that crs is not geographic!
+                        utm_crs = self.crs
+                        xy = self.get_xy(window)
+
+                    # Apply custom constraints
+                    for constraint in constraint_list:
+                        hfun_values = constraint.apply(
+                            rast_values, hfun_values,
+                            locations=xy, crs=utm_crs)
+                    del rast_values
 
                 # Apply global constraints
                 if self.hmin is not None:
@@ -567,10 +1388,20 @@ class HfunRaster(BaseHfun, Raster):
                 if self.hmax is not None:
                     hfun_values[hfun_values > self.hmax] = self.hmax
 
+                if np.array_equal(hfun_values, old_values):
+                    _logger.debug(f'Window {i+1}/{tot} is unchanged.')
+                    continue
+
+                _logger.info('Write array to file...')
+                start = time()
                 dst.write_band(1, hfun_values, window=window)
-                del rast_values
+                _logger.info(f'Write array to file took {time()-start}.')
+                updated.add(win_key)
+                self._window_msh_t.pop(win_key, None)
                 gc.collect()
 
+        return updated
+
 
     @apply_constraints_wrap
     def add_topo_bound_constraint(
@@ -890,50 +1721,70 @@ class HfunRaster(BaseHfun, Raster):
                 target_size=target_size,
                 nprocs=nprocs)
 
-        with self.modifying_raster(driver='GTiff') as dst:
-            iter_windows = list(self.iter_windows())
-            tot = len(iter_windows)
-            for i, window in enumerate(iter_windows):
-                _logger.debug(f'Processing window {i+1}/{tot}.')
-                # NOTE: We should NOT transform polygon, user just
-                # needs to make sure input polygon has the same CRS
-                # as the hfun (we don't calculate distances in this
-                # method)
+        self._apply_refinement(
+            lambda window, _: self._get_patch_window_values(
+                window, multipolygon, target_size))
 
-                _logger.info('Creating mask from shape ...')
-                start = time()
-                try:
-                    mask, _, _ = rasterio.mask.raster_geometry_mask(
-                        self.src, multipolygon.geoms,
-                        all_touched=True, invert=True)
-                    mask = mask[rasterio.windows.window_index(window)]
-
-                except ValueError:
-                    # If there's no overlap between the raster and
-                    # shapes then it throws ValueError, instead of
-                    # checking for intersection, if there's a value
-                    # error we assume there's no overlap
-                    _logger.debug(
-                        'Polygons don\'t intersect with the raster')
-                    continue
-                _logger.info(
-                    f'Creating mask from shape took {time()-start}.')
-
-                values = self.get_values(window=window).copy()
-                if mask.any():
-                    # NOTE: Don't continue, otherwise the final
-                    # destination file might end up being empty!
-                    values[mask] = target_size
-                if self.hmin is not None:
-                    values[np.where(values < self.hmin)] = self.hmin
-                if self.hmax is not None:
-                    values[np.where(values > self.hmax)] = self.hmax
-                values = np.minimum(self.get_values(window=window), values)
 
-                _logger.info('Write array to file...')
-                start = time()
-                dst.write_band(1, values, window=window)
-                _logger.info(f'Write array to file took {time()-start}.')
+    def _get_patch_window_values(
+            self,
+            window: rasterio.windows.Window,
+            multipolygon: MultiPolygon,
+            target_size: float
+            ) -> npt.NDArray[float]:
+        """Calculate fixed size patch refinement values for a window
+
+        Parameters
+        ----------
+        window : rasterio.windows.Window
+            The raster window for which sizes are calculated.
+        multipolygon : MultiPolygon
+            Shape of the region to use specified `target_size` for
+            refinement.
+        target_size : float
+            Fixed target size of mesh to use for refinement in
+            `multipolygon`
+
+        Returns
+        -------
+        np.ndarray or None
+            Refinement sizes of the window, infinite (before global
+            `hmin` and `hmax` are applied) outside the `multipolygon`,
+            or `None` if the window doesn't intersect `multipolygon`.
+        """
+
+        # NOTE: We should NOT transform polygon, user just
+        # needs to make sure input polygon has the same CRS
+        # as the hfun (we don't calculate distances in this
+        # method)
+        if not self._get_window_box(window).intersects(
+                box(*multipolygon.bounds)):
+            return None
+
+        _logger.info('Creating mask from shape ...')
+        start = time()
+        mask = geometry_mask(
+            multipolygon.geoms,
+            out_shape=(window.height, window.width),
+            transform=self.get_window_transform(window),
+            all_touched=True,
+            invert=True)
+        _logger.info(
+            f'Creating mask from shape took {time()-start}.')
+        if not mask.any():
+            _logger.debug('Polygons don\'t intersect with the window')
+            return None
+
+        values = np.full(
+            (window.height, window.width), np.inf, dtype=self.dtype(1))
+        values[mask] = target_size
+
+        if self.hmin is not None:
+            values[np.where(values < self.hmin)] = self.hmin
+        if self.hmax is not None:
+            values[np.where(values > self.hmax)] = self.hmax
+
+        return values
 
 
     @apply_constraints_wrap
@@ -995,7 +1846,7 @@ class HfunRaster(BaseHfun, Raster):
         for _level in level:
             # pylint: disable=R1724
 
-            _contours = self.raster.get_contour(_level)
+            _contours = contour_registry.get_contour(self.raster, _level)
             if isinstance(_contours, GeometryCollection):
                 continue
             elif isinstance(_contours, LineString):
@@ -1073,8 +1924,8 @@ class HfunRaster(BaseHfun, Raster):
         -----
         """
 
-        channels = self.raster.get_channels(
-                level=level, width=width, tolerance=tolerance)
+        channels = contour_registry.get_channels(
+                self.raster, level=level, width=width, tolerance=tolerance)
 
         if channels is None:
             return
@@ -1092,6 +1943,7 @@ class HfunRaster(BaseHfun, Raster):
             expansion_rate: float,
             target_size: Optional[float] = None,
             max_verts: int = 200,
+            engine: Literal['kdtree', 'edt'] = 'kdtree',
             *, # kwarg-only comes after this
             pool: Pool,
             ) -> None:
@@ -1115,6 +1967,15 @@ class HfunRaster(BaseHfun, Raster):
             Number of maximum vertices in a feature line that is
             passed to a separate process in parallel section of
             the algorithm.
+        engine : {'kdtree', 'edt'}, default='kdtree'
+            Method of calculating distances from the features. If
+            'kdtree', the resampled feature points are queried with
+            a tree for every raster point. If 'edt', the features
+            are rasterized on the raster grid and an exact Euclidean
+            distance transform is used, which is linear in the
+            number of raster points regardless of feature density.
+            The 'edt' engine needs a global `hmax` to limit the grid
+            around each window, otherwise 'kdtree' is used.
         pool : Pool
             Pre-created and initialized process pool to be used for
             parallel sections of the algorithm.
@@ -1123,6 +1984,11 @@ class HfunRaster(BaseHfun, Raster):
         -------
         None
 
+        Raises
+        ------
+        ValueError
+            If the specified `engine` is not supported.
+
         See Also
         --------
         add_contour :
@@ -1160,6 +2026,11 @@ class HfunRaster(BaseHfun, Raster):
                 f'Argument feature must be of type {LineString} or '
                 f'{MultiLineString}, not type {type(feature)}.')
 
+        if engine not in ('kdtree', 'edt'):
+            raise ValueError(
+                f'Argument engine must be \'kdtree\' or \'edt\','
+                f' not {engine}.')
+
         if isinstance(feature, LineString):
             feature = [feature]
 
@@ -1173,93 +2044,365 @@ class HfunRaster(BaseHfun, Raster):
                              'global hmin has been set.')
         if target_size <= 0:
             raise ValueError("Argument target_size must be greater than zero.")
-        with self.modifying_raster(driver='GTiff') as dst:
-            iter_windows = list(self.iter_windows())
-            tot = len(iter_windows)
-            for i, window in enumerate(iter_windows):
-                _logger.debug(f'Processing window {i+1}/{tot}.')
-                utm_crs = utils.estimate_bounds_utm(
-                        self.get_window_bounds(window), self.crs)
+        # Distance beyond which the size is capped by hmax
+        cutoff = None
+        if self.hmax:
+            cutoff = (self.hmax - target_size) / (expansion_rate * target_size)
+        elif engine == 'edt':
+            # Without cutoff the grid of each window would cover all
+            # the features, i.e. possibly the whole raster
+            _logger.info(
+                'No global hmax to limit distance transform grid,'
+                ' using kdtree engine instead.')
+            engine = 'kdtree'
+
+        feature_bounds = MultiLineString(feature).bounds
+        self._apply_refinement(
+            lambda window, pool: self._get_feature_window_values(
+                window, feature, feature_bounds, expansion_rate,
+                target_size, max_verts, engine, cutoff, pool),
+            pool)
+
+    def _get_feature_window_values(
+            self,
+            window: rasterio.windows.Window,
+            feature: List[LineString],
+            feature_bounds: Tuple[float, float, float, float],
+            expansion_rate: float,
+            target_size: float,
+            max_verts: int,
+            engine: Literal['kdtree', 'edt'],
+            cutoff: Optional[float],
+            pool: Optional[Pool]
+            ) -> Optional[npt.NDArray[float]]:
+        """Calculate feature refinement values for a window
 
-                _logger.info('Repartitioning features...')
-                start = time()
-                res = pool.starmap(
-                    utils.repartition_features,
-                    [(linestring, max_verts) for linestring in feature]
-                    )
-                win_feature = functools.reduce(operator.iconcat, res, [])
-                _logger.info(f'Repartitioning features took {time()-start}.')
-
-                _logger.info('Resampling features on ...')
-                start = time()
+        Parameters
+        ----------
+        window : rasterio.windows.Window
+            The raster window for which sizes are calculated.
+        feature : list of LineString
+            Feature lines in the CRS of the raster.
+        feature_bounds : tuple of float
+            Bounds of all the feature lines.
+        expansion_rate : float
+            Rate to use for expanding refinement with distance away
+            from the features.
+        target_size : float
+            Target size to use on the features.
+        max_verts : int
+            Number of maximum vertices in a feature line that is
+            passed to a separate process.
+        engine : {'kdtree', 'edt'}
+            Method of calculating distances from the features.
+        cutoff : float or None
+            Distance beyond which the distance is capped at `cutoff`.
+        pool : Pool or None
+            Process pool used by the 'kdtree' engine.
 
-                # We don't want to recreate the same transformation
-                # many times (it takes time) and we can't pass
-                # transformation object to subtask (cinit issue)
-                transformer = None
-                if utm_crs is not None:
-                    start2 = time()
-                    transformer = Transformer.from_crs(
-                        self.src.crs, utm_crs, always_xy=True)
-                    _logger.info(
-                            f"Transform creation took {time() - start2:f}")
-                    start2 = time()
-                    win_feature = [
-                        ops.transform(transformer.transform, linestring)
-                        for linestring in win_feature]
-                    _logger.info(
-                            f"Transform apply took {time() - start2:f}")
-
-                transformed_features = pool.starmap(
-                    utils.transform_linestring,
-                    [(linestring, target_size) for linestring in win_feature]
-                )
-                _logger.info(f'Resampling features took {time()-start}.')
-                _logger.info('Concatenating points...')
-                start = time()
-                points = []
-                for geom in transformed_features:
-                    if isinstance(geom, LineString):
-                        points.extend(geom.coords)
-                    elif isinstance(geom, MultiLineString):
-                        for linestring in geom.geoms:
-                            points.extend(linestring.coords)
-                _logger.info(f'Point concatenation took {time()-start}.')
-
-                _logger.info('Generating KDTree...')
-                start = time()
-                tree = cKDTree(np.array(points))
-                _logger.info(f'Generating KDTree took {time()-start}.')
-                if utm_crs is not None:
-                    xy = self.get_xy_memcache(window, utm_crs)
-                else:
-                    xy = self.get_xy(window)
+        Returns
+        -------
+        np.ndarray or None
+            Refinement sizes of the window or `None` if the window is
+            farther than `cutoff` from the features.
+        """
 
-                _logger.info(f'Transforming points took {time()-start}.')
-                _logger.info('Querying KDTree...')
-                start = time()
-                if self.hmax:
-                    r = (self.hmax - target_size) / (expansion_rate * target_size)
-                    near_dists, neighbors = tree.query(
-                        xy, workers=pool._processes, distance_upper_bound=r)
-                    distances = r * np.ones(len(xy))
-                    mask = np.logical_not(np.isinf(near_dists))
-                    distances[mask] = near_dists[mask]
-                else:
-                    distances, _ = tree.query(xy, workers=pool._processes)
-                _logger.info(f'Querying KDTree took {time()-start}.')
-                values = expansion_rate*target_size*distances + target_size
-                values = values.reshape(window.height, window.width).astype(
-                    self.dtype(1))
-                if self.hmin is not None:
-                    values[np.where(values < self.hmin)] = self.hmin
-                if self.hmax is not None:
-                    values[np.where(values > self.hmax)] = self.hmax
-                values = np.minimum(self.get_values(window=window), values)
-                _logger.info('Write array to file...')
-                start = time()
-                dst.write_band(1, values, window=window)
-                _logger.info(f'Write array to file took {time()-start}.')
+        utm_crs = utils.estimate_bounds_utm(
+                self.get_window_bounds(window), self.crs)
+
+        if cutoff is not None and not self._is_window_within_distance(
+                window, feature_bounds, cutoff, utm_crs):
+            _logger.debug('Features are beyond cutoff of the window')
+            return None
+
+        if engine == 'edt':
+            _logger.info('Calculating distance transform...')
+            start = time()
+            distances = self._get_feature_distances_edt(
+                window, feature, utm_crs, cutoff)
+            _logger.info(
+                f'Calculating distance transform took {time()-start}.')
+        else:
+            distances = self._get_feature_distances_kdtree(
+                window, feature, utm_crs, cutoff,
+                target_size, max_verts, pool)
+
+        values = expansion_rate*target_size*distances + target_size
+        values = values.reshape(window.height, window.width).astype(
+            self.dtype(1))
+        if self.hmin is not None:
+            values[np.where(values < self.hmin)] = self.hmin
+        if self.hmax is not None:
+            values[np.where(values > self.hmax)] = self.hmax
+
+        return values
+
+    def _get_window_box(self, window: rasterio.windows.Window) -> Polygon:
+        """Get the bounding box of the window in raster CRS
+
+        Parameters
+        ----------
+        window : rasterio.windows.Window
+            The raster window.
+
+        Returns
+        -------
+        Polygon
+            The box covering the window.
+        """
+
+        x0, y0, x1, y1 = self.get_window_bounds(window)
+        return box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+    def _is_window_within_distance(
+            self,
+            window: rasterio.windows.Window,
+            bounds: Tuple[float, float, float, float],
+            distance: float,
+            utm_crs: Optional[CRS]
+            ) -> bool:
+        """Check if the window might be within distance of the bounds
+
+        The check is conservative, i.e. it might return `True` for
+        windows slightly farther than `distance`, but never `False`
+        for windows within `distance` of the `bounds` box.
+
+        Parameters
+        ----------
+        window : rasterio.windows.Window
+            The raster window.
+        bounds : tuple of float
+            Bounds in raster CRS to calculate distance from.
+        distance : float
+            Distance in projected units.
+        utm_crs : CRS or None
+            Local projected CRS used for distance calculation in case
+            the raster CRS is geographic.
+
+        Returns
+        -------
+        bool
+            Whether the window is within `distance` of `bounds`.
+        """
+
+        win_bounds = self._get_window_box(window).bounds
+        if utm_crs is not None:
+            transformer = Transformer.from_crs(
+                self.crs, utm_crs, always_xy=True)
+            win_bounds = transformer.transform_bounds(
+                *win_bounds, densify_pts=21)
+            bounds = transformer.transform_bounds(*bounds, densify_pts=21)
+            if not np.all(np.isfinite([*win_bounds, *bounds])):
+                return True
+
+        return box(*win_bounds).distance(box(*bounds)) <= distance
+
+    def _get_feature_distances_kdtree(
+            self,
+            window: rasterio.windows.Window,
+            feature: List[LineString],
+            utm_crs: Optional[CRS],
+            cutoff: Optional[float],
+            target_size: float,
+            max_verts: int,
+            pool: Optional[Pool]
+            ) -> npt.NDArray[float]:
+        """Calculate distance of window points to features using KDTree
+
+        Resample the feature lines with `target_size` spacing in the
+        local projected CRS and query the nearest resampled point for
+        every point of the window.
+
+        Parameters
+        ----------
+        window : rasterio.windows.Window
+            The raster window for which distances are calculated.
+        feature : list of LineString
+            Feature lines in the CRS of the raster.
+        utm_crs : CRS or None
+            Local projected CRS used for distance calculation in case
+            the raster CRS is geographic.
+        cutoff : float or None
+            Distance beyond which the distance is capped at `cutoff`.
+        target_size : float
+            Spacing used for resampling the feature lines.
+        max_verts : int
+            Number of maximum vertices in a feature line that is
+            passed to a separate process.
+        pool : Pool or None
+            Process pool used for resampling and querying the tree. If
+            `None` everything is done in the current process.
+
+        Returns
+        -------
+        np.ndarray
+            Vector of distances of window points to the features,
+            ordered the same as `get_xy`.
+        """
+
+        starmap = pool.starmap if pool is not None else (
+            lambda func, args: list(itertools.starmap(func, args)))
+        workers = pool._processes if pool is not None else 1
+
+        _logger.info('Repartitioning features...')
+        start = time()
+        res = starmap(
+            utils.repartition_features,
+            [(linestring, max_verts) for linestring in feature]
+            )
+        win_feature = functools.reduce(operator.iconcat, res, [])
+        _logger.info(f'Repartitioning features took {time()-start}.')
+
+        _logger.info('Resampling features on ...')
+        start = time()
+
+        # We don't want to recreate the same transformation
+        # many times (it takes time) and we can't pass
+        # transformation object to subtask (cinit issue)
+        transformer = None
+        if utm_crs is not None:
+            start2 = time()
+            transformer = Transformer.from_crs(
+                self.src.crs, utm_crs, always_xy=True)
+            _logger.info(
+                    f"Transform creation took {time() - start2:f}")
+            start2 = time()
+            win_feature = [
+                ops.transform(transformer.transform, linestring)
+                for linestring in win_feature]
+            _logger.info(
+                    f"Transform apply took {time() - start2:f}")
+
+        transformed_features = starmap(
+            utils.transform_linestring,
+            [(linestring, target_size) for linestring in win_feature]
+        )
+        _logger.info(f'Resampling features took {time()-start}.')
+        _logger.info('Concatenating points...')
+        start = time()
+        points = []
+        for geom in transformed_features:
+            if isinstance(geom, LineString):
+                points.extend(geom.coords)
+            elif isinstance(geom, MultiLineString):
+                for linestring in geom.geoms:
+                    points.extend(linestring.coords)
+        _logger.info(f'Point concatenation took {time()-start}.')
+
+        _logger.info('Generating KDTree...')
+        start = time()
+        tree = cKDTree(np.array(points))
+        _logger.info(f'Generating KDTree took {time()-start}.')
+        if utm_crs is not None:
+            xy = self.get_xy_memcache(window, utm_crs)
+        else:
+            xy = self.get_xy(window)
+
+        _logger.info(f'Transforming points took {time()-start}.')
+        _logger.info('Querying KDTree...')
+        start = time()
+        if cutoff is not None:
+            near_dists, neighbors = tree.query(
+                xy, workers=workers, distance_upper_bound=cutoff)
+            distances = cutoff * np.ones(len(xy))
+            mask = np.logical_not(np.isinf(near_dists))
+            distances[mask] = near_dists[mask]
+        else:
+            distances, _ = tree.query(xy, workers=workers)
+        _logger.info(f'Querying KDTree took {time()-start}.')
+
+        return distances
+
+    def _get_feature_distances_edt(
+            self,
+            window: rasterio.windows.Window,
+            feature: List[LineString],
+            utm_crs: Optional[CRS],
+            cutoff: float
+            ) -> npt.NDArray[float]:
+        """Calculate distance of window points to features using EDT
+
+        Rasterize the feature lines onto the raster grid around the
+        window and calculate the exact Euclidean distance transform
+        of that grid in projected units. The grid is extended beyond
+        the window just enough to cover features within `cutoff`
+        distance of the window.
+
+        Parameters
+        ----------
+        window : rasterio.windows.Window
+            The raster window for which distances are calculated.
+        feature : list of LineString
+            Feature lines in the CRS of the raster.
+        utm_crs : CRS or None
+            Local projected CRS used for calculating grid spacing in
+            case the raster CRS is geographic.
+        cutoff : float
+            Distance beyond which features are ignored and the
+            distance is capped at `cutoff`.
+
+        Returns
+        -------
+        np.ndarray
+            Vector of distances of window points to the features,
+            ordered the same as `get_xy`.
+
+        Notes
+        -----
+        For geographic rasters the grid spacing is approximated by
+        the projected spacing at the center of the window, so the
+        distances deviate from the KDTree results for very large
+        windows.
+        """
+
+        x0, y0, x1, y1 = self.get_window_bounds(window)
+        dx = abs(x1 - x0) / window.width
+        dy = abs(y1 - y0) / window.height
+        if utm_crs is not None:
+            xc, yc = (x0 + x1) / 2, (y0 + y1) / 2
+            transformer = Transformer.from_crs(
+                self.crs, utm_crs, always_xy=True)
+            xs, ys = transformer.transform([x0, x1, xc, xc], [yc, yc, y0, y1])
+            dx = np.hypot(xs[1] - xs[0], ys[1] - ys[0]) / window.width
+            dy = np.hypot(xs[3] - xs[2], ys[3] - ys[2]) / window.height
+
+        # Grid extent in pixels relative to the window origin: union
+        # of window and features, limited to the cutoff padding.
+        # Corners are used so that the raster orientation doesn't matter
+        win_transform = self.get_window_transform(window)
+        fx0, fy0, fx1, fy1 = MultiLineString(feature).bounds
+        cols, rows = ~win_transform * (
+            np.array([fx0, fx1, fx1, fx0]), np.array([fy0, fy0, fy1, fy1]))
+        row_lo = min(0, int(np.floor(np.min(rows))))
+        col_lo = min(0, int(np.floor(np.min(cols))))
+        row_hi = max(window.height, int(np.ceil(np.max(rows))) + 1)
+        col_hi = max(window.width, int(np.ceil(np.max(cols))) + 1)
+        pad_rows = int(np.ceil(cutoff / dy))
+        pad_cols = int(np.ceil(cutoff / dx))
+        row_lo = max(row_lo, -pad_rows)
+        col_lo = max(col_lo, -pad_cols)
+        row_hi = min(row_hi, window.height + pad_rows)
+        col_hi = min(col_hi, window.width + pad_cols)
+
+        is_feature = rasterize(
+            [(linestring, 1) for linestring in feature],
+            out_shape=(row_hi - row_lo, col_hi - col_lo),
+            transform=win_transform * Affine.translation(col_lo, row_lo),
+            fill=0,
+            all_touched=True,
+            dtype=np.uint8).astype(bool)
+
+        if not is_feature.any():
+            return np.full(window.width * window.height, cutoff)
+
+        distances = distance_transform_edt(
+            np.logical_not(is_feature), sampling=(dy, dx))
+        distances = distances[
+            -row_lo:window.height - row_lo,
+            -col_lo:window.width - col_lo]
+        distances[distances > cutoff] = cutoff
+
+        return distances.ravel()
 
     def get_xy_memcache(
             self,
@@ -1270,7 +2413,9 @@ class HfunRaster(BaseHfun, Raster):
 
         Get the locations of raster points in the `dst_crs` CRS.
         This method caches these transformed values for fast retrieval
-        upon multiple calls.
+        upon multiple calls. The values are stored in the module level
+        `xy_cache`, which is bounded in size and shared between size
+        functions on the same raster grid.
 
         Parameters
         ----------
@@ -1288,28 +2433,11 @@ class HfunRaster(BaseHfun, Raster):
         --------
         get_xy :
             Get the locations of raster points from the raster file.
+        ProjectedXYCache :
+            Shared cache of the projected locations.
         """
 
-        tmpfile = self._xy_cache.get(f'{window}{dst_crs}')
-        if tmpfile is None:
-            _logger.info('Transform points to local CRS...')
-            transformer = Transformer.from_crs(
-                self.src.crs, dst_crs, always_xy=True)
-            # pylint: disable=R1732
-            tmpfile = tempfile.NamedTemporaryFile()
-            xy = self.get_xy(window)
-            fp = np.memmap(tmpfile, dtype='float32', mode='w+', shape=xy.shape)
-            fp[:] = np.vstack(
-                transformer.transform(xy[:, 0], xy[:, 1])).T
-            _logger.info('Saving values to memcache...')
-            fp.flush()
-            _logger.info('Done!')
-            self._xy_cache[f'{window}{dst_crs}'] = tmpfile
-            return fp[:]
-
-        _logger.info('Loading values from memcache...')
-        return np.memmap(tmpfile, dtype='float32', mode='r',
-                         shape=((window.width*window.height), 2))[:]
+        return xy_cache.get(self, window, dst_crs)
 
     @apply_constraints_wrap
     def add_subtidal_flow_limiter(
@@ -1367,72 +2495,103 @@ class HfunRaster(BaseHfun, Raster):
         where :math:`z` is the elevation and :math:`h` is the value of
         the mesh size. This refinement is not applied wherever the
         magnitude of the gradient of topography is equal to zero.
+
+        The gradient is calculated using central differences, including
+        on the window boundaries where the neighboring window values are
+        used, so that the windowed and non-windowed results match.
         """
 
         hmin = float(hmin) if hmin is not None else hmin
         hmax = float(hmax) if hmax is not None else hmax
 
-        with self.modifying_raster() as dst:
+        self._apply_refinement(
+            lambda window, _: self._get_subtidal_flow_limiter_window_values(
+                window, hmin, hmax, lower_bound, upper_bound))
 
-            iter_windows = list(self.iter_windows())
-            tot = len(iter_windows)
+    def _get_subtidal_flow_limiter_window_values(
+            self,
+            window: rasterio.windows.Window,
+            hmin: Optional[float],
+            hmax: Optional[float],
+            lower_bound: Optional[float],
+            upper_bound: Optional[float]
+            ) -> npt.NDArray[float]:
+        """Calculate topography based refinement values for a window
 
-            for i, window in enumerate(iter_windows):
+        Parameters
+        ----------
+        window : rasterio.windows.Window
+            The raster window for which sizes are calculated.
+        hmin : float or None
+            Minimum mesh size in the refinement
+        hmax : float or None
+            Maximum mesh size in the refinement
+        lower_bound : float or None
+            Lower limit of the cut-off elevation for the refinement.
+        upper_bound : float or None
+            Higher limit of the cut-off elevation for the refinement.
 
-                _logger.debug(f'Processing window {i+1}/{tot}.')
+        Returns
+        -------
+        np.ndarray or None
+            Refinement sizes of the window, infinite (before global
+            `hmin` and `hmax` are applied) outside the bounds or
+            where the gradient of topography is zero, or `None` if
+            no elevation is within the bounds.
+        """
 
-                x0, y0, x1, y1 = self.get_window_bounds(window)
-                utm_crs = utils.estimate_bounds_utm(
-                        (x0, y0, x1, y1), self.crs)
-                if utm_crs is not None:
-                    transformer = Transformer.from_crs(
-                            self.crs, utm_crs, always_xy=True)
-                    (x0, x1), (y0, y1) = transformer.transform(
-                            [x0, x1], [y0, y1])
-                    dx = np.diff(np.linspace(x0, x1, window.width))[0]
-                    dy = np.diff(np.linspace(y0, y1, window.height))[0]
-                else:
-                    dx = self.dx
-                    dy = self.dy
-                topobathy = self.raster.get_values(band=1, window=window)
-                dx, dy = np.gradient(topobathy, dx, dy)
-                with warnings.catch_warnings():
-                    # in case self._src.values is a masked array
-                    warnings.simplefilter("ignore", category=RuntimeWarning)
-                    dh = np.sqrt(dx**2 + dy**2)
-                dh = np.ma.masked_equal(dh, 0.)
-                hfun_values = np.abs((1./3.)*(topobathy/dh))
-                # values = values.filled(np.max(values))
-
-                if hmin is not None:
-                    hfun_values[np.where(hfun_values < hmin)] = hmin
-
-                if hmax is not None:
-                    hfun_values[np.where(hfun_values > hmax)] = hmax
-
-                # Don't consider the applied values in the region
-                # outside the provided bounds
-                if upper_bound is not None:
-                    idxs = np.where(topobathy > upper_bound)
-                    hfun_values[idxs] = self.get_values(
-                        band=1, window=window)[idxs]
-                if lower_bound is not None:
-                    idxs = np.where(topobathy < lower_bound)
-                    hfun_values[idxs] = self.get_values(
-                        band=1, window=window)[idxs]
-
-
-                # Apply global hmin and hmax
-                if self._hmin is not None:
-                    hfun_values[np.where(hfun_values < self._hmin)] = self._hmin
-                if self._hmax is not None:
-                    hfun_values[np.where(hfun_values > self._hmax)] = self._hmax
-
-                hfun_values = np.minimum(
-                    self.get_values(band=1, window=window),
-                    hfun_values).astype(
-                    self.dtype(1))
-                dst.write_band(1, hfun_values, window=window)
+        zmin, zmax = self._get_window_elevation_range(window)
+        if ((lower_bound is not None and not zmax >= lower_bound)
+                or (upper_bound is not None and not zmin <= upper_bound)):
+            return None
+
+        x0, y0, x1, y1 = self.get_window_bounds(window)
+        utm_crs = utils.estimate_bounds_utm(
+                (x0, y0, x1, y1), self.crs)
+        if utm_crs is not None:
+            transformer = Transformer.from_crs(
+                    self.crs, utm_crs, always_xy=True)
+            (x0, x1), (y0, y1) = transformer.transform(
+                    [x0, x1], [y0, y1])
+        dx = abs(x1 - x0) / window.width
+        dy = abs(y1 - y0) / window.height
+
+        # Read with one pixel halo (where available) so that the
+        # gradients on window edges are the same as the neighbor's
+        row_lo = max(window.row_off - 1, 0)
+        col_lo = max(window.col_off - 1, 0)
+        row_hi = min(window.row_off + window.height + 1, self.raster.height)
+        col_hi = min(window.col_off + window.width + 1, self.raster.width)
+        topobathy = self.raster.get_values(
+            band=1,
+            window=rasterio.windows.Window(
+                col_lo, row_lo, col_hi - col_lo, row_hi - row_lo))
+
+        def _or_inf(value, sign=1):
+            return sign * np.inf if value is None else float(value)
+
+        topobathy = np.asarray(topobathy, dtype=np.float64)
+        values = np.empty((window.height, window.width), dtype=np.float32)
+        limits = (
+            _or_inf(hmin, -1), _or_inf(hmax),
+            _or_inf(lower_bound, -1), _or_inf(upper_bound),
+            _or_inf(self._hmin, -1), _or_inf(self._hmax))
+
+        # Calculate bands of rows in the shared threads
+        nbands = min(self._nthreads, window.height)
+        band_rows = np.linspace(0, window.height, nbands + 1).astype(int)
+        band_args = [
+            (topobathy, dx, dy,
+             window.row_off - row_lo, window.col_off - col_lo,
+             values, row_start, row_end, *limits)
+            for row_start, row_end in zip(band_rows[:-1], band_rows[1:])]
+        if self._thread_pool is None:
+            for args in band_args:
+                _subtidal_flow_limiter_kernel(*args)
+        else:
+            self._thread_pool.starmap(_subtidal_flow_limiter_kernel, band_args)
+
+        return values
 
     @apply_constraints_wrap
     def add_constant_value(
@@ -1480,25 +2639,81 @@ class HfunRaster(BaseHfun, Raster):
         upper_bound = float('inf') if upper_bound is None \
             else float(upper_bound)
 
-        with self.modifying_raster() as dst:
+        self._apply_refinement(
+            lambda window, _: self._get_constant_value_window_values(
+                window, value, lower_bound, upper_bound))
 
-            iter_windows = list(self.iter_windows())
-            tot = len(iter_windows)
+    def _get_constant_value_window_values(
+            self,
+            window: rasterio.windows.Window,
+            value: float,
+            lower_bound: float,
+            upper_bound: float
+            ) -> npt.NDArray[float]:
+        """Calculate fixed value refinement values for a window
 
-            for i, window in enumerate(iter_windows):
+        Parameters
+        ----------
+        window : rasterio.windows.Window
+            The raster window for which sizes are calculated.
+        value : float
+            Fixed value to use for refinement size
+        lower_bound : float
+            Lower limit of the cut-off elevation for region to apply
+            the fixed `value`.
+        upper_bound : float
+            Higher limit of the cut-off elevation for region to apply
+            the fixed `value`.
 
-                _logger.debug(f'Processing window {i+1}/{tot}.')
-                hfun_values = self.get_values(band=1, window=window)
-                rast_values = self.raster.get_values(band=1, window=window)
-                hfun_values[np.where(np.logical_and(
-                    rast_values > lower_bound,
-                    rast_values < upper_bound))] = value
-                hfun_values = np.minimum(
-                    self.get_values(band=1, window=window),
-                    hfun_values.astype(self.dtype(1)))
-                dst.write_band(1, hfun_values, window=window)
-                del rast_values
-                gc.collect()
+        Returns
+        -------
+        np.ndarray or None
+            Refinement sizes of the window, infinite outside the
+            bounds, or `None` if no elevation is within the bounds.
+        """
+
+        zmin, zmax = self._get_window_elevation_range(window)
+        if not (zmax > lower_bound and zmin < upper_bound):
+            return None
+
+        rast_values = self.raster.get_values(band=1, window=window)
+        hfun_values = np.full(
+            rast_values.shape, np.inf, dtype=self.dtype(1))
+        hfun_values[np.where(np.logical_and(
+            rast_values > lower_bound,
+            rast_values < upper_bound))] = value
+
+        return hfun_values
+
+    def _get_window_elevation_range(
+            self,
+            window: rasterio.windows.Window
+            ) -> Tuple[float, float]:
+        """Get the cached minimum and maximum elevation of the window
+
+        The range is calculated from the input raster once per window
+        and reused by all the elevation based refinements.
+
+        Parameters
+        ----------
+        window : rasterio.windows.Window
+            The raster window.
+
+        Returns
+        -------
+        tuple of float
+            Minimum and maximum of the finite elevation values in the
+            window, or `(inf, -inf)` if there's no finite value.
+        """
+
+        key = (str(self.raster.tmpfile), window.flatten())
+        if key not in self._window_ranges:
+            values = self.raster.get_values(band=1, window=window)
+            values = values[np.isfinite(values)]
+            self._window_ranges[key] = (
+                (float(np.min(values)), float(np.max(values)))
+                if values.size else (np.inf, -np.inf))
+        return self._window_ranges[key]
 
     @property
     def raster(self):
@@ -1518,6 +2733,22 @@ class HfunRaster(BaseHfun, Raster):
 
         return self._hmax
 
+    @property
+    def deferred(self):
+        """Modifiable attribute for queueing refinements until commit
+
+        Turning off the deferred mode commits all the queued
+        refinements.
+        """
+
+        return self._deferred
+
+    @deferred.setter
+    def deferred(self, deferred: bool):
+        self._deferred = bool(deferred)
+        if not self._deferred:
+            self.commit()
+
     @property
     def verbosity(self):
         """Modifiable attribute for the verbosity of the output"""
@@ -1,13 +1,17 @@
-from ocsmesh.ops.combine_geom import GeomCombine
+from ocsmesh.ops.combine_geom import GeomCombine, PatchCombine
 from ocsmesh.ops.combine_hfun import HfunCombine
 
 def combine_geometry(*args, **kwargs):
     return GeomCombine(*args, **kwargs).run()
 
+def combine_patches(*args, **kwargs):
+    return PatchCombine(*args, **kwargs).run()
+
 def combine_hfun(*args, **kwargs):
     return HfunCombine(*args, **kwargs).run()
 
 __all__ = [
         "combine_geometry",
+        "combine_patches",
         "combine_hfun"
 ]
@@ -1,31 +1,33 @@
 import gc
 import logging
-from multiprocessing import Pool, Lock, cpu_count
+from multiprocessing import Pool, cpu_count
 import os
 import pathlib
 import tempfile
 import warnings
-from typing import Union, Sequence, Tuple, List
+from typing import Union, Sequence, Tuple, List, Dict, Any
 
-import pandas as pd
 import geopandas as gpd
 import numpy as np
 from pyproj import CRS, Transformer
+from rasterio.transform import array_bounds
+from rasterio.warp import calculate_default_transform
 from shapely import ops
 from shapely.geometry import box, Polygon, MultiPolygon, LinearRing
-from shapely.validation import explain_validity
+from shapely.strtree import STRtree
 
 from jigsawpy import jigsaw_msh_t, savemsh, savevtk
 
+from ocsmesh import utils
 from ocsmesh.raster import Raster
 from ocsmesh.mesh.mesh import Mesh
+from ocsmesh.cache import contour_registry
 
 
 _logger = logging.getLogger(__name__)
 
 class GeomCombine:
 
-    _base_mesh_lock = Lock()
     def __init__(
             self,
             dem_files: Union[None, Sequence[Union[str, os.PathLike]]],
@@ -162,6 +164,7 @@ class GeomCombine:
             z_info['zmax'] = zmax
 
         poly_files_coll = []
+        dem_box_coll = []
         _logger.info(f"Number of processes: {nprocs}")
         with tempfile.TemporaryDirectory(dir=out_dir) as temp_dir, \
                 tempfile.NamedTemporaryFile() as base_file:
@@ -180,37 +183,41 @@ class GeomCombine:
             # the last input has the highest priority
             # (i.e. lowest priority number)
             priorities = list((range(len(dem_files))))[::-1]
-            # TODO: Needs some code refinement for bbox issue
-#            priority_args = []
-#            for priority, dem_file in zip(priorities, dem_files):
-#                priority_args.append(
-#                    (priority, temp_dir, dem_file, chunk_size, overlap))
-#
-#            with Pool(processes=nprocs) as p:
-#                p.starmap(self._process_priority, priority_args)
-#            p.join()
+            pri_covers = self._process_priority(dem_files)
 
             _logger.info("Processing DEM contours ...")
             # Process contours
             if nprocs > 1:
                 parallel_args = []
-                for priority, dem_file in zip(priorities, dem_files):
+                for priority, dem_file, pri_cover in zip(
+                        priorities, dem_files, pri_covers):
                     parallel_args.append(
                         (base_mesh_path, temp_dir,
                          priority, dem_file,
-                         z_info, chunk_size, overlap))
+                         z_info, chunk_size, overlap, pri_cover))
                 with Pool(processes=nprocs) as p:
-                    poly_files_coll.extend(
-                        p.starmap(
+                    for poly_file, dem_box in p.starmap(
                             self._parallel_get_polygon_worker,
-                            parallel_args))
+                            parallel_args):
+                        poly_files_coll.append(poly_file)
+                        dem_box_coll.append(dem_box)
                 p.join()
             else:
-                poly_files_coll.extend(
-                    self._serial_get_polygon(
-                        base_mesh_path, temp_dir,
-                        priorities, dem_files,
-                        z_info, chunk_size, overlap))
+                poly_files, dem_boxes = self._serial_get_polygon(
+                    base_mesh_path, temp_dir,
+                    priorities, dem_files,
+                    z_info, chunk_size, overlap, pri_covers)
+                poly_files_coll.extend(poly_files)
+                dem_box_coll.extend(dem_boxes)
+
+            # The base mesh polygon is not used if ignored
+            if base_mesh_path is not None and not ignore_mesh:
+                _logger.info("Subtract DEM bounds from base mesh polygons...")
+                base_mult_poly = self._subtract_dem_boxes(
+                    self._read_multipolygon(base_mesh_path),
+                    [i for i in dem_box_coll if i])
+                self._multipolygon_to_disk(base_mesh_path, base_mult_poly)
+                base_mult_poly = None
 
 
             _logger.info("Generating final boundary polygon...")
@@ -220,25 +227,11 @@ class GeomCombine:
             if base_mesh_path is not None and not ignore_mesh:
                 poly_files_coll.append(base_mesh_path)
 
-            rasters_gdf = gpd.GeoDataFrame(
-                    columns=['geometry'],
-                    crs=self._calc_crs
-                )
-            for feather_f in poly_files_coll:
-                rasters_gdf = pd.concat(
-                    [
-                        rasters_gdf,
-                        gpd.GeoDataFrame(
-                            {'geometry': self._read_multipolygon(feather_f).geoms},
-                            crs=self._calc_crs
-                        ),
-                    ],
-                    ignore_index=True
-                )
-
-
             # The assumption is this returns polygon or multipolygon
-            fin_mult_poly = rasters_gdf.unary_union
+            fin_mult_poly = utils.partitioned_unary_union(
+                (list(self._read_multipolygon(feather_f).geoms)
+                 for feather_f in poly_files_coll),
+                nprocs=nprocs)
             _logger.info("Done")
 
 
@@ -246,8 +239,8 @@ class GeomCombine:
         # is None
         if fin_mult_poly:
             # Get a clean multipolygon to write to output
-            # Is this necessary? It can be expensive if geom is not valid
-            fin_mult_poly = self._get_valid_multipolygon(fin_mult_poly)
+            fin_mult_poly = self._get_valid_multipolygon(
+                fin_mult_poly, nprocs)
 
             self._write_to_file(
                     out_format, out_file, fin_mult_poly, out_crs)
@@ -256,20 +249,14 @@ class GeomCombine:
 
     def _get_valid_multipolygon(
             self,
-            polygon: Union[Polygon, MultiPolygon]
+            polygon: Union[Polygon, MultiPolygon],
+            nprocs: int = 1
             ) -> MultiPolygon:
 
-        if not polygon.is_valid:
-            polygon = ops.unary_union(polygon)
-
-            if not polygon.is_valid:
-                polygon = polygon.buffer(0)
-
-            if not polygon.is_valid:
-                raise ValueError(explain_validity(polygon))
-
-        if isinstance(polygon, Polygon):
-            polygon = MultiPolygon([polygon])
+        # Only the invalid member polygons are repaired
+        polygon, n_fixed = utils.repair_multipolygon(polygon, nprocs)
+        if n_fixed:
+            _logger.info(f"Repaired {n_fixed} invalid polygons")
 
         return polygon
 
@@ -319,27 +306,61 @@ class GeomCombine:
 
     def _process_priority(
             self,
-            priority: int,
-            temp_dir: Union[str, os.PathLike],
-            dem_path: Union[str, os.PathLike],
-            chunk_size: Union[int, None] = None,
-            overlap: Union[int, None] = None):
+            dem_files: Sequence[Union[str, os.PathLike]],
+            dem_boxes: Sequence[Union[Polygon, None]] = None
+            ) -> List[Union[Polygon, MultiPolygon, None]]:
+
+        '''Get the area of each DEM covered by higher priority DEMs'''
+
+        # NOTE: The last input has the highest priority
+        if dem_boxes is None:
+            dem_boxes = [
+                self._get_dem_box(dem_path) for dem_path in dem_files]
+        valid_idx = [i for i, dem_box in enumerate(dem_boxes) if dem_box]
+        if not valid_idx:
+            return [None] * len(dem_files)
+
+        tree = STRtree([dem_boxes[i] for i in valid_idx])
+        pri_covers = []
+        for i, dem_box in enumerate(dem_boxes):
+            if dem_box is None:
+                pri_covers.append(None)
+                continue
+            higher_boxes = [
+                dem_boxes[valid_idx[j]]
+                for j in tree.query(dem_box, predicate='intersects')
+                if valid_idx[j] > i]
+            pri_covers.append(
+                ops.unary_union(higher_boxes) if higher_boxes else None)
 
-        rast = Raster(
-                dem_path,
-                chunk_size=chunk_size,
-                overlap=overlap)
-        # Can cause issue with bbox(?)
-        if not self._calc_crs.equals(rast.crs):
-            rast.warp(dst_crs=self._calc_crs)
+        return pri_covers
 
-        pri_dt_path = (
-            pathlib.Path(temp_dir) / f'dem_priority_{priority}.feather')
 
-        pri_mult_poly = MultiPolygon([box(*rast.src.bounds)])
+    def _get_dem_box(
+            self,
+            dem_path: Union[str, os.PathLike]
+            ) -> Union[Polygon, None]:
+
+        '''Get DEM bounding box in calculation CRS without warping'''
 
-        self._multipolygon_to_disk(
-                pri_dt_path, pri_mult_poly)
+        if not pathlib.Path(dem_path).is_file():
+            return None
+
+        rast = Raster(dem_path)
+        bounds = rast.src.bounds
+        if not self._calc_crs.equals(rast.crs):
+            # Same bounds as the warped raster, see `Raster.warp`
+            transform, width, height = calculate_default_transform(
+                rast.src.crs,
+                self._calc_crs.srs,
+                rast.src.width,
+                rast.src.height,
+                *rast.src.bounds,
+                dst_width=rast.src.width,
+                dst_height=rast.src.height)
+            bounds = array_bounds(height, width, transform)
+
+        return box(*bounds)
 
 
     def _serial_get_polygon(
@@ -350,14 +371,20 @@ class GeomCombine:
             dem_files: Sequence[Union[str, os.PathLike]],
             z_info: dict = None,
             chunk_size: Union[int, None] = None,
-            overlap: Union[int, None] = None):
+            overlap: Union[int, None] = None,
+            pri_covers: Sequence[
+                Union[Polygon, MultiPolygon, None]] = None):
 
         if z_info is None:
             z_info = {}
+        if pri_covers is None:
+            pri_covers = [None] * len(dem_files)
 
         _logger.info("Getting DEM info")
         poly_coll = []
-        for priority, dem_path in zip(priorities, dem_files):
+        box_coll = []
+        for i_dem, (priority, dem_path) in enumerate(
+                zip(priorities, dem_files)):
             _logger.info(f"Processing {dem_path} ...")
             if not pathlib.Path(dem_path).is_file():
                 warnings.warn(f"File {dem_path} not found!")
@@ -389,69 +416,31 @@ class GeomCombine:
                     rast.clip(self._base_exterior)
                     rast_box = box(*rast.src.bounds)
 
+            # Processing DEM priority
+            pri_cover = pri_covers[i_dem]
+            if pri_cover is not None and rast_box.within(pri_cover):
+                _logger.info(f"{dem_path} is ignored due to priority...")
+                continue
+
             # Processing raster
             _logger.info("Creating geom from raster...")
 
             _logger.info("Getting polygons from geom...")
-            geom_mult_poly = rast.get_multipolygon(**z_info)
+            if (pri_cover is not None
+                    and rast_box.intersection(pri_cover).area > 0):
+                _logger.info(f"{dem_path} needs clipping by priority...")
+                geom_mult_poly = self._get_uncovered_multipolygon(
+                    rast, rast_box.difference(pri_cover), z_info)
+            else:
+                geom_mult_poly = contour_registry.get_multipolygon(
+                    rast, **z_info)
             geom_mult_poly = self._get_valid_multipolygon(
                     geom_mult_poly)
 
+            # NOTE: DEM bounds are subtracted from base mesh polygons
+            # all at once after all DEMs are processed
             if base_mesh_path is not None:
-                _logger.info("Subtract DEM bounds from base mesh polygons...")
-                self._base_mesh_lock.acquire()
-                try:
-                    # Get a valid multipolygon from disk
-                    base_mult_poly = self._read_multipolygon(
-                            base_mesh_path)
-
-                    # Get valid multipolygon after operation and write
-                    base_mult_poly = base_mult_poly.difference(
-                            rast_box)
-                    self._multipolygon_to_disk(
-                            base_mesh_path, base_mult_poly)
-
-                finally:
-                    self._base_mesh_lock.release()
-
-            # TODO: Needs some code refinement due to bbox
-            # Processing DEM priority
-#            priority_geodf = gpd.GeoDataFrame(
-#                    columns=['geometry'],
-#                    crs=self._calc_crs)
-#            for p in range(priority):
-#                higher_pri_path = (
-#                    pathlib.Path(temp_dir) / f'dem_priority_{p}.feather')
-#
-#                if higher_pri_path.is_file():
-#                    priority_geodf = priority_geodf.append(
-#                             self._read_to_geodf(higher_pri_path))
-#
-#            if len(priority_geodf):
-#                op_res = priority_geodf.unary_union
-#                pri_mult_poly = MultiPolygon()
-#                if isinstance(op_res, MultiPolygon):
-#                    pri_mult_poly = op_res
-#                else:
-#                    pri_mult_poly = MultiPolygon([op_res])
-#
-#
-#                if rast_box.within(pri_mult_poly):
-#                    _logger.info(
-#                        f"{dem_path} is ignored due to priority...")
-#                    continue
-#
-#                if rast_box.intersects(pri_mult_poly):
-#                    _logger.info(
-#                        f"{dem_path} needs clipping by priority...")
-#
-#                    # Clipping raster can cause problem at
-#                    # boundaries due to difference in pixel size
-#                    # between high and low resolution rasters
-#                    # so instead we operate on extracted polygons
-#                    geom_mult_poly = geom_mult_poly.difference(
-#                            pri_mult_poly)
-
+                box_coll.append(rast_box)
 
             # Write geometry multipolygon to disk
             temp_path = (
@@ -468,7 +457,7 @@ class GeomCombine:
             del geom_mult_poly
             gc.collect(2)
 
-        return poly_coll
+        return poly_coll, box_coll
 
 
     def _parallel_get_polygon_worker(
@@ -479,17 +468,81 @@ class GeomCombine:
             dem_file: Union[str, os.PathLike],
             z_info: dict = None,
             chunk_size: Union[int, None] = None,
-            overlap: Union[int, None] = None):
+            overlap: Union[int, None] = None,
+            pri_cover: Union[Polygon, MultiPolygon, None] = None):
 
         if z_info is None:
             z_info = {}
 
-        poly_coll_files = self._serial_get_polygon(
+        poly_coll_files, box_coll = self._serial_get_polygon(
             base_mesh_path, temp_dir, [priority], [dem_file],
-            z_info, chunk_size, overlap)
+            z_info, chunk_size, overlap, [pri_cover])
 
         # Only one item passed to serial code at most
-        return poly_coll_files[0] if poly_coll_files else None
+        return (
+            poly_coll_files[0] if poly_coll_files else None,
+            box_coll[0] if box_coll else None)
+
+
+    def _get_uncovered_multipolygon(
+            self,
+            rast: Raster,
+            footprint: Union[Polygon, MultiPolygon],
+            z_info: dict
+            ) -> MultiPolygon:
+
+        '''Get DEM polygons only within its uncovered footprint'''
+
+        # Only the windows that are not fully covered by higher
+        # priority DEMs are read. Since the extracted polygons extend
+        # to the window bounds, they're clipped exactly to the
+        # footprint without gaps from higher priority polygons
+        polygons = []
+        for win in rast.iter_windows():
+            win_box = box(*rast.get_window_bounds(win))
+            if win_box.intersection(footprint).area == 0:
+                continue
+            polygons.extend(contour_registry.get_multipolygon(
+                rast, window=win, **z_info).geoms)
+
+        clipped = ops.unary_union(polygons).intersection(footprint)
+        if isinstance(clipped, Polygon):
+            return MultiPolygon([clipped])
+        return MultiPolygon([
+            i for i in getattr(clipped, 'geoms', [])
+            if isinstance(i, Polygon)])
+
+
+    def _subtract_dem_boxes(
+            self,
+            base_mult_poly: MultiPolygon,
+            dem_boxes: Sequence[Polygon]
+            ) -> MultiPolygon:
+
+        '''Subtract all DEM bounding boxes from base polygons at once'''
+
+        # Only the boxes intersecting each base polygon are subtracted
+        # from it, instead of each box from the whole multipolygon
+        if not dem_boxes:
+            return base_mult_poly
+
+        tree = STRtree(dem_boxes)
+        polygons = []
+        for polygon in base_mult_poly.geoms:
+            box_idx = tree.query(polygon, predicate='intersects')
+            if len(box_idx) > 0:
+                polygon = polygon.difference(
+                    ops.unary_union([dem_boxes[i] for i in box_idx]))
+            if isinstance(polygon, Polygon):
+                polygons.append(polygon)
+            else:
+                polygons.extend(
+                    i for i in getattr(polygon, 'geoms', [])
+                    if isinstance(i, Polygon))
+
+        # Parts of disjoint polygons remain disjoint
+        return self._get_valid_multipolygon(
+            MultiPolygon([i for i in polygons if not i.is_empty]))
 
 
     def _linearring_to_vert_edge(
@@ -545,6 +598,18 @@ class GeomCombine:
                 gdf = gdf.to_crs(crs)
             gdf.to_feather(out_file)
 
+        elif out_format == "parquet":
+            polygons = gpd.GeoSeries(
+                    multi_polygon.geoms, crs=self._calc_crs)
+            if not crs.equals(self._calc_crs):
+                _logger.info(
+                    f"Project from {self._calc_crs.to_string()} to"
+                    f" {crs.to_string()} ...")
+                polygons = polygons.to_crs(crs)
+            # Row-grouped by location for reading by region
+            utils.write_polygons_parquet(
+                    out_file, polygons.values, crs=polygons.crs)
+
         elif out_format in ("jigsaw", "vtk"):
 
             if not crs.equals(self._calc_crs):
@@ -587,3 +652,249 @@ class GeomCombine:
             raise NotImplementedError(f"Output type {out_format} is not supported")
 
         _logger.info("Done")
+
+
+class PatchCombine(GeomCombine):
+    '''Extract the polygons of multiple patches from DEMs in batch
+
+    Each patch is defined by the DEMs to use, a z-range and an
+    optional shape. The result is the same as running `GeomCombine`
+    for each patch with its shape as the ignored base polygon, but
+    each DEM is opened (and warped if needed) only once, and the data
+    of each raster window is read only once for all the z-ranges of
+    the patches it's used in. Different DEMs are processed in
+    parallel.
+    '''
+
+    def __init__(
+            self,
+            patches: Sequence[Dict[str, Any]],
+            out_format: str = "feather",
+            chunk_size: Union[int, None] = None,
+            overlap: Union[int, None] = None,
+            nprocs: int = -1,
+            out_crs: Union[str, CRS] = "EPSG:4326",
+            base_crs: Union[str, CRS] = None):
+
+        # Each patch has 'dem_files', 'out_file', 'multipolygon',
+        # 'zmin' and 'zmax' items; multipolygon can be None
+        super().__init__(
+            None, None, out_format,
+            chunk_size=chunk_size, overlap=overlap, nprocs=nprocs,
+            out_crs=out_crs, base_crs=base_crs)
+        self._operation_info['patches'] = patches
+
+    def run(self):
+
+        patches = self._operation_info['patches']
+        if not patches:
+            return
+
+        out_format = self._operation_info['out_format']
+        chunk_size = self._operation_info['chunk_size']
+        overlap = self._operation_info['overlap']
+        nprocs = self._operation_info['nprocs']
+        out_crs = self._operation_info['out_crs']
+        base_crs = self._operation_info['base_crs']
+
+        if isinstance(out_crs, str):
+            out_crs = CRS.from_user_input(out_crs)
+        if isinstance(base_crs, str):
+            base_crs = CRS.from_user_input(base_crs)
+        if base_crs is None:
+            base_crs = out_crs
+
+        # All DEMs of all patches, in the order of first use
+        dem_files = list(dict.fromkeys(
+            str(dem) for patch in patches for dem in patch['dem_files']))
+        for dem in dem_files:
+            if not pathlib.Path(dem).is_file():
+                warnings.warn(f"File {dem} not found!")
+                _logger.debug(f"File {dem} not found!")
+        dem_files = [dem for dem in dem_files if pathlib.Path(dem).is_file()]
+
+        all_crs = set(Raster(dem).crs for dem in dem_files)
+        self._calc_crs = out_crs
+        if len(all_crs) == 1:
+            self._calc_crs = list(all_crs)[0]
+            _logger.info(
+                f"All DEMs have the same CRS:"
+                f" {self._calc_crs.to_string()}")
+        dem_boxes = {dem: self._get_dem_box(dem) for dem in dem_files}
+
+        # Group the work of all the patches by DEM
+        dem_tasks = {dem: [] for dem in dem_files}
+        for i_patch, patch in enumerate(patches):
+            patch_dems = [
+                str(dem) for dem in patch['dem_files']
+                if str(dem) in dem_boxes]
+            base_exterior = self._get_patch_exterior(
+                patch['multipolygon'], base_crs)
+            pri_covers = self._process_priority(
+                patch_dems, [dem_boxes[dem] for dem in patch_dems])
+            z_range = (patch['zmin'], patch['zmax'])
+            for dem, pri_cover in zip(patch_dems, pri_covers):
+                dem_tasks[dem].append(
+                    (i_patch, z_range, base_exterior, pri_cover))
+
+        out_dir = pathlib.Path(patches[0]['out_file']).parent
+        out_dir.mkdir(exist_ok=True, parents=True)
+
+        _logger.info(
+            f"Processing {len(patches)} patches on {len(dem_files)} DEMs"
+            f" with {nprocs} processes ...")
+        patch_poly_files = [[] for _ in patches]
+        with tempfile.TemporaryDirectory(dir=out_dir) as temp_dir:
+            parallel_args = [
+                (i_dem, dem, dem_tasks[dem], temp_dir, chunk_size, overlap)
+                for i_dem, dem in enumerate(dem_files) if dem_tasks[dem]]
+            if nprocs > 1 and len(parallel_args) > 1:
+                with Pool(processes=nprocs) as p:
+                    results = p.starmap(
+                        self._get_patch_polygons, parallel_args)
+                p.join()
+            else:
+                results = [
+                    self._get_patch_polygons(*args)
+                    for args in parallel_args]
+
+            # Results are in the order of DEMs
+            for dem_results in results:
+                for i_patch, poly_file in dem_results:
+                    patch_poly_files[i_patch].append(poly_file)
+
+            _logger.info("Generating final patch polygons...")
+            for patch, poly_files in zip(patches, patch_poly_files):
+                if not poly_files:
+                    continue
+                fin_mult_poly = utils.partitioned_unary_union(
+                    (list(self._read_multipolygon(feather_f).geoms)
+                     for feather_f in poly_files),
+                    nprocs=nprocs)
+                if fin_mult_poly:
+                    fin_mult_poly = self._get_valid_multipolygon(
+                        fin_mult_poly, nprocs)
+                    self._write_to_file(
+                        out_format, patch['out_file'], fin_mult_poly,
+                        out_crs)
+            _logger.info("Done")
+
+    def _get_patch_exterior(
+            self,
+            multipolygon: Union[Polygon, MultiPolygon, None],
+            base_crs: CRS
+            ) -> Union[MultiPolygon, None]:
+
+        '''Get exterior of the patch shape in calculation CRS'''
+
+        if not multipolygon:
+            return None
+
+        multipolygon = self._get_valid_multipolygon(multipolygon)
+        if not base_crs.equals(self._calc_crs):
+            transformer = Transformer.from_crs(
+                base_crs, self._calc_crs, always_xy=True)
+            multipolygon = ops.transform(
+                    transformer.transform, multipolygon)
+
+        return MultiPolygon(
+                list(ops.polygonize(
+                    [poly.exterior for poly in multipolygon.geoms])))
+
+    def _get_patch_polygons(
+            self,
+            i_dem: int,
+            dem_path: Union[str, os.PathLike],
+            tasks: Sequence[Tuple],
+            temp_dir: Union[str, os.PathLike],
+            chunk_size: Union[int, None] = None,
+            overlap: Union[int, None] = None
+            ) -> List[Tuple[int, pathlib.Path]]:
+
+        '''Get polygons of all the patches that use a DEM in one pass'''
+
+        _logger.info(f"Processing {dem_path} for {len(tasks)} patches ...")
+        rast = Raster(
+                dem_path,
+                chunk_size=chunk_size,
+                overlap=overlap)
+        if not self._calc_crs.equals(rast.crs):
+            rast.warp(dst_crs=self._calc_crs)
+        rast_box = box(*rast.src.bounds)
+
+        # Area of the DEM used for each patch; instead of clipping
+        # the raster for each patch, only the data around the area is
+        # polygonized and then the polygons are clipped exactly
+        footprints = []
+        for i_patch, z_range, base_exterior, pri_cover in tasks:
+            footprint = rast_box
+            if base_exterior and not rast_box.within(base_exterior):
+                if not rast_box.intersects(base_exterior):
+                    _logger.info(
+                        f"{dem_path} is ignored for patch {i_patch}"
+                        " due to patch shape...")
+                    continue
+                footprint = rast_box.intersection(base_exterior)
+                # Same as clipping the raster by the patch shape
+                if footprint.area == 0:
+                    raise ValueError(
+                        f"Shape of patch {i_patch} does not overlap"
+                        f" raster {dem_path}!")
+
+            if pri_cover is not None:
+                if footprint.within(pri_cover):
+                    _logger.info(
+                        f"{dem_path} is ignored for patch {i_patch}"
+                        " due to priority...")
+                    continue
+                if footprint.intersection(pri_cover).area > 0:
+                    footprint = footprint.difference(pri_cover)
+
+            footprints.append((i_patch, z_range, footprint))
+
+        polygons = {i_patch: [] for i_patch, _, _ in footprints}
+        for win in rast.iter_windows():
+            win_box = box(*rast.get_window_bounds(win))
+            win_tasks = []
+            for i_patch, z_range, footprint in footprints:
+                win_footprint = win_box.intersection(footprint)
+                if win_footprint.area > 0:
+                    # Only the data around the footprint is used
+                    win_tasks.append(
+                        (i_patch, (z_range, win_footprint.bounds)))
+            if not win_tasks:
+                continue
+
+            # Patches with the same z-range and bounds share polygons
+            specs = list(dict.fromkeys(spec for _, spec in win_tasks))
+            win_mult_polys = dict(zip(specs, rast.get_multipolygons(
+                [z_range for z_range, _ in specs],
+                window=win,
+                bounds=[roi for _, roi in specs])))
+            for i_patch, spec in win_tasks:
+                polygons[i_patch].extend(win_mult_polys[spec].geoms)
+
+        poly_files = []
+        for i_patch, _, footprint in footprints:
+            mult_poly = ops.unary_union(
+                polygons.pop(i_patch)).intersection(footprint)
+            if isinstance(mult_poly, Polygon):
+                mult_poly = MultiPolygon([mult_poly])
+            mult_poly = MultiPolygon([
+                i for i in getattr(mult_poly, 'geoms', [])
+                if isinstance(i, Polygon) and not i.is_empty])
+            if mult_poly.is_empty:
+                continue
+
+            temp_path = (
+                    pathlib.Path(temp_dir)
+                    / f'{i_dem}_{pathlib.Path(dem_path).name}'
+                      f'_{i_patch}.feather')
+            self._multipolygon_to_disk(temp_path, mult_poly)
+            poly_files.append((i_patch, temp_path))
+
+        # Multipolygons take a lot of memory
+        del polygons
+        gc.collect(2)
+
+        return poly_files
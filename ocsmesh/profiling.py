@@ -0,0 +1,268 @@
+"""This module defines the profiling of collector calculations.
+
+The calculation of collector results (e.g. the final size function
+of `HfunCollector`) goes through multiple stages, e.g. applying each
+type of refinement, evaluating the size function of each input and
+combining them. The resource usage of each stage is recorded by a
+`StageProfiler` so that the dominating stages can be identified and
+the runs can be compared.
+
+Notes
+-----
+Peak memory is the high-water mark of the resident set size of the
+process since its start, as reported by the operating system. It is
+not reset between stages, so the peak of a stage is only meaningful
+if the stage increases it, see `peak_rss_increase` of the records.
+Peak memory is not available on platforms without the `resource`
+module, e.g. Windows.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import pathlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+_logger = logging.getLogger(__name__)
+
+# Usage values that are accumulated over time
+_CUMULATIVE_KEYS = ('wall_time', 'cpu_time', 'children_cpu_time')
+
+
+def get_usage() -> Dict[str, Optional[float]]:
+    """Get the current resource usage of this process
+
+    Returns
+    -------
+    dict
+        Wall clock time, CPU time of this process and its terminated
+        children in seconds, and the peak memory of this process and
+        its terminated children in MiB. Peak memory values are `None`
+        if not available on the platform.
+
+    See Also
+    --------
+    get_usage_since :
+    """
+
+    times = os.times()
+    usage = {
+        'wall_time': time.perf_counter(),
+        'cpu_time': time.process_time(),
+        'children_cpu_time': times.children_user + times.children_system,
+        'peak_rss': None,
+        'children_peak_rss': None,
+    }
+    if resource is not None:
+        # Linux reports KiB while macOS reports bytes
+        scale = 1 if sys.platform == 'darwin' else 2**10
+        usage['peak_rss'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+        usage['children_peak_rss'] = resource.getrusage(
+            resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2**20
+
+    return usage
+
+
+def get_usage_since(
+        start: Dict[str, Optional[float]]
+        ) -> Dict[str, Optional[float]]:
+    """Get the resource usage of this process since `start`
+
+    Parameters
+    ----------
+    start : dict
+        The usage at the start of the stage, see `get_usage`.
+
+    Returns
+    -------
+    dict
+        Wall clock time and CPU times since `start`, the peak memory
+        at the end and its increase since `start`.
+
+    See Also
+    --------
+    get_usage :
+    """
+
+    end = get_usage()
+    usage = {key: end[key] - start[key] for key in _CUMULATIVE_KEYS}
+    usage['peak_rss'] = end['peak_rss']
+    usage['peak_rss_increase'] = None
+    if end['peak_rss'] is not None:
+        usage['peak_rss_increase'] = end['peak_rss'] - start['peak_rss']
+    usage['children_peak_rss'] = end['children_peak_rss']
+
+    return usage
+
+
+class StageProfiler:
+    """Recorder of the resource usage of calculation stages.
+
+    Stages can be nested, in which case the name of the stage
+    recorded is the path of stage names joined by '/', e.g.
+    'msh_t/apply_features/contour'. Each record contains the stage
+    path, the additional information passed for the stage, e.g. the
+    input index, and the resource usage as returned by
+    `get_usage_since`.
+
+    Attributes
+    ----------
+    records
+
+    Methods
+    -------
+    stage(name, **info)
+        Context manager that records the usage of its body.
+    add(name, usage, **info)
+        Add the usage of a stage measured elsewhere.
+    report()
+        Get the records and their summary per stage path.
+    to_json(path=None, indent=2)
+        Get the report as JSON and optionally write it to a file.
+    clear()
+        Remove all the records.
+
+    Notes
+    -----
+    Records are added when stages end, so nested stages precede
+    their parents. CPU time of the work done in child processes is
+    included in `children_cpu_time` only after they terminate; the
+    usage of stages done in pool workers must be measured in the
+    workers by `get_usage` and `get_usage_since` and then `add`-ed.
+    """
+
+    def __init__(self) -> None:
+        self._records = []
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name: str, **info: Any) -> Iterator[None]:
+        """Record the resource usage of the body as stage `name`
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        **info : dict
+            Additional information to record, e.g. input index.
+
+        Yields
+        ------
+        None
+        """
+
+        start = get_usage()
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self.add(name, get_usage_since(start), **info)
+
+    def add(
+            self,
+            name: str,
+            usage: Dict[str, Optional[float]],
+            **info: Any
+            ) -> None:
+        """Add the usage of stage `name` in the current stage
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        usage : dict
+            Resource usage of the stage, see `get_usage_since`.
+        **info : dict
+            Additional information to record, e.g. input index.
+
+        Returns
+        -------
+        None
+        """
+
+        path = '/'.join([*self._stack, name])
+        self._records.append({'stage': path, **info, **usage})
+        _logger.debug(
+            f"Stage {path} took {usage['wall_time']:.3f} s wall time")
+
+    def report(self) -> Dict[str, Any]:
+        """Get the records and their summary per stage path
+
+        Returns
+        -------
+        dict
+            All the 'stages' records and the 'summary' of records
+            with the same stage path, e.g. of all inputs, containing
+            the number of records, the total times and the maximum
+            peak memory.
+        """
+
+        summary = {}
+        for record in self._records:
+            item = summary.setdefault(record['stage'], {
+                'count': 0,
+                **{key: 0. for key in _CUMULATIVE_KEYS},
+                'peak_rss': None,
+            })
+            item['count'] += 1
+            for key in _CUMULATIVE_KEYS:
+                item[key] += record[key]
+            if record['peak_rss'] is not None:
+                item['peak_rss'] = max(
+                    record['peak_rss'], item['peak_rss'] or 0.)
+
+        return {'stages': self.records, 'summary': summary}
+
+    def to_json(
+            self,
+            path: Union[str, os.PathLike, None] = None,
+            indent: Optional[int] = 2
+            ) -> str:
+        """Get the report as JSON and optionally write it to a file
+
+        Parameters
+        ----------
+        path : path-like or None, default=None
+            Path of the file to write the report to. If `None` the
+            report is only returned.
+        indent : int or None, default=2
+            Indentation of the JSON output.
+
+        Returns
+        -------
+        str
+            The report in JSON format, see `report`.
+        """
+
+        report_json = json.dumps(self.report(), indent=indent, default=str)
+        if path is not None:
+            pathlib.Path(path).write_text(report_json)
+
+        return report_json
+
+    def clear(self) -> None:
+        """Remove all the records
+
+        Returns
+        -------
+        None
+        """
+
+        self._records.clear()
+
+    @property
+    def records(self) -> List[Dict[str, Any]]:
+        """Copy of the records of all the ended stages"""
+
+        return [dict(record) for record in self._records]
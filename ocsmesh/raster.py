@@ -14,10 +14,11 @@ import pathlib
 import tempfile
 import warnings
 from time import time
+from collections import OrderedDict
 from contextlib import contextmanager, ExitStack
 from typing import (
         Union, Generator, Any, Optional, Dict, List, Tuple, Iterable,
-        Callable)
+        Sequence, Callable)
 try:
     from typing import Literal
 except ImportError:
@@ -37,12 +38,15 @@ import rasterio
 import rasterio.mask
 from rasterio import warp, Affine
 from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window
 from rasterio.fill import fillnodata
 from rasterio.transform import array_bounds
 from rasterio import windows
 from scipy.ndimage import gaussian_filter, generic_filter
 from scipy import LowLevelCallable
 from shapely import ops
+from shapely.prepared import prep
 from shapely.geometry import (
     Polygon, MultiPolygon, LineString, MultiLineString, box)
 from numba import cfunc, carray
@@ -147,6 +151,9 @@ class TemporaryFile:
     def __set__(self, obj, val: tempfile.NamedTemporaryFile):
         obj.__dict__['tmpfile'] = val
         obj._src = rasterio.open(val.name)
+        if obj._clip_plan is not None:
+            # The raster grid might have changed, e.g. by warping
+            obj._clip_plan = obj._clip_plan.for_source(obj._src)
 
     def __get__(self, obj, objtype=None) -> pathlib.Path:
         tmpfile = obj.__dict__.get('tmpfile')
@@ -201,6 +208,215 @@ class Overlap:
         return obj.__dict__['overlap']
 
 
+class ClipPlan:
+    """Lazy clipping of raster data by a shape
+
+    Instead of writing a clipped copy of the raster, clipping is
+    expressed as a restriction of the raster windows. Only the
+    windows that intersect the shape are iterated, cropped to the
+    window of the shape bounds, and the data read for a window is
+    masked outside the shape using a rasterized mask of the window.
+
+    Attributes
+    ----------
+    shape
+    window
+    mask_values
+
+    Methods
+    -------
+    restrict(iter_windows)
+        Filter and crop the windows based on the shape.
+    get_outside_mask(window)
+        Get the mask of window points outside the shape.
+    for_source(src)
+        Get the plan for a new raster dataset.
+    """
+
+    block_size = 4096
+    max_masks = 4
+
+    def __init__(
+            self,
+            shape: Union[Polygon, MultiPolygon],
+            src: rasterio.DatasetReader,
+            mask_values: bool = True
+            ) -> None:
+        """Initialize the clipping plan
+
+        Parameters
+        ----------
+        shape : Polygon or MultiPolygon
+            Shape used to clip the raster data, in the raster CRS.
+        src : rasterio.DatasetReader
+            The raster dataset to be clipped.
+        mask_values : bool, default=True
+            Whether the data read from the raster is masked outside
+            the shape, or only the windows are restricted.
+
+        Raises
+        ------
+        ValueError
+            If the shape doesn't overlap the raster.
+        """
+
+        if isinstance(shape, Polygon):
+            shape = MultiPolygon([shape])
+        try:
+            window = geometry_window(src, shape.geoms)
+        except WindowError as err:
+            raise ValueError("Input shapes do not overlap raster.") from err
+
+        self._shape = shape
+        self._window = windows.Window(
+            int(window.col_off), int(window.row_off),
+            int(window.width), int(window.height))
+        self._mask_values = mask_values
+        self._grid = (src.transform, src.shape, src.crs)
+        self._masks = OrderedDict()
+
+    def restrict(
+            self,
+            iter_windows: Iterable[windows.Window]
+            ) -> Generator[windows.Window, None, None]:
+        """Filter and crop the windows based on the shape
+
+        Parameters
+        ----------
+        iter_windows : iterable of windows.Window
+            Windows on the full raster grid.
+
+        Yields
+        ------
+        windows.Window
+            Windows that intersect the shape, cropped to the window
+            of the shape bounds.
+        """
+
+        transform = self._grid[0]
+        shape = prep(self._shape)
+        for window in iter_windows:
+            if not windows.intersect(window, self._window):
+                continue
+            window = windows.intersection(window, self._window)
+            bounds = array_bounds(
+                window.height, window.width,
+                windows.transform(window, transform))
+            if not shape.intersects(box(*bounds)):
+                continue
+            yield window
+
+    def get_outside_mask(
+            self,
+            window: windows.Window
+            ) -> npt.NDArray[bool]:
+        """Get the mask of window points outside the shape
+
+        The shape is rasterized in blocks aligned with the window of
+        the shape bounds, so that each point is masked the same way
+        no matter which window it's read with.
+
+        Parameters
+        ----------
+        window : windows.Window
+            The window for which the mask is calculated.
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array of the window shape, `True` outside the
+            shape.
+        """
+
+        col_off, row_off = int(window.col_off), int(window.row_off)
+        mask = np.ones((int(window.height), int(window.width)), dtype=bool)
+        if not windows.intersect(window, self._window):
+            return mask
+
+        inter = windows.intersection(window, self._window)
+        col_lo = int(inter.col_off) - self._window.col_off
+        row_lo = int(inter.row_off) - self._window.row_off
+        col_hi = col_lo + int(inter.width)
+        row_hi = row_lo + int(inter.height)
+        size = self.block_size
+        for i in range(row_lo // size, (row_hi - 1) // size + 1):
+            for j in range(col_lo // size, (col_hi - 1) // size + 1):
+                block = self._get_block_mask(i, j)
+                r0, r1 = max(row_lo, i * size), min(row_hi, (i + 1) * size)
+                c0, c1 = max(col_lo, j * size), min(col_hi, (j + 1) * size)
+                dr = self._window.row_off - row_off
+                dc = self._window.col_off - col_off
+                mask[r0 + dr:r1 + dr, c0 + dc:c1 + dc] = block[
+                    r0 - i * size:r1 - i * size, c0 - j * size:c1 - j * size]
+        return mask
+
+    def _get_block_mask(self, i: int, j: int) -> npt.NDArray[bool]:
+        """Internal: get the rasterized mask of a block of the clip"""
+
+        key = (i, j)
+        if key in self._masks:
+            self._masks.move_to_end(key)
+            return self._masks[key]
+
+        size = self.block_size
+        block = windows.Window(
+            self._window.col_off + j * size,
+            self._window.row_off + i * size,
+            min(size, self._window.width - j * size),
+            min(size, self._window.height - i * size))
+        mask = geometry_mask(
+            self._shape.geoms,
+            out_shape=(int(block.height), int(block.width)),
+            transform=windows.transform(block, self._grid[0]))
+        self._masks[key] = mask
+        while len(self._masks) > self.max_masks:
+            self._masks.popitem(last=False)
+        return mask
+
+    def for_source(self, src: rasterio.DatasetReader) -> 'ClipPlan':
+        """Get the plan for a new raster dataset
+
+        Parameters
+        ----------
+        src : rasterio.DatasetReader
+            The new dataset of the raster, e.g. after warping.
+
+        Returns
+        -------
+        ClipPlan
+            This plan if the raster grid is not changed, otherwise
+            a new plan with the shape transformed to the new CRS.
+        """
+
+        transform, shape, crs = self._grid
+        if (src.transform, src.shape, src.crs) == (transform, shape, crs):
+            return self
+
+        clip_shape = self._shape
+        if not CRS.from_user_input(crs).equals(src.crs):
+            transformer = Transformer.from_crs(crs, src.crs, always_xy=True)
+            clip_shape = ops.transform(transformer.transform, clip_shape)
+        return ClipPlan(clip_shape, src, self._mask_values)
+
+    @property
+    def shape(self) -> MultiPolygon:
+        """Read-only attribute for the shape of the clip"""
+
+        return self._shape
+
+    @property
+    def window(self) -> windows.Window:
+        """Read-only attribute for the window of the shape bounds"""
+
+        return self._window
+
+    @property
+    def mask_values(self) -> bool:
+        """Read-only attribute for whether the data is masked"""
+
+        return self._mask_values
+
+
 class Raster:
     """Wrapper class for basic raster handling
 
@@ -248,6 +464,8 @@ class Raster:
         Get raster position tuples and values horizontally stacked.
     get_multipolygon(zmin=None, zmax=None, window=None, overlap=None, band=1)
         Extract multipolygon from raster data.
+    get_multipolygons(z_ranges, window=None, overlap=None, band=1)
+        Extract multipolygons for multiple ranges of raster data at once.
     get_bbox(crs=None, output_type='polygon')
         Get the raster bounding box.
     contourf(...)
@@ -284,7 +502,7 @@ class Raster:
         Resample raster data.
     save(path)
         Save-as raster data to the provided path.
-    clip(geom)
+    clip(geom, lazy=False)
         Clip raster data by provided shape.
     adjust(geom=None, inside_min=-np.inf, outside_max=np.inf, cond=None)
         Modify raster values based on constraints and shape.
@@ -309,6 +527,10 @@ class Raster:
     set lazily. It's also noteworthy to mention that this class is
     currently **not** picklable due temporary file and file-like
     object attributes.
+
+    A raster clipped lazily by `clip` keeps its grid, but iterating
+    the windows and reading the data of windows honor the clip, see
+    `ClipPlan`.
     """
 
     _path = RasterPath()
@@ -317,6 +539,7 @@ class Raster:
     _overlap = Overlap()
     _tmpfile = TemporaryFile()
     _src = SourceRaster()
+    _clip_plan = None
 
     def __init__(
             self,
@@ -508,7 +731,8 @@ class Raster:
             if window is None else window
         if window is not None:
             assert isinstance(window, windows.Window)
-        return self.src.read(i, window=window, **kwargs)
+        values = self.src.read(i, window=window, **kwargs)
+        return self._clip_values(values, window, kwargs.get('masked', False))
 
     def get_xyz(
             self,
@@ -570,7 +794,56 @@ class Raster:
             The calculated multipolygon from raster data
         """
 
-        polygon_collection = []
+        return self.get_multipolygons(
+            [(zmin, zmax)], window=window, overlap=overlap, band=band)[0]
+
+    def get_multipolygons(
+            self,
+            z_ranges: Sequence[Tuple[Optional[float], Optional[float]]],
+            window: Optional[windows.Window] = None,
+            overlap: Optional[int] = None,
+            band: int = 1,
+            bounds: Optional[Sequence[Optional[Tuple[float, ...]]]] = None,
+    ) -> List[MultiPolygon]:
+        """Calculate multipolygons for multiple ranges of raster data
+
+        Calculates filled contours from raster data for each of the
+        specified ranges at once. The data of each window is read
+        only once for all the ranges.
+
+        Parameters
+        ----------
+        z_ranges : sequence of tuple of float or None
+            Pairs of lower and upper bounds of raster data for filled
+            contour calculation. `None` means unbounded.
+        window : windows.Window or None, default=None
+            Window over whose data the multipolygons are calculated
+        overlap : int or None, default=None
+            Overlap used for generating windows if `window` is not provided
+        band : int, default=1
+            Raster band over whose data multipolygons are calculated
+        bounds : sequence of tuple of float or None, default=None
+            West, south, east, north bounds of the region of interest
+            for each range. Only the data within one pixel of the
+            bounds is used for the range, so the multipolygon covers
+            the region but might extend beyond it. `None` means
+            the whole raster.
+
+        Returns
+        -------
+        list of MultiPolygon
+            The calculated multipolygon from raster data for each
+            range, in the order of `z_ranges`
+
+        See Also
+        --------
+        get_multipolygon :
+            Calculate multipolygon for a single range.
+        """
+
+        polygon_collections = [[] for _ in z_ranges]
+        if bounds is None:
+            bounds = [None] * len(z_ranges)
         if window is None:
             iter_windows = self.iter_windows(overlap=overlap)
         else:
@@ -579,34 +852,54 @@ class Raster:
         for win in iter_windows:
             x, y, z = self.get_window_data(win, band=band)
             if z.mask.ndim == 2:
-                new_mask = np.full(z.mask.shape, 0)
-                new_mask[np.where(z.mask)] = -1
-                new_mask[np.where(~z.mask)] = 1
+                data_mask = np.full(z.mask.shape, 0)
+                data_mask[np.where(z.mask)] = -1
+                data_mask[np.where(~z.mask)] = 1
             else:
                 # If not mask available
                 # NOTE: We want dtype to be int64, not float64
-                new_mask = np.full((len(y), len(x)), 1)
-
-            if zmin is not None:
-                new_mask[np.where(z < zmin)] = -1
-
-            if zmax is not None:
-                new_mask[np.where(z > zmax)] = -1
-
-            if np.all(new_mask == -1):  # or not new_mask.any():
-                continue
+                data_mask = np.full((len(y), len(x)), 1)
+
+            for (zmin, zmax), roi, polygon_collection in zip(
+                    z_ranges, bounds, polygon_collections):
+                x_r, y_r, z_r, new_mask = x, y, z, data_mask.copy()
+                if roi is not None:
+                    west, south, east, north = roi
+                    in_x = np.flatnonzero(
+                        (x >= west - abs(self.dx))
+                        & (x <= east + abs(self.dx)))
+                    in_y = np.flatnonzero(
+                        (y >= south - abs(self.dy))
+                        & (y <= north + abs(self.dy)))
+                    if len(in_x) < 2 or len(in_y) < 2:
+                        continue
+                    x_r, y_r = x[in_x], y[in_y]
+                    z_r = z[np.ix_(in_y, in_x)]
+                    new_mask = new_mask[np.ix_(in_y, in_x)]
+
+                if zmin is not None:
+                    new_mask[np.where(z_r < zmin)] = -1
+
+                if zmax is not None:
+                    new_mask[np.where(z_r > zmax)] = -1
+
+                if np.all(new_mask == -1):  # or not new_mask.any():
+                    continue
 
-            fig, ax = plt.subplots()
-            ax.contourf(x, y, new_mask, levels=[0, 1])
-            mpoly = utils.get_multipolygon_from_pathplot(ax)
-            if mpoly is not None:
-                polygon_collection.extend(mpoly.geoms)
-            plt.close(fig)
+                fig, ax = plt.subplots()
+                ax.contourf(x_r, y_r, new_mask, levels=[0, 1])
+                mpoly = utils.get_multipolygon_from_pathplot(ax)
+                if mpoly is not None:
+                    polygon_collection.extend(mpoly.geoms)
+                plt.close(fig)
 
-        union_result = ops.unary_union(polygon_collection)
-        if not isinstance(union_result, MultiPolygon):
-            union_result = MultiPolygon([union_result])
-        return union_result
+        multipolygons = []
+        for polygon_collection in polygon_collections:
+            union_result = ops.unary_union(polygon_collection)
+            if not isinstance(union_result, MultiPolygon):
+                union_result = MultiPolygon([union_result])
+            multipolygons.append(union_result)
+        return multipolygons
 
     def get_bbox(
             self,
@@ -635,8 +928,12 @@ class Raster:
         """
 
         output_type = 'polygon' if output_type is None else output_type
-        xmin, xmax = np.min(self.x), np.max(self.x)
-        ymin, ymax = np.min(self.y), np.max(self.y)
+        window = None
+        if self._clip_plan is not None:
+            window = self._clip_plan.window
+        x, y = self.get_x(window), self.get_y(window)
+        xmin, xmax = np.min(x), np.max(x)
+        ymin, ymax = np.min(y), np.max(y)
         crs = self.crs if crs is None else crs
         if crs is not None:
             if not self.crs.equals(crs):
@@ -793,7 +1090,8 @@ class Raster:
             Array of raster data
         """
 
-        return self.src.read(i, masked=masked, **kwargs)
+        values = self.src.read(i, masked=masked, **kwargs)
+        return self._clip_values(values, kwargs.get('window'), masked)
 
     def dtype(self, i: int) -> npt.NDArray[float]:
         """Raster data type
@@ -882,7 +1180,7 @@ class Raster:
         # https://github.com/basaks/rasterio/blob/master/examples/fill_large_raster.py
 
         with self.modifying_raster() as dst:
-            for window in self.iter_windows():
+            for window in self._iter_grid_windows():
                 dst.write(
                     fillnodata(self.src.read(window=window, masked=True)),
                     window=window
@@ -1190,21 +1488,38 @@ class Raster:
                 dst.write_band(i, self.src.read(i))
                 dst.update_tags(i, **self.src.tags(i))
 
-    def clip(self, geom: Union[Polygon, MultiPolygon]) -> None:
+    def clip(
+            self,
+            geom: Union[Polygon, MultiPolygon],
+            lazy: bool = False
+            ) -> None:
         """Clip raster data in-place, outside the specified shape.
 
         Parameters
         ----------
         geom : Polygon or MultiPolygon
             Shape used to clip the raster data
+        lazy : bool, default=False
+            Whether to clip without writing a new raster file. The
+            raster grid is kept, but only the windows intersecting
+            the shape are iterated and the data read from windows
+            is masked outside the shape.
 
         Returns
         -------
         None
+
+        Raises
+        ------
+        ValueError
+            If the shape doesn't overlap the raster.
         """
 
         if isinstance(geom, Polygon):
             geom = MultiPolygon([geom])
+        if lazy:
+            self._clip_plan = ClipPlan(geom, self.src)
+            return
         out_image, out_transform = rasterio.mask.mask(
             self.src, geom.geoms, crop=True)
         meta_update = {
@@ -1251,7 +1566,7 @@ class Raster:
             geom = MultiPolygon([geom])
 
         with self.modifying_raster(driver='GTiff') as dst:
-            iter_windows = list(self.iter_windows())
+            iter_windows = list(self._iter_grid_windows())
             tot = len(iter_windows)
             for i, window in enumerate(iter_windows):
                 _logger.debug(f'Processing window {i+1}/{tot}.')
@@ -1344,7 +1659,7 @@ class Raster:
         if len(iter_windows) > 1:
             return self._get_raster_contour_feathered(level, iter_windows)
 
-        return self._get_raster_contour_single_window(level, window)
+        return self._get_raster_contour_single_window(level, iter_windows[0])
 
     def get_channels(
             self,
@@ -1378,6 +1693,31 @@ class Raster:
         """
 
         multipoly = self.get_multipolygon(zmax=level)
+        return self._get_channels_from_multipolygon(
+            multipoly, width, tolerance)
+
+    def _get_channels_from_multipolygon(
+            self,
+            multipoly: MultiPolygon,
+            width: float,
+            tolerance: Optional[float]
+            ) -> Union[Polygon, MultiPolygon]:
+        """Calculate narrow width polygons of the domain polygon
+
+        Parameters
+        ----------
+        multipoly : MultiPolygon
+            Domain polygon calculated from raster data, in raster CRS.
+        width : float
+            Cut-off used for designating narrow regions.
+        tolerance : float or None
+            Tolerance used for simplifying domain polygon.
+
+        Returns
+        -------
+        Polygon or MultiPolygon
+            The calculated narrow regions based on raster data
+        """
 
         utm_crs = utils.estimate_bounds_utm(
             self.get_bbox().bounds, self.crs)
@@ -1418,7 +1758,7 @@ class Raster:
             The contour lines calculated for the specified level
         """
 
-        x, y = self.get_x(), self.get_y()
+        x, y = self.get_x(window), self.get_y(window)
         features = []
         values = self.get_values(band=1, window=window)
         with warnings.catch_warnings():
@@ -1573,8 +1913,27 @@ class Raster:
         windows.Window
             Calculated square window on raster based on the window
             size and windows overlap values.
+
+        Notes
+        -----
+        If the raster is clipped lazily, only the windows that
+        intersect the clip shape are returned, cropped to the window
+        of the shape bounds.
         """
 
+        iter_windows = self._iter_grid_windows(chunk_size, overlap)
+        if self._clip_plan is not None:
+            iter_windows = self._clip_plan.restrict(iter_windows)
+        for window in iter_windows:
+            yield window
+
+    def _iter_grid_windows(
+            self,
+            chunk_size: Optional[int] = None,
+            overlap: Optional[int] = None
+            ) -> Generator[windows.Window, None, None]:
+        """Internal: calculate windows covering the whole raster grid"""
+
         chunk_size = self.chunk_size if chunk_size is None else chunk_size
         overlap = self.overlap if overlap is None else overlap
         if chunk_size in [0, None, False]:
@@ -1585,6 +1944,37 @@ class Raster:
                 self.width, self.height, chunk_size, overlap):
             yield window
 
+    def _clip_values(
+            self,
+            values: npt.NDArray[float],
+            window: Optional[windows.Window],
+            masked: bool
+            ) -> npt.NDArray[float]:
+        """Internal: mask the values read for window by the clip
+
+        Values outside the lazy clip shape are masked, or set to
+        no-data value if `masked` is `False`, the same as `clip`.
+        """
+
+        plan = self._clip_plan
+        if plan is None or not plan.mask_values:
+            return values
+
+        if window is None:
+            window = windows.Window(0, 0, self.width, self.height)
+        outside = plan.get_outside_mask(window)
+        if values.shape[-2:] != outside.shape:
+            # E.g. resampled reads
+            return values
+        if not outside.any():
+            return values
+
+        if masked:
+            values[..., outside] = ma.masked
+        else:
+            values[..., outside] = 0 if self.nodata is None else self.nodata
+        return values
+
     def get_window_data(
             self,
             window : windows.Window,
@@ -1615,7 +2005,7 @@ class Raster:
             data = self.src.read(band, masked=masked, window=window)
         else:
             data = self.src.read(masked=masked, window=window)
-        return x, y, data
+        return x, y, self._clip_values(data, window, masked)
 
     def get_window_bounds(
             self,
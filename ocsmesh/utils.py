@@ -1,9 +1,12 @@
 from collections import defaultdict
 from itertools import permutations
-from typing import Union, Dict, Sequence, Tuple, List
+from typing import Union, Dict, Sequence, Tuple, List, Optional, Iterable
 from functools import reduce
 from multiprocessing import cpu_count, Pool
+from multiprocessing.pool import ThreadPool
 from copy import deepcopy
+import json
+import pathlib
 
 import jigsawpy
 from jigsawpy import jigsaw_msh_t  # type: ignore[import]
@@ -18,6 +21,9 @@ from pyproj import CRS, Transformer  # type: ignore[import]
 from scipy.interpolate import (  # type: ignore[import]
     RectBivariateSpline, griddata)
 from scipy import sparse, constants
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+import shapely
 from shapely.geometry import ( # type: ignore[import]
         Polygon, MultiPolygon,
         box, GeometryCollection, Point, MultiPoint,
@@ -25,6 +31,8 @@ from shapely.geometry import ( # type: ignore[import]
 from shapely.ops import polygonize, linemerge, unary_union
 import geopandas as gpd
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import utm
 
 
@@ -610,6 +618,291 @@ def get_multipolygon_from_pathplot(ax):
     return multipolygon
 
 
+def partitioned_unary_union(
+        geom_iter: Iterable[Union[Sequence, gpd.GeoSeries]],
+        nprocs: int = 1,
+        bucket_size: int = 1000
+        ) -> Union[Polygon, MultiPolygon, GeometryCollection]:
+    """Calculate the union of polygons by spatial partitions
+
+    Polygons are bucketed into the cells of a regular grid by the
+    center of their bounds, so that each bucket has about
+    `bucket_size` polygons on average. The buckets are unioned in
+    parallel, and then the results of each 2 by 2 block of cells are
+    unioned, level by level, until one shape remains.
+
+    Parameters
+    ----------
+    geom_iter : iterable of array-like
+        Batches of (multi)polygons to union, e.g. the geometries of
+        each feather file as they're read.
+    nprocs : int, default=1
+        Number of processes to use for union of buckets.
+    bucket_size : int, default=1000
+        Target average number of polygons in each grid cell.
+
+    Returns
+    -------
+    Polygon or MultiPolygon or GeometryCollection
+        Union of all the input polygons. Empty `GeometryCollection`
+        if there's no input polygon.
+    """
+
+    # Batches are only concatenated once
+    geoms = [np.asarray(batch, dtype=object) for batch in geom_iter]
+    geoms = np.concatenate(geoms) if geoms else np.empty(0, dtype=object)
+    geoms = shapely.get_parts(geoms[~shapely.is_missing(geoms)])
+    geoms = geoms[~shapely.is_empty(geoms)]
+    if len(geoms) == 0:
+        return GeometryCollection()
+
+    bounds = shapely.bounds(geoms)
+    centers = (bounds[:, :2] + bounds[:, 2:]) / 2
+    n_side = max(1, int(np.ceil(np.sqrt(len(geoms) / bucket_size))))
+    lower = centers.min(axis=0)
+    extent = centers.max(axis=0) - lower
+    extent[extent == 0] = 1
+    cell_idx = np.clip(
+        ((centers - lower) / extent * n_side).astype(int), 0, n_side - 1)
+
+    # Sorting by cell keeps the buckets contiguous
+    cell_ids = cell_idx[:, 1] * n_side + cell_idx[:, 0]
+    order = np.argsort(cell_ids, kind='stable')
+    occupied, starts = np.unique(cell_ids[order], return_index=True)
+    buckets = np.split(geoms[order], starts[1:])
+
+    def _map_union(pool, bucket_list):
+        if pool is None:
+            return [shapely.union_all(bucket) for bucket in bucket_list]
+        return pool.map(shapely.union_all, bucket_list)
+
+    pool = None
+    if nprocs > 1 and len(buckets) > 1:
+        pool = Pool(processes=nprocs)
+    try:
+        grid = {
+            (cell_id % n_side, cell_id // n_side): shape
+            for cell_id, shape in zip(
+                occupied, _map_union(pool, buckets))}
+        while len(grid) > 1:
+            blocks = defaultdict(list)
+            for (i, j), shape in grid.items():
+                blocks[(i // 2, j // 2)].append(shape)
+            grid = {
+                key: shapes[0] for key, shapes in blocks.items()
+                if len(shapes) == 1}
+            merge_keys = [
+                key for key, shapes in blocks.items() if len(shapes) > 1]
+            grid.update(zip(merge_keys, _map_union(
+                pool, [blocks[key] for key in merge_keys])))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return next(iter(grid.values()))
+
+
+def repair_multipolygon(
+        polygon: Union[Polygon, MultiPolygon, GeometryCollection],
+        nprocs: int = 1
+        ) -> Tuple[MultiPolygon, int]:
+    """Get a valid multipolygon by only repairing its invalid parts
+
+    Instead of validating and fixing the whole multipolygon at once,
+    the validity of each member polygon is checked and invalid ones
+    are repaired by `make_valid`. Then the members whose interiors
+    overlap or whose boundaries share a segment, which makes the
+    multipolygon invalid even if its members are valid, are merged.
+    The checks and repairs are split between `nprocs` threads; the
+    vectorized `shapely` operations release the GIL.
+
+    Parameters
+    ----------
+    polygon : Polygon or MultiPolygon or GeometryCollection
+        The input shape which might not be topologically valid. Any
+        non-polygon part is ignored.
+    nprocs : int, default=1
+        Number of threads to use for validation and repair.
+
+    Returns
+    -------
+    MultiPolygon
+        The valid multipolygon.
+    int
+        Number of member polygons that were invalid or merged.
+    """
+
+    def _map_chunks(func, parts):
+        if nprocs < 2 or len(parts) < 2 * nprocs:
+            return func(parts)
+        with ThreadPool(processes=nprocs) as pool:
+            results = pool.map(func, np.array_split(parts, nprocs))
+        return np.concatenate(results)
+
+    parts = shapely.get_parts(np.asarray([polygon], dtype=object))
+    parts = parts[shapely.get_type_id(parts) == shapely.GeometryType.POLYGON]
+    parts = parts[~shapely.is_empty(parts)]
+
+    is_valid = _map_chunks(shapely.is_valid, parts)
+    n_fixed = int(np.sum(~is_valid))
+    if n_fixed:
+        fixed = shapely.get_parts(_map_chunks(
+            shapely.make_valid, parts[~is_valid]))
+        fixed = fixed[
+            (shapely.get_type_id(fixed) == shapely.GeometryType.POLYGON)
+            & ~shapely.is_empty(fixed)]
+        parts = np.concatenate([parts[is_valid], fixed])
+
+    # Interiors overlap or boundaries share a line
+    tree = shapely.STRtree(parts)
+    idx_1, idx_2 = tree.query(parts, predicate='intersects')
+    pairs = idx_1 < idx_2
+    idx_1, idx_2 = idx_1[pairs], idx_2[pairs]
+    conflict = (
+        shapely.relate_pattern(parts[idx_1], parts[idx_2], '2********')
+        | shapely.relate_pattern(parts[idx_1], parts[idx_2], '****1****'))
+    idx_1, idx_2 = idx_1[conflict], idx_2[conflict]
+    if len(idx_1):
+        graph = sparse.coo_matrix(
+            (np.ones(len(idx_1)), (idx_1, idx_2)),
+            shape=(len(parts), len(parts)))
+        _, labels = connected_components(graph, directed=False)
+        group_sizes = np.bincount(labels)
+        is_merged = group_sizes[labels] > 1
+        n_fixed += int(np.sum(is_merged))
+        merge_groups = [
+            parts[labels == label]
+            for label in np.flatnonzero(group_sizes > 1)]
+        if nprocs < 2:
+            merged = [shapely.union_all(group) for group in merge_groups]
+        else:
+            with ThreadPool(processes=nprocs) as pool:
+                merged = pool.map(shapely.union_all, merge_groups)
+        merged = shapely.get_parts(np.asarray(merged, dtype=object))
+        parts = np.concatenate([parts[~is_merged], merged])
+
+    return MultiPolygon(list(parts)), n_fixed
+
+
+def simplify_by_size(
+        polygon: Union[Polygon, MultiPolygon],
+        hfun: jigsaw_msh_t,
+        fraction: float = 0.25,
+        crs: Union[CRS, str, None] = None,
+        nprocs: int = 1
+        ) -> Tuple[MultiPolygon, Dict[str, int]]:
+    """Simplify polygon boundaries with tolerance based on mesh size
+
+    Each ring of the polygons is simplified by topology-preserving
+    Douglas-Peucker algorithm, with tolerance equal to `fraction` of
+    the smallest size function value along the ring. The size at
+    each vertex is that of the closest vertex of `hfun`. If the
+    separately simplified rings of a polygon are not a valid polygon
+    anymore (e.g. a hole crosses the exterior) the whole polygon
+    is simplified with the smallest tolerance of its rings instead.
+    Rings are simplified in `nprocs` threads; the vectorized
+    `shapely` operations release the GIL.
+
+    Parameters
+    ----------
+    polygon : Polygon or MultiPolygon
+        The input shape to simplify, in a CRS with the same length
+        unit as the size function.
+    hfun : jigsaw_msh_t
+        Size function with size `value` at each `vert2` vertex.
+    fraction : float, default=0.25
+        Fraction of the local size to use as simplification
+        tolerance, i.e. the maximum distance of the simplified
+        boundary from the original one.
+    crs : CRS or str or None, default=None
+        CRS of the input shape. If specified and `hfun` has a
+        different CRS, the vertices are transformed to the CRS of
+        `hfun` for looking up the sizes.
+    nprocs : int, default=1
+        Number of threads to use for simplification.
+
+    Returns
+    -------
+    MultiPolygon
+        The simplified multipolygon.
+    dict
+        Number of vertices of the input ('vertices_before') and the
+        simplified ('vertices_after') polygons and number of polygons
+        simplified as a whole ('polygons_fallback').
+
+    Raises
+    ------
+    ValueError
+        If `fraction` is not positive or `hfun` has no vertices.
+    """
+
+    if fraction <= 0:
+        raise ValueError("Simplification fraction must be positive!")
+    if len(hfun.vert2) == 0:
+        raise ValueError("Size function has no vertices!")
+
+    def _map_chunks(func, *arrays):
+        if nprocs < 2 or len(arrays[0]) < 2 * nprocs:
+            return func(*arrays)
+        with ThreadPool(processes=nprocs) as pool:
+            results = pool.starmap(func, zip(
+                *[np.array_split(array, nprocs) for array in arrays]))
+        return np.concatenate(results)
+
+    def _simplify(geoms, tolerances):
+        return shapely.simplify(geoms, tolerances, preserve_topology=True)
+
+    polygons = shapely.get_parts(np.asarray([polygon], dtype=object))
+    polygons = polygons[~shapely.is_empty(polygons)]
+
+    # Rings are in the order of polygons, each exterior first
+    rings, poly_idx = shapely.get_rings(polygons, return_index=True)
+    coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+
+    if crs is not None and getattr(hfun, 'crs', None) is not None:
+        crs = CRS.from_user_input(crs)
+        if not crs.equals(hfun.crs):
+            transformer = Transformer.from_crs(
+                crs, hfun.crs, always_xy=True)
+            coords = np.column_stack(
+                transformer.transform(coords[:, 0], coords[:, 1]))
+
+    tree = cKDTree(hfun.vert2['coord'])
+    _, near_idx = tree.query(coords)
+    sizes = hfun.value.ravel()[near_idx]
+
+    ring_sizes = np.full(len(rings), np.inf)
+    np.minimum.at(ring_sizes, ring_idx, sizes)
+    ring_tols = fraction * ring_sizes
+
+    simple_rings = _map_chunks(_simplify, rings, ring_tols)
+    simple_polys = shapely.polygons(simple_rings, indices=poly_idx)
+
+    is_valid = _map_chunks(shapely.is_valid, simple_polys)
+    n_fallback = int(np.sum(~is_valid))
+    if n_fallback:
+        poly_tols = np.full(len(polygons), np.inf)
+        np.minimum.at(poly_tols, poly_idx, ring_tols)
+        simple_polys[~is_valid] = _map_chunks(
+            _simplify, polygons[~is_valid], poly_tols[~is_valid])
+
+    simple_mp = MultiPolygon(list(simple_polys))
+    if not simple_mp.is_valid:
+        # Separately simplified polygons might overlap
+        simple_mp, _ = repair_multipolygon(simple_mp, nprocs)
+
+    stats = {
+        'vertices_before': len(coords) - len(rings),
+        'vertices_after': int(
+            shapely.get_num_coordinates(simple_mp)
+            - len(shapely.get_rings(shapely.get_parts(simple_mp)))),
+        'polygons_fallback': n_fallback,
+    }
+
+    return simple_mp, stats
+
+
 def signed_polygon_area(vertices):
     # https://code.activestate.com/recipes/578047-area-of-polygon-using-shoelace-formula/
     n = len(vertices)  # of vertices
@@ -902,6 +1195,119 @@ def clip_mesh_by_shape(
     return mesh
 
 
+def cut_mesh_by_box(
+        mesh: jigsaw_msh_t,
+        bounds: Tuple[float, float, float, float]
+        ) -> jigsaw_msh_t:
+    """Cut the triangles of a mesh exactly at the edges of a box
+
+    Triangles inside the box are kept as is, while each triangle
+    crossing the box edges is replaced by a fan triangulation of its
+    part inside the box. Values on the new vertices are linearly
+    interpolated in the original triangle. Unlike
+    `clip_mesh_by_shape`, the area covered by the output is exactly
+    the part of the mesh in the box, so meshes cut by adjacent boxes
+    neither overlap nor leave gaps in between.
+
+    Parameters
+    ----------
+    mesh : jigsaw_msh_t
+        Input triangular mesh with values on the vertices.
+    bounds : tuple of float
+        West, south, east, north bounds of the box.
+
+    Returns
+    -------
+    jigsaw_msh_t
+        Mesh of the part of the input in the box. Vertices not used
+        by the output triangles are removed.
+    """
+
+    x0, y0, x1, y1 = bounds
+    coord = mesh.vert2['coord']
+    value = np.asarray(mesh.value).reshape(len(coord), -1)
+    tria = mesh.tria3['index']
+
+    is_in = (
+        (coord[:, 0] >= x0) & (coord[:, 0] <= x1)
+        & (coord[:, 1] >= y0) & (coord[:, 1] <= y1))
+    all_in = np.all(is_in[tria], axis=1)
+    tria_xy = coord[tria]
+    lower = tria_xy.min(axis=1)
+    upper = tria_xy.max(axis=1)
+    crossing = np.flatnonzero(
+        ~all_in
+        & (lower[:, 0] < x1) & (upper[:, 0] > x0)
+        & (lower[:, 1] < y1) & (upper[:, 1] > y0))
+
+    # The part of a triangle in a box is convex
+    parts = np.empty(0, dtype=object)
+    if len(crossing) > 0:
+        parts = shapely.clip_by_rect(
+            shapely.polygons(tria_xy[crossing]), x0, y0, x1, y1)
+    is_poly = (
+        (shapely.get_type_id(parts) == 3) & (shapely.area(parts) > 0))
+    crossing = crossing[is_poly]
+    new_xy, part_idx = shapely.get_coordinates(
+        shapely.get_exterior_ring(parts[is_poly]), return_index=True)
+    # Drop the closing coordinate of each ring
+    n_coords = np.bincount(part_idx, minlength=len(crossing))
+    is_open = np.ones(len(new_xy), dtype=bool)
+    is_open[np.cumsum(n_coords) - 1] = False
+    new_xy, part_idx = new_xy[is_open], part_idx[is_open]
+    n_verts = n_coords - 1
+
+    def _cross(v_a, v_b):
+        return v_a[:, 0] * v_b[:, 1] - v_a[:, 1] * v_b[:, 0]
+
+    # Barycentric interpolation in the source triangles
+    crossing_xy = tria_xy[crossing]
+    edge_1 = crossing_xy[:, 1] - crossing_xy[:, 0]
+    edge_2 = crossing_xy[:, 2] - crossing_xy[:, 0]
+    src_area = _cross(edge_1, edge_2)
+    rel_xy = new_xy - crossing_xy[part_idx, 0]
+    w_1 = _cross(rel_xy, edge_2[part_idx]) / src_area[part_idx]
+    w_2 = _cross(edge_1[part_idx], rel_xy) / src_area[part_idx]
+    weights = np.column_stack([1 - w_1 - w_2, w_1, w_2])
+    src_tria = tria[crossing][part_idx]
+    new_value = np.einsum('ij,ijk->ik', weights, value[src_tria])
+
+    # Vertices of the source triangles inside the box are reused
+    new_idx = len(coord) + np.arange(len(new_xy))
+    is_src_vert = np.all(
+        new_xy[:, None, :] == crossing_xy[part_idx], axis=2)
+    is_reused = np.any(is_src_vert, axis=1)
+    new_idx[is_reused] = src_tria[
+        is_reused, np.argmax(is_src_vert[is_reused], axis=1)]
+
+    # Fan triangles of each part, oriented as the source triangles
+    n_fan = n_verts - 2
+    first = np.repeat(np.cumsum(n_verts) - n_verts, n_fan)
+    step = np.arange(n_fan.sum()) - np.repeat(
+        np.cumsum(n_fan) - n_fan, n_fan)
+    fan = np.column_stack([first, first + step + 1, first + step + 2])
+    fan_area = _cross(
+        new_xy[fan[:, 1]] - new_xy[fan[:, 0]],
+        new_xy[fan[:, 2]] - new_xy[fan[:, 0]])
+    is_flipped = np.sign(fan_area) != np.repeat(np.sign(src_area), n_fan)
+    fan[is_flipped] = fan[is_flipped][:, [0, 2, 1]]
+    fan = new_idx[fan[fan_area != 0]]
+
+    # Only keep the vertices used by the output triangles
+    all_coord = np.concatenate([coord, new_xy])
+    all_value = np.concatenate([value, new_value])
+    out_tria = np.concatenate([tria[all_in], fan])
+    used = np.unique(out_tria)
+    renumber = np.full(len(all_coord), -1, dtype=jigsaw_msh_t.INDEX_t)
+    renumber[used] = np.arange(len(used))
+
+    return assemble_msh_t(
+        [all_coord[used]],
+        {'tria3': [renumber[out_tria]]},
+        [all_value[used]],
+        crs=getattr(mesh, 'crs', None))
+
+
 def remove_mesh_by_edge(
         mesh: jigsaw_msh_t,
         edges: Sequence[Tuple[int, int]],
@@ -1481,6 +1887,177 @@ def sms2dm_to_msh_t(_sms2dm: Dict) -> jigsaw_msh_t:
         msh.crs = CRS.from_user_input(crs)
     return msh
 
+def msh_t_to_npy(msh: jigsaw_msh_t, path) -> None:
+    """Write mesh arrays to a directory of binary `.npy` files
+
+    Each of coordinates, triangles, quadrilaterals and values is
+    stored as a separate `.npy` file so that it can later be
+    memory-mapped, and the CRS, if any, is stored as WKT next to them.
+
+    Parameters
+    ----------
+    msh : jigsaw_msh_t
+        Mesh to write.
+    path : path-like
+        Output directory, created if it doesn't exist.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    load_npy_arrays :
+        Load (or memory-map) the written arrays.
+    npy_to_msh_t :
+        Read the mesh back from disk.
+    """
+
+    out_dir = pathlib.Path(path)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / 'coord.npy', msh.vert2['coord'])
+    np.save(out_dir / 'tria3.npy', msh.tria3['index'])
+    np.save(out_dir / 'quad4.npy', msh.quad4['index'])
+    np.save(out_dir / 'value.npy', msh.value)
+    crs = getattr(msh, 'crs', None)
+    if crs is not None:
+        (out_dir / 'crs.wkt').write_text(CRS.from_user_input(crs).to_wkt())
+
+
+def load_npy_arrays(path, mmap_mode=None) -> Dict:
+    """Read mesh arrays written by `msh_t_to_npy`
+
+    Parameters
+    ----------
+    path : path-like
+        Directory written by `msh_t_to_npy`.
+    mmap_mode : {None, 'r', 'r+', 'c'}, default=None
+        Passed to `numpy.load`; use 'r' to memory-map the arrays
+        instead of reading them into memory.
+
+    Returns
+    -------
+    dict
+        Dictionary of 'coord', 'tria3', 'quad4' and 'value' arrays
+        and the 'crs' (or `None`) of the mesh.
+    """
+
+    in_dir = pathlib.Path(path)
+    arrays = {
+        key: np.load(in_dir / f'{key}.npy', mmap_mode=mmap_mode)
+        for key in ('coord', 'tria3', 'quad4', 'value')
+    }
+    crs_path = in_dir / 'crs.wkt'
+    arrays['crs'] = (
+        CRS.from_wkt(crs_path.read_text()) if crs_path.is_file() else None)
+    return arrays
+
+def npy_to_msh_t(path) -> jigsaw_msh_t:
+    """Read a mesh written by `msh_t_to_npy`
+
+    Parameters
+    ----------
+    path : path-like
+        Directory written by `msh_t_to_npy`.
+
+    Returns
+    -------
+    jigsaw_msh_t
+        Mesh read from the input directory.
+    """
+
+    arrays = load_npy_arrays(path)
+    msh = jigsaw_msh_t()
+    msh.ndims = +2
+    msh.mshID = 'euclidean-mesh'
+    msh.vert2 = np.zeros(len(arrays['coord']), dtype=jigsaw_msh_t.VERT2_t)
+    msh.vert2['coord'] = arrays['coord']
+    msh.tria3 = np.zeros(len(arrays['tria3']), dtype=jigsaw_msh_t.TRIA3_t)
+    msh.tria3['index'] = arrays['tria3']
+    msh.quad4 = np.zeros(len(arrays['quad4']), dtype=jigsaw_msh_t.QUAD4_t)
+    msh.quad4['index'] = arrays['quad4']
+    msh.value = np.array(arrays['value'], dtype=jigsaw_msh_t.REALS_t)
+    if arrays['crs'] is not None:
+        msh.crs = arrays['crs']
+    return msh
+
+def assemble_msh_t(
+        coord_list: Sequence[npt.NDArray[float]],
+        elem_lists: Optional[Dict[str, Sequence[npt.NDArray[int]]]] = None,
+        value_list: Optional[Sequence[npt.NDArray[float]]] = None,
+        local_index: bool = True,
+        crs=None
+        ) -> jigsaw_msh_t:
+    """Assemble a mesh from the arrays of its parts
+
+    The structured arrays of the output mesh are preallocated and
+    the arrays of each part are written into their fields, so no
+    intermediate stacked copies or per-item Python objects are
+    created. All the tags are set to 0.
+
+    Parameters
+    ----------
+    coord_list : sequence of array-like
+        Vertex coordinates of each part, each of shape (n, 2).
+    elem_lists : dict or None, default=None
+        Lists of element connectivity arrays of the parts keyed
+        by element type (e.g. 'tria3', 'quad4'). Empty arrays are
+        allowed regardless of their shape.
+    value_list : sequence of array-like or None, default=None
+        Values on the vertices of each part. If `None` values are
+        not set.
+    local_index : bool, default=True
+        Whether element connectivity of each part refers to the
+        vertices of the same part, in which case it's offset by the
+        number of vertices of the preceding parts. Otherwise it
+        already refers to the vertices of the assembled mesh, and
+        the lists can have any length.
+    crs : CRS or None, default=None
+        CRS of the assembled mesh.
+
+    Returns
+    -------
+    jigsaw_msh_t
+        Assembled euclidean mesh.
+    """
+
+    msh = jigsaw_msh_t()
+    msh.mshID = 'euclidean-mesh'
+    msh.ndims = +2
+
+    n_verts = [len(coord) for coord in coord_list]
+    offsets = np.cumsum([0] + n_verts)
+    msh.vert2 = np.zeros(offsets[-1], dtype=jigsaw_msh_t.VERT2_t)
+    for coord, start, stop in zip(coord_list, offsets[:-1], offsets[1:]):
+        msh.vert2['coord'][start:stop] = coord
+
+    if value_list is not None:
+        msh.value = np.zeros((offsets[-1], 1), dtype=jigsaw_msh_t.REALS_t)
+        for value, start, stop in zip(
+                value_list, offsets[:-1], offsets[1:]):
+            msh.value[start:stop] = np.reshape(value, (-1, 1))
+
+    elem_lists = {} if elem_lists is None else elem_lists
+    for etype, elem_list in elem_lists.items():
+        elem_dtype = getattr(jigsaw_msh_t, MESH_TYPES[etype])
+        n_elems = [len(elems) for elems in elem_list]
+        elem_offsets = np.cumsum([0] + n_elems)
+        elem_array = np.zeros(elem_offsets[-1], dtype=elem_dtype)
+        for i, elems in enumerate(elem_list):
+            if len(elems) == 0:
+                continue
+            start, stop = elem_offsets[i], elem_offsets[i + 1]
+            elem_array['index'][start:stop] = elems
+            if local_index:
+                elem_array['index'][start:stop] += offsets[i]
+        setattr(msh, etype, elem_array)
+
+    if crs is not None:
+        msh.crs = crs
+
+    return msh
+
+
 @must_be_euclidean_mesh
 def msh_t_to_utm(msh):
     utm_crs = estimate_mesh_utm(msh)
@@ -1588,7 +2165,6 @@ def merge_msh_t(
     coord = []
     elems = {k: [] for k in MESH_TYPES}
     value = []
-    offset = 0
 
     mesh_shape_list = []
     # Last has the highest priority
@@ -1619,28 +2195,11 @@ def merge_msh_t(
 
 
         for k in MESH_TYPES:
-            cnn = getattr(mesh, k)
-            elems[k].append(cnn['index'] + offset)
+            elems[k].append(getattr(mesh, k)['index'])
         coord.append(mesh.vert2['coord'])
         value.append(mesh.value)
-        offset += coord[-1].shape[0]
 
-    composite_mesh = jigsaw_msh_t()
-    composite_mesh.mshID = 'euclidean-mesh'
-    composite_mesh.ndims = 2
-
-    composite_mesh.vert2 = np.array(
-            [(coord, 0) for coord in np.vstack(coord)],
-            dtype=jigsaw_msh_t.VERT2_t)
-    composite_mesh.value = np.array(
-            np.vstack(value),
-            dtype=jigsaw_msh_t.REALS_t)
-    for k, v in MESH_TYPES.items():
-        setattr(composite_mesh, k, np.array(
-            [(cnn, 0) for cnn in np.vstack(elems[k])],
-            dtype=getattr(jigsaw_msh_t, v)))
-
-    composite_mesh.crs = dst_crs
+    composite_mesh = assemble_msh_t(coord, elems, value, crs=dst_crs)
 
     return composite_mesh
 
@@ -2107,6 +2666,229 @@ def raster_from_numpy(
 
 
 
+def write_polygons_parquet(
+        path: Union[str, pathlib.Path],
+        polygons: Union[Polygon, MultiPolygon, Sequence],
+        crs: Union[CRS, str, None] = None,
+        row_group_size: int = 10000
+        ) -> None:
+    """Write polygons to a GeoParquet file, row-grouped by location
+
+    Each polygon is written as a separate row, along with its bounds
+    in the `bbox` column (GeoParquet 1.1 bounding box covering). The
+    polygons are bucketed into the cells of a regular grid by the
+    center of their bounds, so that each cell has about
+    `row_group_size` polygons on average. The cells are written in
+    Z-order, each cell in separate row groups unless neighboring
+    cells fit in one, so that the row groups are spatially compact.
+    The WKB encoding of polygons is done one row group at a time.
+
+    Parameters
+    ----------
+    path : str or Path
+        Path of the output file.
+    polygons : Polygon or MultiPolygon or array-like
+        The polygons to write. Multipolygons are split into their
+        member polygons.
+    crs : CRS or str or None, default=None
+        The CRS of the polygons, `None` if unknown.
+    row_group_size : int, default=10000
+        Maximum number of polygons in each row group.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    read_polygons_parquet :
+    """
+
+    geoms = shapely.get_parts(np.asarray(polygons, dtype=object))
+    geoms = geoms[~shapely.is_empty(geoms)]
+    bounds = shapely.bounds(geoms).reshape(-1, 4)
+    crs = None if crs is None else CRS.from_user_input(crs)
+
+    geo_types = {3: 'Polygon', 6: 'MultiPolygon'}
+    geo_meta = {
+        'version': '1.1.0',
+        'primary_column': 'geometry',
+        'columns': {'geometry': {
+            'encoding': 'WKB',
+            'geometry_types': sorted(
+                geo_types.get(type_id, shapely.GeometryType(type_id).name)
+                for type_id in np.unique(shapely.get_type_id(geoms))),
+            # Missing CRS means OGC:CRS84 in GeoParquet
+            'crs': None if crs is None else crs.to_json_dict(),
+            'covering': {'bbox': {
+                key: ['bbox', key]
+                for key in ['xmin', 'ymin', 'xmax', 'ymax']}},
+        }},
+    }
+    if len(geoms) > 0:
+        geo_meta['columns']['geometry']['bbox'] = [
+            *bounds[:, :2].min(axis=0).tolist(),
+            *bounds[:, 2:].max(axis=0).tolist()]
+
+    bbox_type = pa.struct([
+        (key, pa.float64()) for key in ['xmin', 'ymin', 'xmax', 'ymax']])
+    schema = pa.schema(
+        [('geometry', pa.binary()), ('bbox', bbox_type)],
+        metadata={b'geo': json.dumps(geo_meta).encode('utf-8')})
+
+    def _write_row_group(writer, rows):
+        rows = np.concatenate(rows)
+        table = pa.table({
+            'geometry': shapely.to_wkb(geoms[rows]),
+            'bbox': pa.StructArray.from_arrays(
+                [bounds[rows, i] for i in range(4)],
+                fields=list(bbox_type)),
+            }, schema=schema)
+        writer.write_table(table, row_group_size=len(rows))
+
+    with pq.ParquetWriter(path, schema) as writer:
+        if len(geoms) == 0:
+            return
+
+        centers = (bounds[:, :2] + bounds[:, 2:]) / 2
+        n_side = max(1, int(np.ceil(np.sqrt(len(geoms) / row_group_size))))
+        lower = centers.min(axis=0)
+        extent = centers.max(axis=0) - lower
+        extent[extent == 0] = 1
+        cell_idx = np.clip(
+            ((centers - lower) / extent * n_side).astype(np.uint64),
+            0, n_side - 1)
+
+        # Z-order of cells by interleaving the bits of the indices
+        cell_ids = np.zeros(len(geoms), dtype=np.uint64)
+        for i_bit in range(max(1, int(n_side - 1).bit_length())):
+            bit = np.uint64(i_bit)
+            cell_ids |= ((cell_idx[:, 0] >> bit) & np.uint64(1)) << (
+                np.uint64(2) * bit)
+            cell_ids |= ((cell_idx[:, 1] >> bit) & np.uint64(1)) << (
+                np.uint64(2) * bit + np.uint64(1))
+        order = np.argsort(cell_ids, kind='stable')
+        _, starts = np.unique(cell_ids[order], return_index=True)
+
+        group, n_group = [], 0
+        for cell_rows in np.split(order, starts[1:]):
+            if n_group + len(cell_rows) > row_group_size and group:
+                _write_row_group(writer, group)
+                group, n_group = [], 0
+            for i in range(0, len(cell_rows), row_group_size):
+                rows = cell_rows[i:i + row_group_size]
+                if len(rows) == row_group_size:
+                    _write_row_group(writer, [rows])
+                else:
+                    group.append(rows)
+                    n_group += len(rows)
+        if group:
+            _write_row_group(writer, group)
+
+
+def read_polygons_parquet(
+        path: Union[str, pathlib.Path],
+        bbox: Optional[Tuple[float, float, float, float]] = None
+        ) -> gpd.GeoDataFrame:
+    """Read polygons from a GeoParquet file, optionally by region
+
+    If `bbox` is specified, only the row groups whose bounds
+    statistics intersect it are read, and then only the polygons
+    whose bounds intersect it are returned. The bounds are taken
+    from the bounding box covering columns, e.g. as written by
+    `write_polygons_parquet`, or calculated from the polygons if
+    the file doesn't have them.
+
+    Parameters
+    ----------
+    path : str or Path
+        Path of the GeoParquet file.
+    bbox : tuple of float or None, default=None
+        The (xmin, ymin, xmax, ymax) region of interest in the CRS
+        of the file. If `None` all the polygons are read.
+
+    Returns
+    -------
+    gpd.GeoDataFrame
+        The polygons read from the file along with their CRS.
+
+    Raises
+    ------
+    ValueError
+        If the file doesn't have GeoParquet metadata.
+
+    See Also
+    --------
+    write_polygons_parquet :
+    """
+
+    pq_file = pq.ParquetFile(path)
+    metadata = pq_file.schema_arrow.metadata or {}
+    if b'geo' not in metadata:
+        raise ValueError(f"File {path} is not a GeoParquet file!")
+    geo_meta = json.loads(metadata[b'geo'])
+    geom_col = geo_meta['primary_column']
+    col_meta = geo_meta['columns'][geom_col]
+    crs = col_meta.get('crs', 'OGC:CRS84')
+    crs = None if crs is None else CRS.from_user_input(crs)
+
+    covering = col_meta.get('covering', {}).get('bbox')
+    columns = [geom_col]
+    if covering is not None:
+        columns.append(covering['xmin'][0])
+
+    row_groups = list(range(pq_file.num_row_groups))
+    if bbox is not None and covering is not None:
+        paths = {
+            '.'.join(col_path): key for key, col_path in covering.items()}
+        rg_meta = [
+            pq_file.metadata.row_group(i) for i in row_groups]
+        def _intersects(rg):
+            stats = {}
+            for i_col in range(rg.num_columns):
+                col = rg.column(i_col)
+                key = paths.get(col.path_in_schema)
+                if (key is not None and col.statistics is not None
+                        and col.statistics.has_min_max):
+                    stats[key] = col.statistics
+            if len(stats) < 4:
+                return True
+            return (stats['xmin'].min <= bbox[2]
+                    and stats['ymin'].min <= bbox[3]
+                    and stats['xmax'].max >= bbox[0]
+                    and stats['ymax'].max >= bbox[1])
+        row_groups = [
+            i for i, rg in zip(row_groups, rg_meta) if _intersects(rg)]
+
+    table = pq_file.read_row_groups(row_groups, columns=columns)
+    geoms = shapely.from_wkb(
+        table.column(geom_col).to_numpy(zero_copy_only=False))
+    if bbox is not None:
+        if covering is not None:
+            bbox_col = table.column(covering['xmin'][0]).combine_chunks()
+            bounds = np.column_stack([
+                bbox_col.field(covering[key][1]).to_numpy(
+                    zero_copy_only=False)
+                for key in ['xmin', 'ymin', 'xmax', 'ymax']])
+        else:
+            bounds = shapely.bounds(geoms).reshape(-1, 4)
+        in_bbox = ((bounds[:, 0] <= bbox[2]) & (bounds[:, 1] <= bbox[3])
+                   & (bounds[:, 2] >= bbox[0]) & (bounds[:, 3] >= bbox[1]))
+        geoms = geoms[in_bbox]
+
+    return gpd.GeoDataFrame(geometry=geoms, crs=crs)
+
+
+def _structured_from_numpy(array, field, dtype):
+    """Fill `field` of a new zero-tagged `jigsaw_msh_t` array"""
+
+    array = np.asarray(array)
+    structured = np.zeros(len(array), dtype=dtype)
+    if len(array) > 0:
+        structured[field] = array
+    return structured
+
+
 def msht_from_numpy(
     coordinates,
     *, # Get everything else as keyword args
@@ -2123,26 +2905,18 @@ def msht_from_numpy(
         if not isinstance(crs, CRS):
             crs = CRS.from_user_input(crs)
         mesh.crs = crs
-    mesh.vert2 = np.array(
-        [(coord, 0) for coord in coordinates],
-        dtype=jigsaw_msh_t.VERT2_t
-        )
+    mesh.vert2 = _structured_from_numpy(
+        coordinates, 'coord', jigsaw_msh_t.VERT2_t)
 
     if edges is not None:
-        mesh.edge2 = np.array(
-            [(index, 0) for index in edges],
-            dtype=jigsaw_msh_t.EDGE2_t
-        )
+        mesh.edge2 = _structured_from_numpy(
+            edges, 'index', jigsaw_msh_t.EDGE2_t)
     if triangles is not None:
-        mesh.tria3 = np.array(
-            [(index, 0) for index in triangles],
-            dtype=jigsaw_msh_t.TRIA3_t
-        )
+        mesh.tria3 = _structured_from_numpy(
+            triangles, 'index', jigsaw_msh_t.TRIA3_t)
     if quadrilaterals is not None:
-        mesh.quad4 = np.array(
-            [(index, 0) for index in quadrilaterals],
-            dtype=jigsaw_msh_t.QUAD4_t
-        )
+        mesh.quad4 = _structured_from_numpy(
+            quadrilaterals, 'index', jigsaw_msh_t.QUAD4_t)
     if values is None:
         values = np.array(
             np.zeros((len(mesh.vert2), 1)),
@@ -2184,7 +2958,6 @@ def shape_to_msh_t(shape: Union[Polygon, MultiPolygon]) -> jigsaw_msh_t:
     NotImplementedError
     """
 
-    vert2: List[Tuple[Tuple[float, float], int]] = []
     if isinstance(shape, Polygon):
         shape = MultiPolygon([shape])
 
@@ -2194,37 +2967,45 @@ def shape_to_msh_t(shape: Union[Polygon, MultiPolygon]) -> jigsaw_msh_t:
     if not shape.is_valid:
         raise ValueError("Input contains invalid (multi)polygons!")
 
-    for polygon in shape.geoms:
-        if np.all(
-                np.asarray(
-                    polygon.exterior.coords).flatten() == float('inf')):
-            raise NotImplementedError("ellispoidal-mesh")
-        for x, y in polygon.exterior.coords[:-1]:
-            vert2.append(((x, y), 0))
-        for interior in polygon.interiors:
-            for x, y in interior.coords[:-1]:
-                vert2.append(((x, y), 0))
-
-    # edge2
-    edge2: List[Tuple[int, int]] = []
-    for polygon in shape.geoms:
-        polygon = [polygon.exterior, *polygon.interiors]
-        for linear_ring in polygon:
-            edg = []
-            for i in range(len(linear_ring.coords) - 2):
-                edg.append((i, i+1))
-            edg.append((edg[-1][1], edg[0][0]))
-            edge2.extend(
-                [(e0+len(edge2), e1+len(edge2))
-                    for e0, e1 in edg])
+    polygons = shapely.get_parts(shape)
+    exteriors = shapely.get_exterior_ring(polygons)
+    ext_coords, ext_idx = shapely.get_coordinates(
+        exteriors, return_index=True)
+    is_finite = np.bincount(
+        ext_idx,
+        weights=np.any(ext_coords != float('inf'), axis=1),
+        minlength=len(polygons))
+    if np.any(is_finite == 0):
+        raise NotImplementedError("ellispoidal-mesh")
+
+    # Rings are in the order of polygons, each exterior first
+    rings = shapely.get_rings(polygons)
+    coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+    n_ring_coords = np.bincount(ring_idx, minlength=len(rings))
+    ring_ends = np.cumsum(n_ring_coords)
+
+    # Last coord is the same as first in a ring
+    is_vert = np.ones(len(coords), dtype=bool)
+    is_vert[ring_ends[n_ring_coords > 0] - 1] = False
+    n_ring_verts = np.maximum(n_ring_coords - 1, 0)
+    ring_starts = np.cumsum(n_ring_verts) - n_ring_verts
+
+    # Each vertex is connected to the next one on the ring and the
+    # last one to the first one
+    n_verts = np.sum(n_ring_verts)
+    next_vert = np.arange(1, n_verts + 1)
+    has_verts = n_ring_verts > 0
+    next_vert[(ring_starts + n_ring_verts - 1)[has_verts]] = (
+        ring_starts[has_verts])
 
     msht = jigsaw_msh_t()
     msht.ndims = +2
     msht.mshID = 'euclidean-mesh'
-    msht.vert2 = np.asarray(vert2, dtype=jigsaw_msh_t.VERT2_t)
-    msht.edge2 = np.asarray(
-        [((e0, e1), 0) for e0, e1 in edge2],
-        dtype=jigsaw_msh_t.EDGE2_t)
+    msht.vert2 = np.zeros(n_verts, dtype=jigsaw_msh_t.VERT2_t)
+    msht.vert2['coord'] = coords[is_vert]
+    msht.edge2 = np.zeros(n_verts, dtype=jigsaw_msh_t.EDGE2_t)
+    msht.edge2['index'] = np.column_stack(
+        [np.arange(n_verts), next_vert])
     return msht
 
 
@@ -2243,59 +3024,35 @@ def shape_to_msh_t_2(
     if not np.all(gdf_shape.is_valid):
         raise ValueError("Input contains invalid (multi)polygons!")
 
-    df_lonlat = (
-        gdf_shape
-        .boundary
-        .explode(ignore_index=True)
-        .map(lambda i: i.coords)
-        .explode()
-        .apply(lambda s: pd.Series({'lon': s[0], 'lat': s[1]}))
-        .reset_index() # put polygon index in the dataframe
-        .drop_duplicates() # drop duplicates within polygons
-    )
-
-    df_seg = (
-        df_lonlat.join(
-            df_lonlat.groupby('index').transform(np.roll, 1, axis=0),
-            lsuffix='_1',
-            rsuffix='_2'
-        ).dropna()
-        .set_index('index')
-    )
-
-    df_nodes = (
-        df_lonlat.drop(columns='index') # drop to allow cross poly dupl
-        .drop_duplicates() # drop duplicates across multiple polygons
-        .reset_index(drop=True) # renumber nodes
-        .reset_index() # add node idx as df data column
-        .set_index(['lon','lat'])
-    )
-
-    # CRD Table
-    df_coo = df_nodes.reset_index().drop(columns='index')
-
-    # CNN Table
-    df_edg = (
-        df_nodes.loc[
-            pd.MultiIndex.from_frame(df_seg[['lon_1', 'lat_1']])
-        ].reset_index(drop=True)
-        .join(
-            df_nodes.loc[
-                pd.MultiIndex.from_frame(df_seg[['lon_2', 'lat_2']])
-            ]
-            .reset_index(drop=True),
-            lsuffix='_1',
-            rsuffix='_2'
-        )
-    )
-
-
-    ar_edg = np.sort(df_edg.values, axis=1)
+    # Rings are in the order of rows and polygons, exterior first
+    rings = shapely.get_rings(
+        shapely.get_parts(gdf_shape.geometry.values))
+    coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+
+    # Drop duplicates within rings, e.g. the closing coordinate
+    df_lonlat = pd.DataFrame(
+        {'index': ring_idx, 'lon': coords[:, 0], 'lat': coords[:, 1]})
+    df_lonlat = df_lonlat[~df_lonlat.duplicated().values]
+    ring_idx = df_lonlat['index'].values
+
+    # Each node is connected to the previous one on the ring and the
+    # first one to the last one
+    n_ring_nodes = np.bincount(ring_idx, minlength=len(rings))
+    ring_starts = np.cumsum(n_ring_nodes) - n_ring_nodes
+    prev_node = np.arange(-1, len(df_lonlat) - 1)
+    has_nodes = n_ring_nodes > 0
+    prev_node[ring_starts[has_nodes]] = (
+        ring_starts + n_ring_nodes - 1)[has_nodes]
+
+    # Number nodes by their first appearance across all polygons
+    node_idx = df_lonlat.groupby(
+        ['lon', 'lat'], sort=False).ngroup().values
+    df_coo = df_lonlat[~df_lonlat.duplicated(['lon', 'lat']).values]
+
+    ar_edg = np.sort(
+        np.column_stack([node_idx, node_idx[prev_node]]), axis=1)
     df_cnn = (
-        pd.DataFrame.from_records(
-            ar_edg,
-            columns=['index_1', 'index_2'],
-        )
+        pd.DataFrame(ar_edg, columns=['index_1', 'index_2'])
         .drop_duplicates() # Remove duplicate edges
         .reset_index(drop=True)
     )
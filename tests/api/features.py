@@ -1,4 +1,5 @@
 #! python
+import shutil
 import unittest
 import tempfile
 import warnings
@@ -7,12 +8,16 @@ from pathlib import Path
 import geopandas as gpd
 import numpy as np
 from pyproj import CRS
+import shapely
 from shapely import geometry
 import numpy as np
 
 import ocsmesh
 from ocsmesh.features.linefeature import LineFeature
 from ocsmesh.features.constraint import RegionConstraint
+from ocsmesh.features.contour import Contour, FilledContour
+from ocsmesh.cache import ContourRegistry, contour_registry
+from ocsmesh.utils import raster_from_numpy
 
 class LineFeatureCapabilities(unittest.TestCase):
 
@@ -456,5 +461,81 @@ class RegionConstraintCapabilities(unittest.TestCase):
 
 
 
+class ContourRegistryCapabilities(unittest.TestCase):
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast = self.tdir / 'rast.tif'
+
+        rast_xy = np.mgrid[-1:0.1:0.1, 0:1.1:0.1]
+        rast_z = np.ones_like(rast_xy[0]) * 10
+        rast_z[:, :5] = -10
+        raster_from_numpy(self.rast, rast_z, rast_xy, 4326)
+
+        contour_registry.clear()
+
+
+    def tearDown(self):
+        contour_registry.clear()
+        shutil.rmtree(self.tdir)
+
+
+    def test_contour_shared_between_sources(self):
+        hfun = ocsmesh.Hfun(ocsmesh.Raster(self.rast))
+        ctr = Contour(level=0, sources=[hfun])
+        lines, _ = next(ctr.iter_contours())
+        self.assertEqual(contour_registry.stats['misses'], 1)
+
+        rast = ocsmesh.Raster(self.rast)
+        ctr = Contour(level=0, sources=[rast])
+        lines_2, _ = next(ctr.iter_contours())
+        self.assertEqual(contour_registry.stats['hits'], 1)
+        self.assertTrue(lines.equals(lines_2))
+
+        ctr = Contour(level=5, sources=[rast])
+        next(ctr.iter_contours())
+        self.assertEqual(contour_registry.stats['misses'], 2)
+
+
+    def test_filled_contour_shared_with_geom(self):
+        geom = ocsmesh.Geom(ocsmesh.Raster(self.rast), zmax=0)
+        poly = geom.get_multipolygon()
+
+        ctr = FilledContour(level1=0, sources=[ocsmesh.Raster(self.rast)])
+        poly_2, _ = next(ctr.iter_contours())
+        self.assertEqual(contour_registry.stats['hits'], 1)
+        self.assertTrue(poly.equals(poly_2))
+
+
+    def test_modified_raster_not_shared(self):
+        rast = ocsmesh.Raster(self.rast)
+        contour_registry.get_multipolygon(rast, zmax=0)
+
+        rast.average_filter(size=3)
+        contour_registry.get_multipolygon(rast, zmax=0)
+        self.assertEqual(contour_registry.stats['hits'], 0)
+        self.assertEqual(contour_registry.stats['misses'], 2)
+
+
+    def test_bounded_by_size(self):
+        registry = ContourRegistry(max_bytes=0)
+        rast = ocsmesh.Raster(self.rast)
+        poly = registry.get_multipolygon(rast, zmax=0)
+        self.assertEqual(
+            registry.stats['nbytes'],
+            shapely.get_num_coordinates(poly) * 16)
+
+        # Only the latest contour is kept
+        registry.get_contour(rast, 0)
+        self.assertEqual(registry.stats['entries'], 1)
+        registry.get_multipolygon(rast, zmax=0)
+        self.assertEqual(registry.stats['misses'], 3)
+
+        registry.max_bytes = 2 ** 20
+        registry.get_multipolygon(rast, zmax=0)
+        registry.get_contour(rast, 0)
+        self.assertEqual(registry.stats['entries'], 2)
+        self.assertEqual(registry.stats['hits'], 1)
+
+
 if __name__ == '__main__':
     unittest.main()
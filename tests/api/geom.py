@@ -9,9 +9,11 @@ from jigsawpy import jigsaw_msh_t
 import geopandas as gpd
 import numpy as np
 import rasterio as rio
+from pyproj import CRS
 from shapely import geometry
 
 import ocsmesh
+from ocsmesh.cache import ResultCache
 
 from tests.api.common import (
     topo_2rast_1mesh,
@@ -291,6 +293,290 @@ class GeomCollector(unittest.TestCase):
 
 
 
+class GeomCollectorPatches(unittest.TestCase):
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast1 = self.tdir / 'rast_1.tif'
+        self.rast2 = self.tdir / 'rast_2.tif'
+        self.mesh1 = self.tdir / 'mesh_1.gr3'
+        topo_2rast_1mesh(self.rast1, self.rast2, self.mesh1)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+
+    def test_batch_same_as_each_patch(self):
+        shapes = [None, geometry.box(-0.25, -0.5, 0.5, -0.25)]
+        levels = [-5, 50]
+        for nprocs in [1, 2]:
+            geom_coll = ocsmesh.Geom(
+                [str(self.rast1), str(self.rast2)],
+                zmin=-100, zmax=10, nprocs=nprocs)
+            for shape in shapes:
+                for level in levels:
+                    geom_coll.add_patch(shape=shape, level=level)
+
+            out_dir = self.tdir / f'patches_{nprocs}'
+            patch_files = geom_coll._apply_patch(out_dir, None)
+            self.assertEqual(len(patch_files), len(shapes) * len(levels))
+
+            for e, (shape, level) in enumerate(
+                    [(s, l) for s in shapes for l in levels]):
+                # Patch polygons are clipped exactly by the patch shape
+                ref_path = out_dir / f'ref_{e}.feather'
+                ocsmesh.ops.combine_geometry(
+                    [str(self.rast1), str(self.rast2)], ref_path,
+                    "feather", None, None, True,
+                    -100, level, None, None, 1)
+                ref_poly = gpd.read_feather(ref_path).union_all()
+                if shape is not None:
+                    ref_poly = ref_poly.intersection(shape)
+                patch_poly = gpd.read_feather(patch_files[e]).union_all()
+                self.assertAlmostEqual(
+                    patch_poly.symmetric_difference(ref_poly).area, 0)
+
+
+class GeomCombinePriority(unittest.TestCase):
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+
+        # The last DEM has the highest priority and covers the second
+        self.dem_files = []
+        for name, (x0, x1, y0, y1), step in [
+                ('low.tif', (0, 2, 0, 1), 0.01),
+                ('covered.tif', (1.2, 1.4, 0.2, 0.4), 0.01),
+                ('high.tif', (1, 1.8, 0.1, 0.9), 0.02)]:
+            rast_xy = np.mgrid[x0:x1:step, y0:y1:step]
+            rast_z = np.full_like(rast_xy[0], -10)
+            ocsmesh.utils.raster_from_numpy(
+                self.tdir / name, rast_z, rast_xy, 4326)
+            self.dem_files.append(str(self.tdir / name))
+        self.boxes = [
+            geometry.box(*ocsmesh.Raster(dem).src.bounds)
+            for dem in self.dem_files]
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+
+    def test_dem_polygons_clipped_by_priority(self):
+        geom_comb = ocsmesh.ops.combine_geom.GeomCombine(
+            self.dem_files, self.tdir / 'out.feather', 'feather',
+            zmax=0, chunk_size=30, nprocs=1)
+        # pylint: disable=W0212
+        geom_comb._calc_crs = CRS.from_epsg(4326)
+        pri_covers = geom_comb._process_priority(self.dem_files)
+        poly_files, _ = geom_comb._serial_get_polygon(
+            None, self.tdir, [2, 1, 0], self.dem_files, {'zmax': 0},
+            30, None, pri_covers)
+
+        # Fully covered DEM contributes nothing
+        self.assertEqual(
+            [Path(path).name for path in poly_files],
+            ['low.tif.feather', 'high.tif.feather'])
+        low_poly, high_poly = [
+            geom_comb._read_multipolygon(path) for path in poly_files]
+
+        low_box, _, high_box = self.boxes
+        self.assertAlmostEqual(low_poly.intersection(high_box).area, 0)
+        # No gap between the DEMs polygons at the box edge
+        self.assertAlmostEqual(
+            low_box.difference(low_poly.union(high_poly)).area, 0)
+
+    def test_covered_dem_ignored(self):
+        out_polys = []
+        for dem_files in [self.dem_files, self.dem_files[::2]]:
+            out_file = self.tdir / f'out_{len(dem_files)}.feather'
+            ocsmesh.ops.combine_geometry(
+                dem_files, out_file, "feather", None, None, True,
+                None, 0, 30, None, 1)
+            out_polys.append(gpd.read_feather(out_file).union_all())
+
+        self.assertAlmostEqual(
+            out_polys[0].symmetric_difference(out_polys[1]).area, 0)
+        self.assertAlmostEqual(
+            out_polys[0].symmetric_difference(
+                self.boxes[0].union(self.boxes[2])).area, 0)
+
+
+class GeomCollectorCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast1 = self.tdir / 'rast_1.tif'
+        self.rast2 = self.tdir / 'rast_2.tif'
+        self.mesh1 = self.tdir / 'mesh_1.gr3'
+        topo_2rast_1mesh(self.rast1, self.rast2, self.mesh1)
+        self.cache = ResultCache(self.tdir / 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _get_multipolygon(self, zmax):
+        geom_coll = ocsmesh.Geom(
+            [self.rast1, self.rast2, self.mesh1],
+            zmin=-100,
+            zmax=zmax,
+            cache=self.cache
+        )
+        return geom_coll.get_multipolygon()
+
+    def test_cache_hit(self):
+        geom_poly_1 = self._get_multipolygon(zmax=10)
+        misses = self.cache.stats['misses']
+        geom_poly_2 = self._get_multipolygon(zmax=10)
+
+        self.assertEqual(self.cache.stats['misses'], misses)
+        self.assertGreater(self.cache.stats['hits'], 0)
+        self.assertTrue(geom_poly_1.equals(geom_poly_2))
+
+    def test_cache_miss_on_changed_spec(self):
+        self._get_multipolygon(zmax=10)
+        misses = self.cache.stats['misses']
+        self._get_multipolygon(zmax=5)
+
+        self.assertEqual(self.cache.stats['misses'], misses + 1)
+
+
+
+class GeomMultiPolygonMemo(unittest.TestCase):
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast1 = self.tdir / 'rast_1.tif'
+        self.rast2 = self.tdir / 'rast_2.tif'
+        self.mesh1 = self.tdir / 'mesh_1.gr3'
+        topo_2rast_1mesh(self.rast1, self.rast2, self.mesh1)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+
+    def test_raster_geom(self):
+        geom = ocsmesh.Geom(ocsmesh.Raster(self.rast1), zmax=10)
+        registry = ocsmesh.cache.contour_registry
+
+        poly_1 = geom.get_multipolygon()
+        n_lookups = registry.stats['hits'] + registry.stats['misses']
+        self.assertIs(geom.multipolygon, poly_1)
+        self.assertEqual(
+            registry.stats['hits'] + registry.stats['misses'], n_lookups)
+        self.assertFalse(geom.get_multipolygon(zmax=0).equals(poly_1))
+
+        # Memo doesn't change the fingerprint of the geometry
+        key = ocsmesh.cache.fingerprint(geom)
+        geom.clear_cache()
+        self.assertEqual(ocsmesh.cache.fingerprint(geom), key)
+        self.assertTrue(geom.get_multipolygon().equals(poly_1))
+        self.assertGreater(
+            registry.stats['hits'] + registry.stats['misses'], n_lookups)
+
+        # Modified raster is polygonized again
+        xmin, ymin, xmax, ymax = geom.raster.get_bbox().bounds
+        geom.raster.clip(geometry.box(xmin, ymin, (xmin + xmax) / 2, ymax))
+        self.assertLess(geom.get_multipolygon().area, poly_1.area)
+
+
+    def test_mesh_geom(self):
+        mesh = ocsmesh.Mesh.open(str(self.mesh1), crs=4326)
+        geom = ocsmesh.Geom(mesh)
+
+        poly_1 = geom.get_multipolygon()
+        self.assertIs(geom.get_multipolygon(), poly_1)
+
+        geom.clear_cache()
+        poly_2 = geom.get_multipolygon()
+        self.assertIsNot(poly_2, poly_1)
+        self.assertTrue(poly_2.equals(poly_1))
+
+        # Modified mesh is not looked up from the memo
+        mesh.msh_t.value[:] += 1
+        self.assertIsNot(geom.get_multipolygon(), poly_2)
+
+
+    def test_bounded_size(self):
+        geom = ocsmesh.Geom(ocsmesh.Raster(self.rast1))
+        geom.max_cached = 2
+        polys = [geom.get_multipolygon(zmax=z) for z in [0, 5, 10]]
+        self.assertIs(geom.get_multipolygon(zmax=10), polys[2])
+        self.assertIs(geom.get_multipolygon(zmax=5), polys[1])
+
+        registry = ocsmesh.cache.contour_registry
+        n_lookups = registry.stats['hits'] + registry.stats['misses']
+        geom.get_multipolygon(zmax=0)
+        self.assertEqual(
+            registry.stats['hits'] + registry.stats['misses'],
+            n_lookups + 1)
+
+
+class GeomMultiPolygonOpen(unittest.TestCase):
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast1 = self.tdir / 'rast_1.tif'
+        self.rast2 = self.tdir / 'rast_2.tif'
+        self.mesh1 = self.tdir / 'mesh_1.gr3'
+        topo_2rast_1mesh(self.rast1, self.rast2, self.mesh1)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+
+    def test_same_as_feather_output(self):
+        for out_format in ["feather", "parquet"]:
+            ocsmesh.ops.combine_geometry(
+                [str(self.rast1), str(self.rast2)],
+                self.tdir / f'out.{out_format}',
+                out_format, None, None, True,
+                -100, 10, None, None, 1)
+        ref_poly = gpd.read_feather(self.tdir / 'out.feather').union_all()
+
+        geom = ocsmesh.geom.shapely.MultiPolygonGeom.open(
+            self.tdir / 'out.parquet')
+        self.assertEqual(geom.crs.to_epsg(), 4326)
+        self.assertAlmostEqual(
+            geom.get_multipolygon().symmetric_difference(ref_poly).area, 0)
+
+        bbox = (-0.5, -0.5, 0, 0)
+        geom = ocsmesh.geom.shapely.MultiPolygonGeom.open(
+            self.tdir / 'out.parquet', bbox=bbox)
+        self.assertTrue(all(
+            poly.envelope.intersects(geometry.box(*bbox))
+            for poly in geom.get_multipolygon().geoms))
+
+
+class GeomSimplifyBySize(unittest.TestCase):
+
+    def setUp(self):
+        # Circle with a vertex about every 1 m in a projected CRS
+        circle = geometry.Point(0, 0).buffer(1000, resolution=1600)
+        self.geom = ocsmesh.Geom(
+            geometry.MultiPolygon([circle]), crs='EPSG:32619')
+
+        xy = np.array([[-2000, -2000], [2000, -2000], [0, 2000]])
+        self.hfun = ocsmesh.utils.msht_from_numpy(
+            xy, triangles=[[0, 1, 2]], values=np.full((3, 1), 100.),
+            crs='EPSG:32619')
+
+    def test_msh_t_simplified(self):
+        orig_msht = self.geom.msh_t()
+        simple_msht = self.geom.msh_t(hfun=self.hfun)
+
+        self.assertTrue(isinstance(simple_msht, jigsaw_msh_t))
+        self.assertEqual(simple_msht.crs, orig_msht.crs)
+        self.assertLess(len(simple_msht.vert2), len(orig_msht.vert2) / 10)
+        self.assertEqual(len(simple_msht.vert2), len(simple_msht.edge2))
+
+        # Simplified boundary is within the tolerance
+        radii = np.linalg.norm(simple_msht.vert2['coord'], axis=1)
+        self.assertTrue(np.allclose(radii, 1000))
+
+    def test_invalid_fraction(self):
+        with self.assertRaises(ValueError):
+            self.geom.msh_t(hfun=self.hfun, simplify_fraction=0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,8 @@
 #! python
+import json
+import os
 import unittest
+from unittest.mock import patch
 from copy import deepcopy
 from pathlib import Path
 import shutil
@@ -9,9 +12,14 @@ import warnings
 from jigsawpy import jigsaw_msh_t
 import geopandas as gpd
 import numpy as np
-from shapely import geometry
+import rasterio
+from matplotlib.tri import Triangulation
+from shapely import geometry, ops
 
 import ocsmesh
+from ocsmesh.cache import ResultCache, fingerprint
+from ocsmesh.hfun.raster import ProjectedXYCache
+from ocsmesh.profiling import StageProfiler
 
 from tests.api.common import (
     topo_2rast_1mesh,
@@ -115,6 +123,24 @@ class SizeFunctionCollector(unittest.TestCase):
         hfun_msht = hfun_coll.msh_t()
         self.assertTrue(isinstance(hfun_msht, jigsaw_msh_t))
 
+    def test_multi_raster_parallel_matches_serial(self):
+        hfun_msht_list = []
+        for nprocs in [1, 2]:
+            hfun_coll = ocsmesh.Hfun(
+                [ocsmesh.Raster(self.rast1), ocsmesh.Raster(self.rast2)],
+                hmin=500,
+                hmax=10000,
+                nprocs=nprocs
+            )
+            hfun_msht_list.append(hfun_coll.msh_t())
+
+        serial, parallel = hfun_msht_list
+        self.assertTrue(np.array_equal(
+            serial.vert2['coord'], parallel.vert2['coord']))
+        self.assertTrue(np.array_equal(
+            serial.tria3['index'], parallel.tria3['index']))
+        self.assertTrue(np.array_equal(serial.value, parallel.value))
+
     def test_multi_mix_input(self):
         rast1 = ocsmesh.Raster(self.rast1)
         mesh1 = ocsmesh.Mesh.open(self.mesh1, crs=4326)
@@ -1064,5 +1090,886 @@ class SizeFunctionWithRegionConstraint(unittest.TestCase):
         self.assertTrue(np.isclose(np.mean(clipped_hfun.value), 1000, rtol=0.25))
         self.assertTrue(np.isclose(np.mean(inv_clipped_hfun.value), 500, rtol=0.1))
 
+
+class SizeFunctionRasterFeatureEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast = self.tdir / 'rast_1.tif'
+
+        rast_xy = np.mgrid[0:0.5:0.005, 0:0.5:0.005]
+        rast_z = np.ones_like(rast_xy[0])
+        ocsmesh.utils.raster_from_numpy(
+            self.rast, rast_z, rast_xy, 4326
+        )
+
+        self.feature = geometry.MultiLineString([
+            [(0.1, 0.1), (0.25, 0.3), (0.4, 0.2)],
+            [(0.05, 0.45), (0.45, 0.45)],
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _get_values(self, engine, chunk_size=None, hmax=5000):
+        rast = ocsmesh.Raster(self.rast, chunk_size=chunk_size)
+        hfun = ocsmesh.Hfun(rast, hmin=100, hmax=hmax)
+        hfun.add_feature(
+            self.feature,
+            expansion_rate=0.01,
+            target_size=100,
+            engine=engine,
+            nprocs=1)
+        return hfun.values
+
+    def test_edt_matches_kdtree(self):
+        kdtree_values = self._get_values('kdtree')
+        edt_values = self._get_values('edt')
+
+        # Error is at most a pixel (~550m) plus half the feature
+        # resampling distance, scaled by rate * target size
+        self.assertTrue(
+            np.all(np.abs(kdtree_values - edt_values) < 0.01 * 100 * 800))
+        self.assertTrue(
+            np.isclose(np.mean(kdtree_values), np.mean(edt_values), rtol=0.05))
+
+    def test_edt_no_cutoff(self):
+        kdtree_values = self._get_values('kdtree', hmax=None)
+        with self.assertLogs('ocsmesh.hfun.raster', 'INFO') as cm:
+            edt_values = self._get_values('edt', hmax=None)
+
+        # Without cutoff kdtree is used instead of full grid transforms
+        self.assertTrue(any('using kdtree engine' in msg for msg in cm.output))
+        self.assertTrue(np.array_equal(kdtree_values, edt_values))
+
+    def test_edt_windowed_matches_single_window(self):
+        single_values = self._get_values('edt')
+        windowed_values = self._get_values('edt', chunk_size=30)
+
+        self.assertTrue(np.allclose(single_values, windowed_values, rtol=0.05))
+
+    def test_invalid_engine(self):
+        rast = ocsmesh.Raster(self.rast)
+        hfun = ocsmesh.Hfun(rast, hmin=100, hmax=5000)
+        self.assertRaises(
+            ValueError,
+            hfun.add_feature,
+            self.feature,
+            expansion_rate=0.01,
+            target_size=100,
+            engine='balltree',
+            nprocs=1)
+
+
+
+class SizeFunctionRasterDeferred(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast = self.tdir / 'rast_1.tif'
+
+        rast_xy = np.mgrid[0:0.5:0.005, 0:0.5:0.005]
+        rast_z = 30 * (rast_xy[0] - 0.25) + 10 * np.sin(8 * rast_xy[1])
+        ocsmesh.utils.raster_from_numpy(
+            self.rast, rast_z, rast_xy, 4326
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _refine(self, hfun):
+        hfun.add_topo_bound_constraint(
+            value=500, upper_bound=-10, value_type='max')
+        hfun.add_feature(
+            geometry.LineString([(0.1, 0.1), (0.4, 0.35)]),
+            expansion_rate=0.01,
+            target_size=100,
+            nprocs=1)
+        hfun.add_constant_value(300, lower_bound=0, upper_bound=5)
+        hfun.add_patch(geometry.box(0.3, 0.05, 0.35, 0.1), target_size=80)
+        hfun.add_subtidal_flow_limiter(hmin=100, hmax=1500, upper_bound=0)
+
+    def test_deferred_matches_immediate(self):
+        rast = ocsmesh.Raster(self.rast, chunk_size=40)
+        hfun_immediate = ocsmesh.Hfun(rast, hmin=50, hmax=2000)
+        self._refine(hfun_immediate)
+
+        rast = ocsmesh.Raster(self.rast, chunk_size=40)
+        hfun_deferred = ocsmesh.Hfun(
+            rast, hmin=50, hmax=2000, deferred=True)
+        self._refine(hfun_deferred)
+        hfun_deferred.commit()
+
+        self.assertTrue(
+            np.allclose(hfun_immediate.values, hfun_deferred.values))
+
+    def test_deferred_queues_until_commit(self):
+        rast = ocsmesh.Raster(self.rast)
+        hfun = ocsmesh.Hfun(rast, hmin=50, hmax=2000, deferred=True)
+        self._refine(hfun)
+
+        self.assertTrue(
+            np.all(hfun.values == np.finfo(np.float32).max))
+
+        hfun.deferred = False
+        self.assertTrue(np.all(hfun.values <= 2000))
+        self.assertEqual(np.min(hfun.values), 80)
+
+
+
+class SizeFunctionRasterXYCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast = self.tdir / 'rast_1.tif'
+
+        rast_xy = np.mgrid[0:0.5:0.005, 0:0.5:0.005]
+        rast_z = np.ones_like(rast_xy[0])
+        ocsmesh.utils.raster_from_numpy(
+            self.rast, rast_z, rast_xy, 4326
+        )
+        self.utm = 'EPSG:32631'
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_shared_between_objects(self):
+        cache = ProjectedXYCache(cache_dir=self.tdir / 'cache')
+        hfun_1 = ocsmesh.Hfun(ocsmesh.Raster(self.rast))
+        hfun_2 = ocsmesh.Hfun(ocsmesh.Raster(self.rast))
+        window = next(hfun_1.iter_windows())
+
+        xy_1 = cache.get(hfun_1, window, self.utm)
+        xy_2 = cache.get(hfun_2, window, self.utm)
+
+        self.assertTrue(np.all(xy_1 == xy_2))
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertEqual(cache.stats['hits'], 1)
+
+        # New cache on the same directory, e.g. in another process
+        cache_2 = ProjectedXYCache(cache_dir=self.tdir / 'cache')
+        cache_2.get(hfun_2, window, self.utm)
+        self.assertEqual(cache_2.stats['misses'], 0)
+
+    def test_lru_eviction(self):
+        rast = ocsmesh.Raster(self.rast, chunk_size=50)
+        hfun = ocsmesh.Hfun(rast)
+        windows = list(hfun.iter_windows())
+        entry_bytes = 50 * 50 * 2 * 4
+        cache = ProjectedXYCache(
+            max_bytes=2 * entry_bytes + 1024, cache_dir=self.tdir / 'cache')
+
+        for window in windows:
+            cache.get(hfun, window, self.utm)
+
+        self.assertEqual(cache.stats['entries'], 2)
+        self.assertEqual(cache.stats['evictions'], len(windows) - 2)
+        self.assertLessEqual(cache.stats['nbytes'], cache.max_bytes)
+
+        # Most recently used is still cached
+        cache.get(hfun, windows[-1], self.utm)
+        self.assertEqual(cache.stats['hits'], 1)
+
+    def test_removed_before_load(self):
+        removed = []
+
+        class RemovingCache(ProjectedXYCache):
+            def get_path(self, *args):
+                path = super().get_path(*args)
+                # Evicted by another process right after lookup
+                if not removed:
+                    path.unlink()
+                    removed.append(path)
+                return path
+
+        cache = RemovingCache(cache_dir=self.tdir / 'cache')
+        hfun = ocsmesh.Hfun(ocsmesh.Raster(self.rast))
+        window = next(hfun.iter_windows())
+
+        xy = cache.get(hfun, window, self.utm)
+        ref_xy = ProjectedXYCache(cache_dir=self.tdir / 'ref').get(
+            hfun, window, self.utm)
+
+        self.assertEqual(len(removed), 1)
+        self.assertTrue(np.all(xy == ref_xy))
+        self.assertEqual(cache.stats['misses'], 2)
+        self.assertEqual(cache.stats['entries'], 1)
+
+
+
+class SizeFunctionRasterFlowLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast = self.tdir / 'rast_1.tif'
+
+        rast_xy = np.mgrid[300000:330000:200, 4500000:4530000:200]
+        rast_z = (
+            30 * np.sin(rast_xy[0] / 1700) * np.cos(rast_xy[1] / 2300)
+            + (rast_xy[0] - 300000) / 1500 - 20)
+        rast_z[50:60, 50:60] = -5
+        ocsmesh.utils.raster_from_numpy(
+            self.rast, rast_z, rast_xy, 32619
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _get_values(self, chunk_size=None):
+        rast = ocsmesh.Raster(self.rast, chunk_size=chunk_size)
+        hfun = ocsmesh.Hfun(rast, hmin=100, hmax=5000)
+        hfun.add_subtidal_flow_limiter(
+            hmin=200, hmax=3000, upper_bound=0, lower_bound=-35)
+        return rast, hfun.values
+
+    def test_windowed_matches_single_window(self):
+        _, single_values = self._get_values()
+        _, windowed_values = self._get_values(chunk_size=37)
+
+        self.assertTrue(np.allclose(single_values, windowed_values))
+
+    def test_values(self):
+        rast, values = self._get_values()
+
+        topobathy = rast.values
+        self.assertTrue(np.all(values >= 100))
+        self.assertTrue(np.all(values <= 5000))
+        # Outside of bounds or flat region the refinement is not applied
+        self.assertTrue(np.all(values[topobathy > 0] == 5000))
+        self.assertTrue(np.all(values[topobathy < -35] == 5000))
+        self.assertTrue(np.all(values[51:59, 51:59] == 5000))
+        in_bounds = (topobathy <= 0) & (topobathy >= -35)
+        in_bounds[50:60, 50:60] = False
+        self.assertTrue(np.all(values[in_bounds] <= 3000))
+
+    def test_thread_pool_per_commit(self):
+        _, ref_values = self._get_values()
+
+        for nprocs, n_pools in [(1, 0), (3, 1)]:
+            rast = ocsmesh.Raster(self.rast, chunk_size=37)
+            hfun = ocsmesh.Hfun(rast, hmin=100, hmax=5000, deferred=True)
+            hfun.add_subtidal_flow_limiter(
+                hmin=200, hmax=3000, upper_bound=0, lower_bound=-35)
+            with patch(
+                    'ocsmesh.hfun.raster.ThreadPool',
+                    wraps=ocsmesh.hfun.raster.ThreadPool) as mock_pool:
+                hfun.commit(nprocs=nprocs)
+            self.assertEqual(mock_pool.call_count, n_pools)
+            for call in mock_pool.call_args_list:
+                self.assertEqual(call.kwargs['processes'], nprocs)
+            self.assertTrue(np.allclose(hfun.values, ref_values))
+
+
+
+class SizeFunctionRasterSparseWindows(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast = self.tdir / 'rast_1.tif'
+
+        rast_xy = np.mgrid[300000:330000:300, 4500000:4530000:300]
+        rast_z = (rast_xy[0] - 300000) / 300 - 20
+        ocsmesh.utils.raster_from_numpy(
+            self.rast, rast_z, rast_xy, 32619
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _refine(self, chunk_size):
+        rast = ocsmesh.Raster(self.rast, chunk_size=chunk_size)
+        hfun = ocsmesh.Hfun(rast, hmin=50, hmax=5000)
+        hfun.add_constant_value(1000)
+        with self.assertLogs('ocsmesh.hfun.raster', level='DEBUG') as logs:
+            hfun.add_patch(
+                geometry.box(301000, 4501000, 304000, 4504000),
+                target_size=100)
+            hfun.add_feature(
+                geometry.LineString(
+                    [(325000, 4525000), (329000, 4529000)]),
+                expansion_rate=0.01,
+                target_size=100,
+                engine='edt',
+                nprocs=1)
+            hfun.add_constant_value(500, lower_bound=20, upper_bound=25)
+        n_skipped = sum('Skipping window' in msg for msg in logs.output)
+        return hfun.values, n_skipped
+
+    def test_skipped_windows(self):
+        values, _ = self._refine(None)
+        windowed_values, n_skipped = self._refine(25)
+
+        self.assertTrue(np.allclose(values, windowed_values))
+        # 16 windows, each refinement only affects some of them
+        self.assertGreater(n_skipped, 16)
+        self.assertEqual(np.min(values), 100)
+        self.assertTrue(np.any(values == 500))
+
+    def test_window_meshes_on_disk(self):
+        rast = ocsmesh.Raster(self.rast, chunk_size=25)
+        hfun = ocsmesh.Hfun(rast, hmin=100, hmax=5000)
+        hfun.add_constant_value(1000, lower_bound=0)
+        hfun_msht_1 = hfun.msh_t()
+
+        # Only the paths of the window meshes are kept in memory
+        self.assertEqual(
+            len(hfun._window_msh_t), len(list(hfun.iter_windows())))
+        for _, win_path in hfun._window_msh_t.values():
+            self.assertTrue((win_path / 'coord.npy').is_file())
+
+        with patch.object(
+                ocsmesh.hfun.raster.libsaw, 'jigsaw') as mock_jigsaw:
+            hfun_msht_2 = hfun.msh_t()
+            mock_jigsaw.assert_not_called()
+        self.assertTrue(np.array_equal(
+            hfun_msht_1.vert2['coord'], hfun_msht_2.vert2['coord']))
+        self.assertTrue(np.array_equal(
+            hfun_msht_1.tria3['index'], hfun_msht_2.tria3['index']))
+        self.assertTrue(np.array_equal(
+            hfun_msht_1.value, hfun_msht_2.value))
+
+class SizeFunctionCollectorDispatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast1 = self.tdir / 'rast_1.tif'
+        self.rast2 = self.tdir / 'rast_2.tif'
+        self.rast3 = self.tdir / 'rast_3.tif'
+        self.mesh1 = self.tdir / 'mesh_1.gr3'
+        topo_2rast_1mesh(self.rast1, self.rast2, self.mesh1)
+
+        rast_xy_3 = np.mgrid[10:11.1:0.1, 10:11.1:0.1]
+        ocsmesh.utils.raster_from_numpy(
+            self.rast3, np.ones_like(rast_xy_3[0]) * -10, rast_xy_3, 4326
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_prune_far_inputs(self):
+        hfun_coll = ocsmesh.Hfun(
+            [self.rast1, self.rast2, self.rast3, self.mesh1],
+            hmin=500,
+            hmax=10000,
+            nprocs=1
+        )
+        hfun_coll.add_patch(
+            shape=geometry.box(-0.5, -0.5, -0.4, -0.4),
+            target_size=600,
+            expansion_rate=0.01)
+
+        with self.assertLogs('ocsmesh.hfun.collector', 'INFO') as cm:
+            hfun_coll._apply_patch()
+        self.assertTrue(any(
+            'Pruned 3 of 4 (patch, input)' in msg for msg in cm.output))
+
+        far_hfun = hfun_coll._hfun_list[2]
+        far_hfun.commit()
+        # Global hmax is still applied to pruned inputs
+        self.assertTrue(np.all(far_hfun.get_values(band=1) == 10000))
+
+        near_hfun = hfun_coll._hfun_list[0]
+        near_hfun.commit()
+        self.assertEqual(np.min(near_hfun.get_values(band=1)), 600)
+
+    def test_no_pruning_without_hmax(self):
+        hfun_coll = ocsmesh.Hfun(
+            [self.rast1, self.rast3],
+            hmin=500,
+            nprocs=1
+        )
+        hfun_coll.add_feature(
+            geometry.LineString([(-0.9, -0.5), (-0.1, -0.4)]),
+            expansion_rate=0.01,
+            target_size=600)
+
+        with self.assertLogs('ocsmesh.hfun.collector', 'INFO') as cm:
+            hfun_coll._apply_linefeatures()
+        self.assertTrue(any(
+            'Pruned 0 of 2 (line feature, input)' in msg
+            for msg in cm.output))
+
+
+class SizeFunctionCollectorCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast1 = self.tdir / 'rast_1.tif'
+        self.rast2 = self.tdir / 'rast_2.tif'
+        self.mesh1 = self.tdir / 'mesh_1.gr3'
+        topo_2rast_1mesh(self.rast1, self.rast2, self.mesh1)
+        self.cache = ResultCache(self.tdir / 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _get_collector(self, level=0, target_size=1000):
+        hfun_coll = ocsmesh.Hfun(
+            [ocsmesh.Raster(self.rast1), str(self.rast2)],
+            hmin=500,
+            hmax=10000,
+            nprocs=1,
+            cache=self.cache
+        )
+        hfun_coll.add_contour(level, 0.1, target_size)
+        hfun_coll.add_patch(
+            shape=geometry.box(-1, -1, 0, 0), target_size=700)
+        hfun_coll.add_topo_func_constraint(
+            lambda i: i / 3.0, upper_bound=-10)
+        return hfun_coll
+
+    def test_cache_keys_stable(self):
+        keys_1 = self._get_collector()._get_cache_keys()
+        keys_2 = self._get_collector()._get_cache_keys()
+
+        self.assertEqual(keys_1['result'], keys_2['result'])
+        self.assertEqual(
+            sorted(k for k in keys_1.values()),
+            sorted(k for k in keys_2.values()))
+
+    def test_cache_keys_depend_on_specs(self):
+        key = self._get_collector()._get_cache_keys()['result']
+        self.assertNotEqual(
+            key, self._get_collector(level=-5)._get_cache_keys()['result'])
+        self.assertNotEqual(
+            key,
+            self._get_collector(target_size=900)._get_cache_keys()['result'])
+
+    def test_cache_hit(self):
+        hfun_msht_1 = self._get_collector().msh_t()
+        hits = self.cache.stats['hits']
+        hfun_msht_2 = self._get_collector().msh_t()
+
+        self.assertEqual(self.cache.stats['hits'], hits + 1)
+        self.assertTrue(np.array_equal(hfun_msht_1.value, hfun_msht_2.value))
+
+    def test_fingerprint_content(self):
+        self.assertEqual(
+            fingerprint(ocsmesh.Raster(self.rast1)),
+            fingerprint(ocsmesh.Raster(self.rast1)))
+        self.assertNotEqual(
+            fingerprint(ocsmesh.Raster(self.rast1)),
+            fingerprint(ocsmesh.Raster(self.rast2)))
+        self.assertNotEqual(
+            fingerprint(lambda i: i / 2.0), fingerprint(lambda i: i / 3.0))
+
+    def test_raster_digest_persisted(self):
+        key = fingerprint(ocsmesh.Raster(self.rast1))
+
+        # New process, where input raster content is not read again
+        ocsmesh.cache._raster_digests.clear()
+        rast = ocsmesh.Raster(self.rast1)
+        with patch.object(ocsmesh.cache.rasterio, 'open') as mock_open:
+            self.assertEqual(fingerprint(rast), key)
+            mock_open.assert_not_called()
+
+        # Modified file is read again
+        with rasterio.open(self.rast1, 'r+') as dst:
+            dst.write(dst.read() + 1)
+        self.assertNotEqual(fingerprint(ocsmesh.Raster(self.rast1)), key)
+
+    def test_working_file_digest_rewritten(self):
+        hfun = ocsmesh.Hfun(ocsmesh.Raster(self.rast1), hmin=500, hmax=1e4)
+        hfun.add_patch(geometry.box(-1, -1, 0, 0), target_size=700)
+        stat = os.stat(hfun.tmpfile)
+        digest = ocsmesh.cache._get_raster_digest(hfun.tmpfile)
+        key = fingerprint(hfun)
+
+        # Rewritten in place at the same size within one time tick
+        with rasterio.open(hfun.tmpfile, 'r+') as dst:
+            dst.write(dst.read() + 1)
+        os.utime(hfun.tmpfile, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(os.stat(hfun.tmpfile).st_size, stat.st_size)
+
+        self.assertNotEqual(
+            ocsmesh.cache._get_raster_digest(hfun.tmpfile), digest)
+        self.assertNotEqual(fingerprint(hfun), key)
+
+    def test_fingerprint_initial_size_function(self):
+        hfun_1 = ocsmesh.Hfun(ocsmesh.Raster(self.rast1), hmin=500, hmax=1e4)
+        hfun_2 = ocsmesh.Hfun(ocsmesh.Raster(self.rast1), hmin=500, hmax=1e4)
+        key = fingerprint(hfun_1)
+
+        # Initial size function values are not read
+        with patch.object(ocsmesh.cache.rasterio, 'open') as mock_open:
+            self.assertEqual(fingerprint(hfun_2), key)
+            mock_open.assert_not_called()
+
+        hfun_2.add_patch(geometry.box(-1, -1, 0, 0), target_size=700)
+        self.assertNotEqual(fingerprint(hfun_2), key)
+
+    def test_eviction(self):
+        cache = ResultCache(self.tdir / 'small_cache', max_bytes=3000)
+        for i in range(5):
+            cache.put(f'key{i}', np.zeros(200))
+
+        self.assertLessEqual(cache.stats['nbytes'], 3000)
+        self.assertGreater(cache.stats['evictions'], 0)
+        self.assertIsNone(cache.get('key0'))
+        self.assertTrue(np.array_equal(cache.get('key4'), np.zeros(200)))
+
+
+class SizeFunctionCollectorIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast1 = self.tdir / 'rast_1.tif'
+        self.rast2 = self.tdir / 'rast_2.tif'
+        self.mesh1 = self.tdir / 'mesh_1.gr3'
+        topo_2rast_1mesh(self.rast1, self.rast2, self.mesh1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _get_collector(self, cache=None):
+        hfun_coll = ocsmesh.Hfun(
+            [ocsmesh.Raster(self.rast1, chunk_size=4),
+             ocsmesh.Raster(self.rast2, chunk_size=4)],
+            hmin=500,
+            hmax=10000,
+            nprocs=1,
+            cache=cache
+        )
+        hfun_coll.add_patch(
+            shape=geometry.box(-0.9, -0.6, -0.8, -0.5), target_size=700)
+        return hfun_coll
+
+    def _add_more(self, hfun_coll):
+        hfun_coll.add_patch(
+            shape=geometry.box(0.8, -0.2, 0.9, -0.1), target_size=600)
+        hfun_coll.add_topo_bound_constraint(
+            value=800, upper_bound=-10, source_index=1)
+
+    def test_pending_specs(self):
+        hfun_coll = self._get_collector()
+        self.assertIsNone(hfun_coll._get_pending_info())
+
+        hfun_coll._apply_features()
+        self._add_more(hfun_coll)
+        pending = hfun_coll._get_pending_info()
+        self.assertEqual(len(pending['patch']), 1)
+        self.assertEqual(len(pending['constraint']), 1)
+        self.assertEqual(len(pending['contour']), 0)
+
+        # Modifying an applied spec requires applying everything
+        patch_defn, _ = next(iter(hfun_coll._refine_patch_info_coll))
+        hfun_coll.add_patch(patch_defn=patch_defn, target_size=900)
+        self.assertIsNone(hfun_coll._get_pending_info())
+
+    def test_incremental_matches_full(self):
+        hfun_coll = self._get_collector()
+        hfun_coll.msh_t()
+        self._add_more(hfun_coll)
+        hfun_msht_1 = hfun_coll.msh_t()
+
+        hfun_coll = self._get_collector()
+        self._add_more(hfun_coll)
+        hfun_msht_2 = hfun_coll.msh_t()
+
+        self.assertTrue(np.array_equal(
+            hfun_msht_1.vert2['coord'], hfun_msht_2.vert2['coord']))
+        self.assertTrue(np.array_equal(
+            hfun_msht_1.value, hfun_msht_2.value))
+
+    def test_incremental_cache_keys(self):
+        cache = ResultCache(self.tdir / 'cache')
+        hfun_coll = self._get_collector(cache=cache)
+        hfun_coll.msh_t()
+        self._add_more(hfun_coll)
+        hfun_msht_1 = hfun_coll.msh_t()
+
+        # Incremental result is keyed by the initial inputs
+        hfun_coll_2 = self._get_collector(cache=cache)
+        self._add_more(hfun_coll_2)
+        hits = cache.stats['hits']
+        hfun_msht_2 = hfun_coll_2.msh_t()
+        self.assertEqual(cache.stats['hits'], hits + 1)
+        self.assertTrue(np.array_equal(
+            hfun_msht_1.value, hfun_msht_2.value))
+
+        # Inputs refined by a modified specification are not cached
+        patch_defn, _ = next(iter(hfun_coll._refine_patch_info_coll))
+        hfun_coll.add_patch(patch_defn=patch_defn, target_size=900)
+        self.assertIsNone(hfun_coll._get_cache_keys())
+        hfun_coll.msh_t()
+        hfun_coll.add_patch(
+            shape=geometry.box(0.5, -0.2, 0.6, -0.1), target_size=600)
+        self.assertIsNone(hfun_coll._get_cache_keys())
+
+    def test_region_constraint_after_msh_t(self):
+        def _add_region(hfun_coll):
+            hfun_coll.add_region_constraint(
+                value=600,
+                shape=geometry.box(-0.9, -0.6, -0.5, -0.2),
+                crs='4326',
+                value_type='max',
+                rate=None)
+
+        hfun_coll = self._get_collector(cache=ResultCache(self.tdir / 'cache'))
+        hfun_msht_0 = hfun_coll.msh_t()
+        key = hfun_coll._get_cache_keys()['result']
+        _add_region(hfun_coll)
+        self.assertNotEqual(hfun_coll._get_cache_keys()['result'], key)
+        self.assertEqual(len(hfun_coll._get_pending_info()['constraint']), 1)
+        hfun_msht_1 = hfun_coll.msh_t()
+
+        hfun_coll = self._get_collector()
+        _add_region(hfun_coll)
+        hfun_msht_2 = hfun_coll.msh_t()
+
+        self.assertFalse(np.array_equal(
+            hfun_msht_0.value, hfun_msht_1.value))
+        self.assertTrue(np.array_equal(
+            hfun_msht_1.vert2['coord'], hfun_msht_2.vert2['coord']))
+        self.assertTrue(np.array_equal(
+            hfun_msht_1.value, hfun_msht_2.value))
+
+    def test_only_modified_windows_meshed(self):
+        hfun_coll = self._get_collector()
+        hfun_coll.msh_t()
+        hfun_rast_1, hfun_rast_2 = hfun_coll._hfun_list
+
+        hfun_coll.add_patch(
+            shape=geometry.box(0.8, -0.2, 0.9, -0.1), target_size=600)
+        hfun_coll._apply_features()
+        hfun_rast_1.commit()
+        hfun_rast_2.commit()
+
+        self.assertEqual(len(hfun_rast_1._get_stale_windows()), 0)
+        stale_windows = hfun_rast_2._get_stale_windows()
+        self.assertGreater(len(stale_windows), 0)
+        self.assertLess(
+            len(stale_windows), len(list(hfun_rast_2.iter_windows())))
+
+
+
+class SizeFunctionCollectorBigRaster(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast1 = self.tdir / 'rast_1.tif'
+        self.rast2 = self.tdir / 'rast_2.tif'
+        self.mesh1 = self.tdir / 'mesh_1.gr3'
+        topo_2rast_1mesh(self.rast1, self.rast2, self.mesh1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def _get_big_raster_values(self, nprocs, out_dir):
+        hfun_coll = ocsmesh.Hfun(
+            [ocsmesh.Raster(self.rast1), ocsmesh.Raster(self.rast2)],
+            hmin=500,
+            hmax=10000,
+            nprocs=nprocs,
+            method='fast'
+        )
+        hfun_coll.add_constant_value(
+            value=1000, lower_bound=-10, source_index=1)
+        out_dir.mkdir()
+        tile_list = hfun_coll._create_big_rasters(out_dir)
+        for tile, _ in tile_list:
+            self.assertIsNone(tile.src.nodata)
+        return np.concatenate(
+            [tile.get_values().ravel() for tile, _ in tile_list])
+
+    def test_parallel_matches_sequential(self):
+        values_1 = self._get_big_raster_values(1, self.tdir / 'big_1')
+        values_2 = self._get_big_raster_values(2, self.tdir / 'big_2')
+
+        self.assertTrue(np.array_equal(values_1, values_2))
+        # Only the second raster is reprojected
+        self.assertTrue(np.any(values_1 == -99999))
+        self.assertTrue(np.any(values_1 != -99999))
+
+    def test_tile_meshes_partition_dem_box(self):
+        def tile_msh_t(hfun):
+            # Regular mesh over the padded tile, not aligned with the
+            # tile edges
+            x0, y0, x1, y1 = hfun.src.bounds
+            xy = np.stack(np.meshgrid(
+                np.linspace(x0, x1, 7), np.linspace(y0, y1, 7)), -1)
+            return ocsmesh.utils.msht_from_numpy(
+                xy.reshape(-1, 2),
+                triangles=Triangulation(
+                    xy[..., 0].ravel(), xy[..., 1].ravel()).triangles,
+                values=np.full((49, 1), 1000.),
+                crs=hfun.crs)
+
+        hfun_coll = ocsmesh.Hfun(
+            [ocsmesh.Raster(self.rast1)],
+            hmin=500, hmax=10000, nprocs=1, method='fast')
+        hfun_coll.add_constant_value(value=1000, lower_bound=-10)
+        tile_hfun_list = hfun_coll._apply_features_fast()
+        self.assertGreater(len(tile_hfun_list), 1)
+
+        with patch.object(
+                ocsmesh.hfun.raster.HfunRaster, 'msh_t', tile_msh_t):
+            # pylint: disable=W0212
+            composite = hfun_coll._get_hfun_composite_fast(
+                tile_hfun_list, hfun_coll._big_box_list)
+
+        trias = [
+            geometry.Polygon(composite.vert2['coord'][idx])
+            for idx in composite.tria3['index']]
+        self.assertGreater(len(trias), 0)
+        union = ops.unary_union(trias)
+        # Seams are only approximately straight after reprojection
+        self.assertAlmostEqual(
+            sum(tria.area for tria in trias) / union.area, 1, places=4)
+        # Seams are owned by one of the tiles, so no gaps either
+        dem_box = hfun_coll._hfun_list[0].get_bbox(crs='EPSG:4326')
+        self.assertAlmostEqual(
+            union.intersection(dem_box).area / dem_box.area, 1, places=4)
+
+    def test_multi_resolution_tiles(self):
+        coarse_box = geometry.box(0, 0, 1000, 1000)
+        fine_box = geometry.box(100, 100, 200, 200)
+        get_tiles = ocsmesh.hfun.collector.HfunCollector._get_big_raster_tiles
+        tile_list = get_tiles(
+            (0, 0, 2000, 1000),
+            [coarse_box, fine_box], [100, 1],
+            res_lim=5,
+            n_cell_lim=400)
+
+        tile_boxes = [geometry.box(*bounds) for bounds, _ in tile_list]
+        # Tiles out of input rasters are dropped
+        self.assertTrue(
+            ops.unary_union(tile_boxes).equals(coarse_box))
+        for tile_box, (bounds, res) in zip(tile_boxes, tile_list):
+            self.assertLessEqual(
+                (bounds[2] - bounds[0]) * (bounds[3] - bounds[1]),
+                400 * res ** 2)
+            if tile_box.intersection(fine_box).area > 0:
+                # Capped by hmin / 2
+                self.assertEqual(res, 5)
+            else:
+                self.assertEqual(res, 100)
+
+
+
+class SizeFunctionCollectorBaseShape(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast = self.tdir / 'rast.tif'
+
+        rast_xy = np.mgrid[-1:1:0.01, -0.7:0.7:0.01]
+        rast_z = np.ma.masked_array(
+            rast_xy[0] * 100 + rast_xy[1] * 30, mask=False)
+        ocsmesh.utils.raster_from_numpy(self.rast, rast_z, rast_xy, 4326)
+
+        self.shape = geometry.Polygon(
+            [(-0.6, -0.5), (0.5, -0.4), (0.3, 0.5), (-0.4, 0.3)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_lazy_clip_of_inputs(self):
+        for in_item in [str(self.rast), ocsmesh.Raster(self.rast)]:
+            hfun_coll = ocsmesh.Hfun(
+                [in_item], hmin=500, hmax=10000, base_shape=self.shape)
+            hfun_rast = hfun_coll._hfun_list[0]
+
+            # Clipped without writing a new input raster
+            self.assertEqual(hfun_rast.raster.tmpfile, self.rast)
+            clipped = ocsmesh.Raster(self.rast)
+            clipped.clip(self.shape)
+            self.assertTrue(
+                hfun_rast.get_bbox().equals(clipped.get_bbox()))
+
+        hfun_coll = ocsmesh.Hfun(
+            [str(self.rast)], hmin=500, hmax=10000,
+            base_shape=geometry.box(2, 2, 3, 3))
+        self.assertEqual(len(hfun_coll._hfun_list), 0)
+
+    def test_big_raster_same_as_clip(self):
+        clipped = ocsmesh.Raster(self.rast)
+        clipped.clip(self.shape)
+
+        tile_values = []
+        for in_item, base_shape in [
+                (clipped, None), (str(self.rast), self.shape)]:
+            hfun_coll = ocsmesh.Hfun(
+                [in_item], hmin=500, hmax=10000, method='fast',
+                base_shape=base_shape)
+            hfun_coll.add_constant_value(value=1000, lower_bound=-10)
+            out_dir = self.tdir / f'big_{len(tile_values)}'
+            out_dir.mkdir()
+            tile_list = hfun_coll._create_big_rasters(out_dir)
+            tile_values.append(np.concatenate(
+                [tile.get_values().ravel() for tile, _ in tile_list]))
+
+        self.assertTrue(np.array_equal(*tile_values))
+
+
+
+class SizeFunctionCollectorProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast1 = self.tdir / 'rast_1.tif'
+        self.rast2 = self.tdir / 'rast_2.tif'
+        self.mesh1 = self.tdir / 'mesh_1.gr3'
+        topo_2rast_1mesh(self.rast1, self.rast2, self.mesh1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_nested_stages(self):
+        profiler = StageProfiler()
+        with profiler.stage('outer'):
+            with profiler.stage('inner', input=0):
+                pass
+            with profiler.stage('inner', input=1):
+                pass
+
+        stages = [record['stage'] for record in profiler.records]
+        self.assertEqual(stages, ['outer/inner', 'outer/inner', 'outer'])
+        self.assertEqual(profiler.records[1]['input'], 1)
+
+        report = profiler.report()
+        self.assertEqual(report['summary']['outer/inner']['count'], 2)
+        self.assertGreaterEqual(
+            report['summary']['outer']['wall_time'],
+            report['summary']['outer/inner']['wall_time'])
+
+    def test_msh_t_report(self):
+        profiler = StageProfiler()
+        hfun_coll = ocsmesh.Hfun(
+            [ocsmesh.Raster(self.rast1), ocsmesh.Raster(self.rast2)],
+            hmin=500,
+            hmax=10000,
+            nprocs=1,
+            profiler=profiler
+        )
+        hfun_coll.add_patch(
+            shape=geometry.box(-0.9, -0.6, -0.8, -0.5), target_size=700)
+        hfun_coll.msh_t()
+
+        report_path = self.tdir / 'profile.json'
+        profiler.to_json(report_path)
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+
+        summary = report['summary']
+        for stage in [
+                'msh_t',
+                'msh_t/apply_features/patch',
+                'msh_t/apply_features/constraint',
+                'msh_t/write_hfun/commit',
+                'msh_t/write_hfun/msh_t',
+                'msh_t/write_hfun/clip',
+                'msh_t/composite/assemble']:
+            self.assertIn(stage, summary)
+        self.assertEqual(summary['msh_t/write_hfun/msh_t']['count'], 2)
+        self.assertEqual(
+            {record['input'] for record in report['stages']
+             if record['stage'] == 'msh_t/write_hfun/msh_t'},
+            {0, 1})
+        for record in report['stages']:
+            self.assertGreaterEqual(record['wall_time'], 0)
+            self.assertGreaterEqual(record['cpu_time'], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
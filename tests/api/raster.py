@@ -4,6 +4,7 @@ import unittest
 from pathlib import Path
 
 import numpy as np
+from shapely.geometry import box, Polygon
 
 import ocsmesh
 from ocsmesh.utils import raster_from_numpy
@@ -56,3 +57,112 @@ class Raster(unittest.TestCase):
         rast.average_filter(size=17)
         self.assertTrue(
             np.all(rast.values[rast.values != rast.nodata] == 10))
+
+
+class RasterMultiPolygons(unittest.TestCase):
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast = self.tdir / 'rast.tif'
+
+        rast_xy = np.mgrid[-1:1:0.01, -0.7:0.7:0.01]
+        rast_z = rast_xy[0] * 100
+        raster_from_numpy(self.rast, rast_z, rast_xy, 4326)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+
+    def test_expected_polygons(self):
+        rast = ocsmesh.Raster(self.rast, chunk_size=50, overlap=2)
+        z_ranges = [(None, 0), (-50, 50), (20, None)]
+        # Polygons of the ramp, interpolated between the pixel centers
+        expected = [
+            (1.40366016, (-1, -0.7, 0.99, 0.00535686)),
+            (1.40366016, (-1, -0.3525, 0.99, 0.35285686)),
+            (1.09396543, (-1, 0.14026863, 0.99, 0.69)),
+        ]
+        mpolys = rast.get_multipolygons(z_ranges)
+        self.assertEqual(len(mpolys), len(z_ranges))
+        for mpoly, (area, bounds) in zip(mpolys, expected):
+            self.assertEqual(len(mpoly.geoms), 1)
+            self.assertAlmostEqual(mpoly.area, area)
+            for value, expected_value in zip(mpoly.bounds, bounds):
+                self.assertAlmostEqual(value, expected_value)
+
+
+    def test_bounds(self):
+        rast = ocsmesh.Raster(self.rast)
+        full, bounded = rast.get_multipolygons(
+            [(None, 0), (None, 0)], bounds=[None, (-0.5, -0.5, 0.5, 0)])
+        self.assertLess(bounded.area, full.area)
+
+        # Covers the bounds within data range
+        self.assertTrue(bounded.contains(box(-0.5, -0.5, -0.01, 0)))
+        self.assertLess(bounded.bounds[0], -0.5)
+        self.assertGreater(bounded.bounds[1], -0.7)
+
+
+class RasterLazyClip(unittest.TestCase):
+    def setUp(self):
+        self.tdir = Path(tempfile.mkdtemp())
+        self.rast = self.tdir / 'rast.tif'
+
+        rast_xy = np.mgrid[-1:1:0.01, -0.7:0.7:0.01]
+        rast_z = np.ma.masked_array(rast_xy[0] * 100, mask=False)
+        raster_from_numpy(self.rast, rast_z, rast_xy, 4326)
+
+        self.shape = Polygon(
+            [(-0.6, -0.5), (0.5, -0.4), (0.3, 0.5), (-0.4, 0.3)])
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+
+    def test_same_as_clip(self):
+        rast_1 = ocsmesh.Raster(self.rast)
+        rast_1.clip(self.shape)
+        rast_2 = ocsmesh.Raster(self.rast)
+        rast_2.clip(self.shape, lazy=True)
+
+        # No new file is written
+        self.assertEqual(rast_2.tmpfile, self.rast)
+        self.assertEqual(rast_2.shape, ocsmesh.Raster(self.rast).shape)
+
+        self.assertTrue(rast_1.get_bbox().equals(rast_2.get_bbox()))
+        window = next(rast_2.iter_windows())
+        values_1 = rast_1.get_values(masked=True)
+        values_2 = rast_2.get_values(window=window, masked=True)
+        self.assertTrue(np.array_equal(values_1.mask, values_2.mask))
+        self.assertTrue(np.array_equal(
+            values_1.compressed(), values_2.compressed()))
+        self.assertTrue(np.array_equal(
+            rast_1.get_values(), rast_2.get_values(window=window)))
+        self.assertTrue(
+            rast_1.get_multipolygon(zmax=0).equals(
+                rast_2.get_multipolygon(zmax=0)))
+
+
+    def test_windows(self):
+        rast = ocsmesh.Raster(self.rast, chunk_size=20)
+        n_all = len(list(rast.iter_windows()))
+        rast.clip(self.shape, lazy=True)
+        clip_windows = list(rast.iter_windows())
+        self.assertLess(len(clip_windows), n_all)
+        for window in clip_windows:
+            win_box = box(*rast.get_window_bounds(window))
+            self.assertTrue(win_box.intersects(self.shape))
+
+            # The same points are masked in all windows
+            values = rast.get_values(window=window, masked=True)
+            self.assertTrue(np.array_equal(
+                values.mask,
+                rast._clip_plan.get_outside_mask(window)))
+
+
+    def test_no_overlap(self):
+        rast = ocsmesh.Raster(self.rast)
+        with self.assertRaises(ValueError):
+            rast.clip(box(2, 2, 3, 3), lazy=True)
+
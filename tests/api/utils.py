@@ -1,4 +1,5 @@
 #! python
+import os
 import re
 import tempfile
 import unittest
@@ -16,7 +17,7 @@ from shapely.geometry import (
     MultiPolygon,
     GeometryCollection,
 )
-from shapely.ops import polygonize
+from shapely.ops import polygonize, unary_union
 
 from ocsmesh import Raster, utils
 
@@ -853,6 +854,44 @@ class ShapeToMeshT(unittest.TestCase):
         )
 
 
+    def test_exact_pslg(self):
+        # Hole in the first member and members touching at a corner
+        shape = MultiPolygon([
+            Polygon(
+                [(0, 0), (2, 0), (2, 2), (0, 2)],
+                [[(0.5, 0.5), (0.5, 1), (1, 1), (1, 0.5)]]),
+            Polygon([(2, 2), (3, 2), (3, 3), (2, 3)]),
+        ])
+        member_1_coords = [
+            [0, 0], [2, 0], [2, 2], [0, 2],
+            [0.5, 0.5], [0.5, 1], [1, 1], [1, 0.5]]
+
+        msht = utils.shape_to_msh_t(shape)
+        self.assertTrue(np.array_equal(
+            msht.vert2['coord'],
+            member_1_coords + [[2, 2], [3, 2], [3, 3], [2, 3]]))
+        self.assertTrue(np.array_equal(
+            msht.edge2['index'],
+            [[0, 1], [1, 2], [2, 3], [3, 0],
+             [4, 5], [5, 6], [6, 7], [7, 4],
+             [8, 9], [9, 10], [10, 11], [11, 8]]))
+
+        # Touching vertex is shared
+        msht = utils.shape_to_msh_t_2(shape)
+        self.assertTrue(np.array_equal(
+            msht.vert2['coord'],
+            member_1_coords + [[3, 2], [3, 3], [2, 3]]))
+        self.assertTrue(np.array_equal(
+            msht.edge2['index'],
+            [[0, 3], [0, 1], [1, 2], [2, 3],
+             [4, 7], [4, 5], [5, 6], [6, 7],
+             [2, 10], [2, 8], [8, 9], [9, 10]]))
+
+        for fn in [utils.shape_to_msh_t, utils.shape_to_msh_t_2]:
+            msht = fn(shape)
+            self.assertEqual(msht.vert2.dtype, jigsaw_msh_t.VERT2_t)
+            self.assertEqual(msht.edge2.dtype, jigsaw_msh_t.EDGE2_t)
+
     def test_old_implementation(self):
         msht_1 = utils.shape_to_msh_t(self.valid_input_1)
         msht_2 = utils.shape_to_msh_t(self.valid_input_4)
@@ -1116,5 +1155,280 @@ class GetMeshPolygon(unittest.TestCase):
         self.assertIsInstance(mesh_poly_1, MultiPolygon)
         self.assertIsInstance(mesh_poly_2, MultiPolygon)
 
+
+class MeshTNpyRoundTrip(unittest.TestCase):
+
+    def setUp(self):
+        self.in_msht = utils.msht_from_numpy(
+            coordinates=[[0, 0], [1, 0], [1, 1], [0, 1], [2, 0], [2, 1]],
+            triangles=[[0, 1, 2], [0, 2, 3]],
+            quadrilaterals=[[1, 4, 5, 2]],
+            values=np.arange(6, dtype=float).reshape(-1, 1),
+            crs=CRS.from_epsg(32619),
+        )
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            utils.msh_t_to_npy(self.in_msht, tmpdir)
+            out_msht = utils.npy_to_msh_t(tmpdir)
+
+        self.assertIsInstance(out_msht, jigsaw_msh_t)
+        self.assertTrue(np.array_equal(
+            out_msht.vert2['coord'], self.in_msht.vert2['coord']))
+        self.assertTrue(np.array_equal(
+            out_msht.tria3['index'], self.in_msht.tria3['index']))
+        self.assertTrue(np.array_equal(
+            out_msht.quad4['index'], self.in_msht.quad4['index']))
+        self.assertTrue(np.array_equal(out_msht.value, self.in_msht.value))
+        self.assertEqual(out_msht.crs, self.in_msht.crs)
+
+    def test_memory_mapped_arrays(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            utils.msh_t_to_npy(self.in_msht, tmpdir)
+            arrays = utils.load_npy_arrays(tmpdir, mmap_mode='r')
+
+            self.assertIsInstance(arrays['coord'], np.memmap)
+            self.assertEqual(arrays['tria3'].shape, (2, 3))
+            self.assertEqual(arrays['crs'], CRS.from_epsg(32619))
+            del arrays
+
+
+class AssembleMeshT(unittest.TestCase):
+
+    def test_local_index(self):
+        msht = utils.assemble_msh_t(
+            [np.array([[0, 0], [1, 0], [1, 1]]),
+             np.array([[2, 0], [3, 0], [3, 1], [2, 1]])],
+            {'tria3': [np.array([[0, 1, 2]]), np.empty((0,))],
+             'quad4': [np.empty((0, 4)), np.array([[0, 1, 2, 3]])]},
+            [np.array([1, 2, 3]), np.array([[4], [5], [6], [7]])],
+            crs=CRS.from_epsg(32619))
+
+        self.assertIsInstance(msht, jigsaw_msh_t)
+        self.assertEqual(msht.vert2.dtype, jigsaw_msh_t.VERT2_t)
+        self.assertEqual(msht.vert2['coord'].tolist()[3], [2, 0])
+        self.assertTrue(np.all(msht.vert2['IDtag'] == 0))
+        self.assertEqual(msht.tria3['index'].tolist(), [[0, 1, 2]])
+        self.assertEqual(msht.quad4['index'].tolist(), [[3, 4, 5, 6]])
+        self.assertEqual(msht.value.shape, (7, 1))
+        self.assertEqual(msht.value.ravel().tolist(), list(range(1, 8)))
+        self.assertEqual(msht.crs, CRS.from_epsg(32619))
+
+    def test_global_index(self):
+        msht = utils.assemble_msh_t(
+            [np.array([[0, 0], [1, 0]]), np.array([[1, 1]])],
+            {'tria3': [np.array([[0, 1, 2]]), np.array([[2, 1, 0]])]},
+            local_index=False)
+
+        self.assertEqual(
+            msht.tria3['index'].tolist(), [[0, 1, 2], [2, 1, 0]])
+        self.assertEqual(len(msht.value), 0)
+
+
+class CutMeshByBox(unittest.TestCase):
+
+    def setUp(self):
+        # Regular triangulation not aligned with the cut boxes
+        xy = np.stack(np.meshgrid(
+            np.linspace(0, 2, 8), np.linspace(0, 1, 5)), -1).reshape(-1, 2)
+        n_x = 8
+        cells = np.array([
+            j * n_x + i for j in range(4) for i in range(n_x - 1)])
+        triangles = np.concatenate([
+            np.column_stack([cells, cells + 1, cells + n_x + 1]),
+            np.column_stack([cells, cells + n_x + 1, cells + n_x])])
+        self.msht = utils.msht_from_numpy(
+            xy,
+            triangles=triangles,
+            values=(xy[:, 0] + 2 * xy[:, 1]).reshape(-1, 1),
+            crs=CRS.from_epsg(32619))
+
+    @staticmethod
+    def _get_trias(msht):
+        return [
+            Polygon(msht.vert2['coord'][idx])
+            for idx in msht.tria3['index']]
+
+    def test_adjacent_boxes(self):
+        boxes = [(-1, -1, 1.3, 0.55), (1.3, -1, 3, 0.55), (-1, 0.55, 3, 2)]
+        trias = []
+        for bounds in boxes:
+            msht = utils.cut_mesh_by_box(self.msht, bounds)
+            box_trias = self._get_trias(msht)
+            self.assertAlmostEqual(
+                sum(tria.area for tria in box_trias),
+                box(*bounds).intersection(box(0, 0, 2, 1)).area)
+            # Interpolated values of the linear function are exact
+            xy = msht.vert2['coord']
+            self.assertTrue(np.allclose(
+                msht.value.ravel(), xy[:, 0] + 2 * xy[:, 1]))
+            self.assertEqual(msht.crs, CRS.from_epsg(32619))
+            trias.extend(box_trias)
+
+        # No overlaps and no gaps
+        self.assertAlmostEqual(sum(tria.area for tria in trias), 2)
+        self.assertAlmostEqual(unary_union(trias).area, 2)
+
+    def test_orientation_and_used_vertices(self):
+        msht = utils.cut_mesh_by_box(self.msht, (0.5, 0.1, 1.3, 0.9))
+
+        coord = msht.vert2['coord']
+        tria = msht.tria3['index']
+        v_1 = coord[tria[:, 1]] - coord[tria[:, 0]]
+        v_2 = coord[tria[:, 2]] - coord[tria[:, 0]]
+        self.assertTrue(np.all(
+            v_1[:, 0] * v_2[:, 1] - v_1[:, 1] * v_2[:, 0] > 0))
+        self.assertEqual(len(np.unique(tria)), len(coord))
+
+
+class PartitionedUnaryUnion(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        xy = rng.uniform(0, 10, (200, 2))
+        self.polys = [
+            Point(x, y).buffer(0.6, resolution=4) for x, y in xy]
+
+    def test_matches_unary_union(self):
+        ref_union = unary_union(self.polys)
+        for nprocs in [1, 2]:
+            union = utils.partitioned_unary_union(
+                [self.polys[:50], gpd.GeoSeries(self.polys[50:])],
+                nprocs=nprocs,
+                bucket_size=10)
+            self.assertTrue(union.is_valid)
+            self.assertAlmostEqual(
+                union.symmetric_difference(ref_union).area, 0)
+
+    def test_empty_input(self):
+        union = utils.partitioned_unary_union([[], []])
+        self.assertTrue(union.is_empty)
+
+
+class RepairMultiPolygon(unittest.TestCase):
+
+    def test_valid_input(self):
+        # Touching at a point is valid
+        mpoly = MultiPolygon([box(0, 0, 1, 1), box(1, 1, 2, 2)])
+        for nprocs in [1, 2]:
+            fixed, n_fixed = utils.repair_multipolygon(mpoly, nprocs)
+            self.assertEqual(n_fixed, 0)
+            self.assertEqual(len(fixed.geoms), 2)
+            self.assertTrue(fixed.equals(mpoly))
+
+    def test_repair_invalid_members(self):
+        bowtie = Polygon([(10, 0), (12, 2), (12, 0), (10, 2)])
+        mpoly = MultiPolygon([
+            box(0, 0, 2, 2), box(1, 0, 3, 2),   # Overlapping
+            box(4, 0, 5, 1), box(5, 0, 6, 1),   # Sharing a side
+            box(7, 0, 8, 1),
+            bowtie,
+        ])
+        self.assertFalse(mpoly.is_valid)
+        for nprocs in [1, 2]:
+            fixed, n_fixed = utils.repair_multipolygon(mpoly, nprocs)
+            self.assertIsInstance(fixed, MultiPolygon)
+            self.assertTrue(fixed.is_valid)
+            self.assertEqual(n_fixed, 5)
+            self.assertEqual(len(fixed.geoms), 5)
+            self.assertAlmostEqual(fixed.area, 6 + 2 + 1 + 2)
+
+
+class SimplifyBySize(unittest.TestCase):
+
+    def setUp(self):
+        # Size is 1 on the left and 100 on the right
+        x, y = np.meshgrid(np.arange(-100, 201, 10), np.arange(-50, 51, 10))
+        self.hfun = utils.msht_from_numpy(
+            np.column_stack([x.ravel(), y.ravel()]),
+            values=np.where(x.ravel() < 50, 1., 100.).reshape(-1, 1),
+            crs=None)
+
+    def test_local_tolerance(self):
+        fine = Point(-50, 0).buffer(20, resolution=64)
+        coarse = Point(150, 0).buffer(20, resolution=64)
+        mpoly = MultiPolygon([fine, coarse])
+        for nprocs in [1, 2]:
+            simple, stats = utils.simplify_by_size(
+                mpoly, self.hfun, 0.25, nprocs=nprocs)
+            self.assertTrue(simple.is_valid)
+            self.assertEqual(len(simple.geoms), 2)
+            self.assertEqual(stats['vertices_before'], 2 * 256)
+            self.assertLess(stats['vertices_after'], 64)
+
+            # Boundary moves at most by the local tolerance
+            n_coords = {}
+            for poly in simple.geoms:
+                orig = fine if poly.intersects(fine) else coarse
+                tol = 0.25 if orig is fine else 25
+                self.assertLessEqual(
+                    orig.exterior.hausdorff_distance(poly.exterior), tol)
+                n_coords[orig is fine] = len(poly.exterior.coords)
+            self.assertGreater(n_coords[True], 2 * n_coords[False])
+
+    def test_hole_crossing_fallback(self):
+        poly = Polygon(
+            [(0, 0), (10, 0), (10, 10), (5, 11), (0, 10)],
+            [[(4.5, 10.2), (5.5, 10.2), (5, 10.6)]])
+        hfun = utils.msht_from_numpy(
+            [[0, 0]], values=[6], crs=None)
+        simple, stats = utils.simplify_by_size(poly, hfun, 0.25)
+        self.assertTrue(simple.is_valid)
+        self.assertEqual(stats['polygons_fallback'], 1)
+        self.assertTrue(simple.equals(MultiPolygon([poly])))
+
+
+class PolygonsParquetRoundTrip(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        xy = rng.uniform(0, 100, (1000, 2))
+        self.polys = [
+            Point(x, y).buffer(0.5, resolution=2) for x, y in xy]
+        self.tdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tdir.name, 'polys.parquet')
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+    def test_round_trip(self):
+        utils.write_polygons_parquet(
+            self.path, MultiPolygon(self.polys), crs='EPSG:4326',
+            row_group_size=100)
+
+        gdf = utils.read_polygons_parquet(self.path)
+        self.assertEqual(gdf.crs, CRS.from_epsg(4326))
+        self.assertEqual(len(gdf), len(self.polys))
+        self.assertAlmostEqual(
+            gdf.union_all().symmetric_difference(
+                unary_union(self.polys)).area, 0)
+
+        # Readable as a GeoParquet file by others
+        gdf = gpd.read_parquet(self.path)
+        self.assertEqual(gdf.crs, CRS.from_epsg(4326))
+        self.assertEqual(len(gdf), len(self.polys))
+
+    def test_read_by_bbox(self):
+        utils.write_polygons_parquet(
+            self.path, self.polys, row_group_size=100)
+
+        bbox = (10, 20, 30, 40)
+        # Polygons are selected by their bounds
+        ref_polys = [
+            poly for poly in self.polys if poly.envelope.intersects(box(*bbox))]
+        gdf = utils.read_polygons_parquet(self.path, bbox=bbox)
+        self.assertEqual(gdf.crs, None)
+        self.assertEqual(len(gdf), len(ref_polys))
+        self.assertTrue(gdf.envelope.intersects(box(*bbox)).all())
+
+        gdf = utils.read_polygons_parquet(self.path, bbox=(200, 0, 300, 1))
+        self.assertEqual(len(gdf), 0)
+
+    def test_not_geoparquet(self):
+        gpd.GeoDataFrame(geometry=self.polys).to_wkb().to_parquet(self.path)
+        with self.assertRaises(ValueError):
+            utils.read_polygons_parquet(self.path)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,53 @@
+#! python
+"""Benchmark of the vertex-edge representation of large polygons.
+
+Times `utils.shape_to_msh_t` and `utils.shape_to_msh_t_2` on a
+coastline-like polygon with a hole, e.g.
+
+    python tests/benchmarks/shape_to_msh_t.py --n-verts 100000
+
+By default a 10 million vertex coastline is used.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from shapely.geometry import Point, Polygon
+
+from ocsmesh import utils
+
+
+def get_coastline_polygon(n_verts: int) -> Polygon:
+    """Random walk radius polygon around a circular hole"""
+
+    rng = np.random.default_rng(0)
+    theta = np.linspace(0, 2 * np.pi, n_verts, endpoint=False)
+    radius = 100 + np.cumsum(rng.normal(0, 0.01, n_verts))
+    radius -= np.linspace(0, radius[-1] - radius[0], n_verts)
+    hole = Point(0, 0).buffer(10, quad_segs=16)
+    return Polygon(
+        np.column_stack([radius * np.cos(theta), radius * np.sin(theta)]),
+        [hole.exterior.coords[::-1]]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--n-verts', type=int, default=10_000_000)
+    parser.add_argument(
+        '--functions', nargs='+',
+        default=['shape_to_msh_t', 'shape_to_msh_t_2'])
+    args = parser.parse_args()
+
+    shape = get_coastline_polygon(args.n_verts)
+    for name in args.functions:
+        start = time.perf_counter()
+        msht = getattr(utils, name)(shape)
+        elapsed = time.perf_counter() - start
+        print(f'{name}: {len(msht.vert2)} vertices,'
+              f' {len(msht.edge2)} edges in {elapsed:.1f} s')
+
+
+if __name__ == '__main__':
+    main()